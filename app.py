@@ -1,10 +1,19 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import inspect, text, event
+from sqlalchemy.orm import load_only, object_session, validates, joinedload
 from datetime import datetime, timedelta
 import os
+import time
 import hashlib
 import secrets
+from src.utils.revisions import (
+    append_revision, load_revision_content, diff_revisions, inline_changes
+)
+from src.utils.minhash import features, band_keys, jaccard, DUPLICATE_THRESHOLD
+from src.utils.pagination import encode_cursor, decode_cursor
+from src.utils.lru import LRUCache
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'fintentacle-secret-key-2025')
@@ -14,6 +23,46 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 CORS(app, origins="*")
 
+EXCERPT_LENGTH = 120
+# 公開筆記時間軸前幾頁的快取（已序列化的回應內容），公開筆記異動時清空
+# 多個行程各自快取，TTL 作為其他行程寫入時的保底
+TIMELINE_CACHE_TTL = 30
+TIMELINE_MAX_PER_PAGE = 50
+timeline_cache = LRUCache(128)
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """產生列表預覽用的摘要（合併空白並截斷）"""
+    if not content:
+        return ''
+    text_value = ' '.join(content.split())
+    return text_value if len(text_value) <= length else text_value[:length].rstrip() + '…'
+
+def parse_fields(model):
+    """解析 fields= 參數，未提供時返回 None（輸出全部欄位）"""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = fields - set(model.FIELD_COLUMNS)
+    if unknown:
+        raise ValueError(f"無效的欄位: {', '.join(sorted(unknown))}")
+    return fields
+
+def load_fields(model, fields):
+    """SQL 只選取請求欄位需要的資料欄"""
+    if fields is None:
+        return []
+    columns = {'id'}
+    for name in fields:
+        columns.update(model.FIELD_COLUMNS[name])
+    return [load_only(*(getattr(model, column) for column in sorted(columns)))]
+
+def parse_tags(value):
+    """逗號分隔的標籤字串轉為去重後的列表"""
+    if not value:
+        return []
+    return list(dict.fromkeys(tag.strip() for tag in value.split(',') if tag.strip()))
+
 # 數據模型
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,43 +72,171 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.relationship('Note', backref='author', lazy=True, cascade='all, delete-orphan')
+
+    # fields= 可選的輸出欄位及其需要載入的資料庫欄位
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'username': ('username',),
+        'email': ('email',),
+        'is_admin': ('is_admin',),
+        'created_at': ('created_at',),
+        'notes_count': (),
+    }
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'is_admin': self.is_admin,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'notes_count': len(self.notes)
+    def to_dict(self, fields=None):
+        data = {
+            'id': lambda: self.id,
+            'username': lambda: self.username,
+            'email': lambda: self.email,
+            'is_admin': lambda: self.is_admin,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'notes_count': lambda: len(self.notes)
         }
+        return {key: value() for key, value in data.items() if fields is None or key in fields}
 
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    excerpt = db.Column(db.String(150), nullable=True)
     stock_symbol = db.Column(db.String(10), nullable=True)
     tags = db.Column(db.String(500), nullable=True)
     is_public = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    revisions = db.relationship('NoteRevision', backref='note', lazy='dynamic', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # 公開時間軸與依股票代碼過濾都沿索引倒序讀取
+        db.Index('ix_note_public_created', 'is_public', 'created_at', 'id'),
+        db.Index('ix_note_public_symbol_created', 'is_public', 'stock_symbol', 'created_at', 'id'),
+    )
+
+    # fields= 可選的輸出欄位及其需要載入的資料庫欄位
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'title': ('title',),
+        'content': ('content',),
+        'excerpt': ('excerpt',),
+        'stock_symbol': ('stock_symbol',),
+        'tags': ('tags',),
+        'is_public': ('is_public',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+        'author': ('user_id',),
+    }
+
+    @validates('content')
+    def _sync_excerpt(self, key, value):
+        self.excerpt = make_excerpt(value)
+        return value
+
+    @validates('stock_symbol')
+    def _normalize_symbol(self, key, value):
+        return value.strip().upper() or None if value else None
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'content': self.content,
-            'stock_symbol': self.stock_symbol,
-            'tags': self.tags.split(',') if self.tags else [],
-            'is_public': self.is_public,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'author': {
+    def to_dict(self, fields=None):
+        data = {
+            'id': lambda: self.id,
+            'title': lambda: self.title,
+            'content': lambda: self.content,
+            'excerpt': lambda: self.excerpt,
+            'stock_symbol': lambda: self.stock_symbol,
+            'tags': lambda: parse_tags(self.tags),
+            'is_public': lambda: self.is_public,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None,
+            'author': lambda: {
                 'id': self.author.id,
                 'username': self.author.username
             } if self.author else None
         }
+        return {key: value() for key, value in data.items() if fields is None or key in fields}
+
+# 標籤反向索引：(tag, created_at, note_id) 讓依標籤的時間軸也能沿索引倒序讀取
+note_tag_index = db.Table('note_tag_index',
+    db.Column('note_id', db.Integer, db.ForeignKey('note.id'), primary_key=True),
+    db.Column('tag', db.String(50), primary_key=True),
+    db.Column('created_at', db.DateTime),
+    db.Index('ix_note_tag_index_tag_created', 'tag', 'created_at', 'note_id')
+)
+
+def _index_rows(note):
+    return [{'note_id': note.id, 'tag': tag.lower()[:50], 'created_at': note.created_at}
+            for tag in parse_tags(note.tags)]
+
+def _invalidate_timeline(note):
+    """標記時間軸快取在提交後清除；提交前清除的話，並行的請求可能又快取到提交前的資料"""
+    object_session(note).info['timeline_stale'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _clear_timeline_cache(session):
+    if session.info.pop('timeline_stale', False):
+        timeline_cache.clear()
+
+@event.listens_for(db.session, 'after_rollback')
+def _keep_timeline_cache(session):
+    session.info.pop('timeline_stale', None)
+
+@event.listens_for(Note, 'after_insert')
+def _note_inserted(mapper, connection, note):
+    rows = _index_rows(note)
+    if rows:
+        connection.execute(note_tag_index.insert().prefix_with('OR IGNORE'), rows)
+    if note.is_public:
+        _invalidate_timeline(note)
+
+@event.listens_for(Note, 'after_update')
+def _note_updated(mapper, connection, note):
+    state = inspect(note)
+    if state.attrs.tags.history.has_changes():
+        connection.execute(note_tag_index.delete().where(note_tag_index.c.note_id == note.id))
+        rows = _index_rows(note)
+        if rows:
+            connection.execute(note_tag_index.insert().prefix_with('OR IGNORE'), rows)
+    # 由公開改為私人也需要清除；未載入 is_public 時保守起見一律清除
+    if state.dict.get('is_public', True) or state.attrs.is_public.history.has_changes():
+        _invalidate_timeline(note)
+
+@event.listens_for(Note, 'before_delete')
+def _note_deleting(mapper, connection, note):
+    # 索引列參照 note.id，須在筆記刪除前移除
+    connection.execute(note_tag_index.delete().where(note_tag_index.c.note_id == note.id))
+    if note.is_public:
+        _invalidate_timeline(note)
+
+class NoteRevision(db.Model):
+    """筆記版本歷史：定期完整快照加上壓縮的文字差異"""
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    content_length = db.Column(db.Integer, default=0)
+    stored_size = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('note_id', 'revision'),)
+
+    def to_dict(self):
+        return {
+            'note_id': self.note_id,
+            'revision': self.revision,
+            'title': self.title,
+            'is_snapshot': self.is_snapshot,
+            'content_length': self.content_length,
+            'stored_size': self.stored_size,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# 新聞的 MinHash LSH 分段鍵，以索引查詢內容相近的候選新聞
+news_cache_bands = db.Table('news_cache_bands',
+    db.Column('news_id', db.Integer, db.ForeignKey('news_cache.id'), primary_key=True),
+    db.Column('band', db.BigInteger, primary_key=True),
+    db.Index('ix_news_cache_bands_band', 'band', 'news_id')
+)
 
 class NewsCache(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -69,17 +246,43 @@ class NewsCache(db.Model):
     source = db.Column(db.String(100), nullable=True)
     published_at = db.Column(db.DateTime, nullable=True)
     cached_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 同一事件的其他來源指向代表新聞，代表新聞為 NULL
+    canonical_id = db.Column(db.Integer, db.ForeignKey('news_cache.id'), index=True)
     
-    def to_dict(self):
+    def to_dict(self, alternates=()):
         return {
             'id': self.id,
             'title': self.title,
             'description': self.description,
             'url': self.url,
             'source': self.source,
-            'published_at': self.published_at.isoformat() if self.published_at else None
+            'published_at': self.published_at.isoformat() if self.published_at else None,
+            'alternates': [{'title': news.title, 'url': news.url, 'source': news.source}
+                           for news in alternates]
         }
 
+def add_news(news_data):
+    """加入一則新聞；與既有新聞內容相近時歸入其群組"""
+    tokens = features(news_data['title']) | features(news_data.get('description'))
+    keys = sorted(set(band_keys(tokens)))
+    news = NewsCache(**news_data)
+    if keys:
+        # 只有共用 LSH 分段的新聞才需要計算相似度
+        candidate_ids = [row[0] for row in db.session.execute(
+            db.select(news_cache_bands.c.news_id).where(news_cache_bands.c.band.in_(keys)).distinct()
+        )]
+        best_score = DUPLICATE_THRESHOLD
+        for candidate in NewsCache.query.filter(NewsCache.id.in_(candidate_ids)).all() if candidate_ids else []:
+            score = jaccard(tokens, features(candidate.title) | features(candidate.description))
+            if score >= best_score:
+                best_score = score
+                news.canonical_id = candidate.canonical_id or candidate.id
+    db.session.add(news)
+    db.session.flush()
+    if keys:
+        db.session.execute(news_cache_bands.insert(), [{'news_id': news.id, 'band': key} for key in keys])
+    return news
+
 # API路由
 @app.route('/')
 def index():
@@ -104,9 +307,14 @@ def health_check():
 @app.route('/api/users', methods=['GET'])
 def get_users():
     try:
-        users = User.query.all()
+        try:
+            fields = parse_fields(User)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        users = User.query.options(*load_fields(User, fields)).all()
         return jsonify({
-            'users': [user.to_dict() for user in users],
+            'users': [user.to_dict(fields) for user in users],
             'total': len(users)
         })
     except Exception as e:
@@ -166,22 +374,24 @@ def login():
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
     try:
+        user_id = request.args.get('user_id', type=int)
+        try:
+            fields = parse_fields(Note)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not user_id:
+            return public_timeline(fields)
+
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
-        user_id = request.args.get('user_id', type=int)
-        
-        query = Note.query
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        else:
-            query = query.filter_by(is_public=True)
-        
+        query = Note.query.options(*load_fields(Note, fields)).filter_by(user_id=user_id)
         query = query.order_by(Note.created_at.desc())
         pagination = query.paginate(page=page, per_page=per_page, error_out=False)
         notes = pagination.items
         
         return jsonify({
-            'notes': [note.to_dict() for note in notes],
+            'notes': [note.to_dict(fields) for note in notes],
             'total': pagination.total,
             'pages': pagination.pages,
             'current_page': page
@@ -190,6 +400,78 @@ def get_notes():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def public_timeline(fields):
+    """公開筆記時間軸：第一頁快取為序列化後的內容，之後的頁面以游標沿索引讀取
+
+    可依標籤（tag）或股票代碼（symbol）過濾；仍支援舊的 page 參數。
+    """
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), TIMELINE_MAX_PER_PAGE)
+    page = request.args.get('page', 1, type=int)
+    tag = request.args.get('tag', '').strip().lower()[:50] or None
+    symbol = request.args.get('symbol', '').strip().upper() or None
+    try:
+        position = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    first_page = position is None and page <= 1
+    cache_key = (tag, symbol, per_page, tuple(sorted(fields)) if fields else None)
+    if first_page:
+        cached = timeline_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            response = app.response_class(cached[1], mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+    options = load_fields(Note, fields)
+    if fields is None or 'author' in fields:
+        # 作者一併以 JOIN 載入，避免逐筆查詢
+        options.append(joinedload(Note.author).load_only(User.id, User.username))
+    query = Note.query.options(*options).filter(Note.is_public.is_(True))
+    if tag:
+        # 沿標籤索引 (tag, created_at, note_id) 倒序讀取
+        query = query.join(note_tag_index, note_tag_index.c.note_id == Note.id)\
+                     .filter(note_tag_index.c.tag == tag)
+        created_column, id_column = note_tag_index.c.created_at, note_tag_index.c.note_id
+    else:
+        created_column, id_column = Note.created_at, Note.id
+    if symbol:
+        query = query.filter(Note.stock_symbol == symbol)
+
+    if position:
+        created_at = datetime.fromisoformat(position[0])
+        query = query.filter(
+            (created_column < created_at) | ((created_column == created_at) & (id_column < position[1]))
+        )
+    query = query.order_by(created_column.desc(), id_column.desc())
+
+    payload = {}
+    if position is None and page > 1:
+        # 舊版頁碼分頁（OFFSET），不快取
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        notes = pagination.items
+        payload.update(total=pagination.total, pages=pagination.pages, current_page=page)
+        has_more = page < pagination.pages
+    else:
+        notes = query.limit(per_page + 1).all()
+        has_more = len(notes) > per_page
+        notes = notes[:per_page]
+        if first_page:
+            # 總數只在建立快取時計算一次
+            total = query.order_by(None).count()
+            payload.update(total=total, pages=-(-total // per_page), current_page=1)
+
+    payload['notes'] = [note.to_dict(fields) for note in notes]
+    payload['next_cursor'] = encode_cursor([notes[-1].created_at.isoformat(), notes[-1].id]) \
+        if has_more and notes else None
+
+    body = app.json.dumps(payload).encode('utf-8')
+    if first_page:
+        timeline_cache.put(cache_key, (time.monotonic() + TIMELINE_CACHE_TTL, body))
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
 @app.route('/api/notes', methods=['POST'])
 def create_note():
     try:
@@ -215,6 +497,8 @@ def create_note():
         )
         
         db.session.add(note)
+        db.session.flush()
+        append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         db.session.commit()
         
         return jsonify({
@@ -231,6 +515,10 @@ def update_note(note_id):
     try:
         note = Note.query.get_or_404(note_id)
         data = request.get_json()
+
+        # 沒有版本歷史的舊筆記，先保存修改前的內容作為第一個版本
+        if note.revisions.first() is None:
+            append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         
         if 'title' in data:
             note.title = data['title']
@@ -240,6 +528,9 @@ def update_note(note_id):
             note.stock_symbol = data['stock_symbol']
         if 'tags' in data:
             note.tags = ','.join(data['tags']) if data['tags'] else None
+
+        if 'title' in data or 'content' in data:
+            append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         
         note.updated_at = datetime.utcnow()
         db.session.commit()
@@ -264,6 +555,66 @@ def delete_note(note_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/notes/<int:note_id>/revisions', methods=['GET'])
+def get_note_revisions(note_id):
+    try:
+        if not Note.query.get(note_id):
+            return jsonify({'error': '筆記不存在'}), 404
+        revisions = NoteRevision.query.filter_by(note_id=note_id)\
+                                      .options(db.defer(NoteRevision.data))\
+                                      .order_by(NoteRevision.revision.desc()).all()
+        return jsonify({
+            'note_id': note_id,
+            'revisions': [revision.to_dict() for revision in revisions],
+            'total': len(revisions)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/notes/<int:note_id>/revisions/<int:revision>', methods=['GET'])
+def get_note_revision(note_id, revision):
+    try:
+        row = NoteRevision.query.filter_by(note_id=note_id, revision=revision)\
+                                .options(db.defer(NoteRevision.data)).first()
+        content = load_revision_content(NoteRevision, note_id, revision) if row else None
+        if content is None:
+            return jsonify({'error': '版本不存在'}), 404
+
+        result = row.to_dict()
+        result['content'] = content
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/notes/<int:note_id>/revisions/diff', methods=['GET'])
+def diff_note_revisions(note_id):
+    try:
+        from_revision = request.args.get('from', type=int)
+        to_revision = request.args.get('to', type=int)
+        if not from_revision or not to_revision:
+            return jsonify({'error': '需要提供 from 和 to 版本號'}), 400
+
+        rows = {row.revision: row for row in NoteRevision.query.filter(
+            NoteRevision.note_id == note_id,
+            NoteRevision.revision.in_([from_revision, to_revision])
+        ).options(db.defer(NoteRevision.data)).all()}
+        if from_revision not in rows or to_revision not in rows:
+            return jsonify({'error': '版本不存在'}), 404
+
+        old_content = load_revision_content(NoteRevision, note_id, from_revision)
+        new_content = load_revision_content(NoteRevision, note_id, to_revision)
+        return jsonify({
+            'note_id': note_id,
+            'from': rows[from_revision].to_dict(),
+            'to': rows[to_revision].to_dict(),
+            'title_changed': rows[from_revision].title != rows[to_revision].title,
+            'diff': diff_revisions(old_content, new_content,
+                                   f'revision {from_revision}', f'revision {to_revision}'),
+            'changes': inline_changes(old_content, new_content)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 新聞API
 @app.route('/api/news', methods=['GET'])
 def get_news():
@@ -289,6 +640,13 @@ def get_news():
                     'source': 'Reuters',
                     'published_at': datetime.utcnow() - timedelta(hours=4)
                 },
+                {
+                    'title': '台積電擴大在美投資 將新建3奈米廠',
+                    'description': '台積電將於美國亞利桑那州新建3奈米製程工廠，投資金額預計達400億美元。',
+                    'url': 'https://example.com/tsmc-arizona-3nm',
+                    'source': '經濟日報',
+                    'published_at': datetime.utcnow() - timedelta(hours=5)
+                },
                 {
                     'title': '聯準會暗示可能暫停升息，市場反應積極',
                     'description': '聯邦準備理事會官員在最新講話中暗示可能暫停升息步伐，股市應聲上漲。',
@@ -299,20 +657,23 @@ def get_news():
             ]
             
             # 清除舊緩存
+            db.session.execute(news_cache_bands.delete())
             NewsCache.query.delete()
             
-            # 添加新緩存
-            fresh_news = []
-            for news_data in sample_news:
-                news = NewsCache(**news_data)
-                db.session.add(news)
-                fresh_news.append(news)
+            # 添加新緩存（內容相近的新聞合併為同一則）
+            fresh_news = [add_news(news_data) for news_data in sample_news]
             
             db.session.commit()
         
+        # 每個事件只列出代表新聞，其他來源附在 alternates
+        alternates = {}
+        for news in fresh_news:
+            if news.canonical_id:
+                alternates.setdefault(news.canonical_id, []).append(news)
+        canonical_news = [news for news in fresh_news if not news.canonical_id]
         return jsonify({
-            'news': [news.to_dict() for news in fresh_news[:10]],
-            'total': len(fresh_news)
+            'news': [news.to_dict(alternates.get(news.id, ())) for news in canonical_news[:10]],
+            'total': len(canonical_news)
         })
         
     except Exception as e:
@@ -392,9 +753,61 @@ def get_stats():
         return jsonify({'error': str(e)}), 500
 
 # 初始化數據庫
+def upgrade_db():
+    """為既有資料表補上新增欄位與索引，並回填筆記摘要與標籤索引"""
+    inspector = inspect(db.engine)
+    if 'note' in inspector.get_table_names():
+        columns = {column['name'] for column in inspector.get_columns('note')}
+        if 'excerpt' not in columns:
+            with db.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE note ADD COLUMN excerpt VARCHAR(150)'))
+    if 'news_cache' in inspector.get_table_names():
+        columns = {column['name'] for column in inspector.get_columns('news_cache')}
+        if 'canonical_id' not in columns:
+            with db.engine.begin() as conn:
+                conn.execute(text('ALTER TABLE news_cache ADD COLUMN canonical_id INTEGER REFERENCES news_cache(id)'))
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_news_cache_canonical_id ON news_cache (canonical_id)'))
+
+    with db.engine.begin() as conn:
+        for index in Note.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+        conn.execute(text('UPDATE note SET stock_symbol = UPPER(TRIM(stock_symbol)) '
+                          'WHERE stock_symbol != UPPER(TRIM(stock_symbol))'))
+
+    # 分批補上摘要；回填不算修改，保留原本的修改時間
+    table = Note.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.content)
+            .where(table.c.id > last_id, table.c.excerpt.is_(None))
+            .order_by(table.c.id)
+            .limit(500)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('row_id'))
+            .values(excerpt=db.bindparam('excerpt'), updated_at=table.c.updated_at),
+            [{'row_id': row_id, 'excerpt': make_excerpt(content)} for row_id, content in rows]
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+
+    # 建立標籤索引（舊資料）
+    if db.session.execute(db.select(note_tag_index.c.note_id).limit(1)).first() is None:
+        notes = Note.query.options(load_only(Note.id, Note.tags, Note.created_at))\
+                          .filter(Note.tags.isnot(None)).all()
+        rows = [row for note in notes for row in _index_rows(note)]
+        if rows:
+            db.session.execute(note_tag_index.insert().prefix_with('OR IGNORE'), rows)
+        db.session.commit()
+
 def init_db():
     with app.app_context():
         db.create_all()
+        upgrade_db()
         
         if not User.query.first():
             # 創建管理員用戶
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""回應壓縮等級基準測試
+
+模擬筆記列表 / 管理員用戶列表的大型 JSON 回應，比較不同 gzip 等級下的
+壓縮率、壓縮耗時，以及在不同頻寬下的總延遲（壓縮時間 + 傳輸時間）。
+
+用法：python benchmarks/compression_levels.py [筆記數量]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.compression import gzip_bytes, gzip_stream
+
+LEVELS = (1, 3, 6, 9)
+BANDWIDTHS_MBPS = (1, 10, 100)
+SYMBOLS = ('NVDA', 'TSM', '2330', 'AAPL', 'TSLA', 'MSFT')
+PHRASES = (
+    '台積電在先進製程技術方面領先全球，',
+    'AI晶片需求持續強勁，',
+    '需要密切關注其市場份額變化，',
+    '財報顯示毛利率維持高檔，',
+    'Data center revenue grew strongly this quarter. ',
+    'Valuation remains stretched relative to peers. ',
+)
+
+
+def build_payload(count, seed=42):
+    """產生與 /api/notes 相同結構的模擬資料"""
+    rng = random.Random(seed)
+    notes = []
+    for i in range(count):
+        content = ''.join(rng.choice(PHRASES) for _ in range(rng.randint(20, 80)))
+        notes.append({
+            'id': i + 1,
+            'user_id': rng.randint(1, 500),
+            'title': f'{rng.choice(SYMBOLS)} 投資分析 #{i}',
+            'content': content,
+            'stock_symbol': rng.choice(SYMBOLS),
+            'stock_name': None,
+            'created_at': '2025-08-01T12:00:00',
+            'updated_at': '2025-08-02T08:30:00',
+            'tags': [{'id': 1, 'name': '財報', 'color': '#17a2b8', 'created_at': '2025-01-01T00:00:00'}]
+        })
+    return json.dumps({'notes': notes, 'total': count}, ensure_ascii=False).encode('utf-8')
+
+
+def chunked(body, size=8192):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    body = build_payload(count)
+    raw_size = len(body)
+    print(f'原始大小: {raw_size / 1024:.1f} KiB（{count} 筆筆記）')
+
+    header = f"{'level':>5} {'size KiB':>9} {'ratio':>6} {'buffered ms':>12} {'stream ms':>10}"
+    header += ''.join(f' {f"total@{bw}Mbps ms":>17}' for bw in BANDWIDTHS_MBPS)
+    print(header)
+
+    rows = [(0, body, 0.0, 0.0)]
+    for level in LEVELS:
+        compressed, buffered = timed(lambda: gzip_bytes(body, level))
+        _, streamed = timed(lambda: b''.join(gzip_stream(chunked(body), level)))
+        rows.append((level, compressed, buffered, streamed))
+
+    for level, data, buffered, streamed in rows:
+        line = f'{level:>5} {len(data) / 1024:>9.1f} {len(data) / raw_size:>6.2f} '
+        line += f'{buffered * 1000:>12.2f} {streamed * 1000:>10.2f}'
+        for bw in BANDWIDTHS_MBPS:
+            transfer = len(data) * 8 / (bw * 1_000_000)
+            line += f' {(buffered + transfer) * 1000:>17.1f}'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
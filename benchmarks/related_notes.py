@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""相關筆記（TF-IDF）基準測試
+
+1. 以模擬筆記測量分詞與向量壓縮的速度、壓縮後大小；
+2. 依相同的詞頻分布（Zipf）直接產生大量向量，測量反向索引的建立時間、記憶體，
+   以及取前 k 筆相似筆記的查詢延遲。
+
+線上查詢只在單一用戶的筆記中進行，大量向量的數字代表最壞情況（單一帳號的筆記數）。
+
+用法：python benchmarks/related_notes.py [向量數量]
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.utils.tfidf import (HASH_BITS, MAX_TERMS, TermIndex, term_counts, pack_vector, unpack_vector)
+
+SAMPLE_NOTES = 5000
+TERMS_PER_NOTE = 40
+QUERIES = 200
+TOP_K = 10
+PHRASES = (
+    '台積電在先進製程技術方面領先全球，',
+    'AI晶片需求持續強勁，',
+    '需要密切關注其市場份額變化，',
+    '財報顯示毛利率維持高檔，',
+    '外資連續買超，成交量放大，',
+    'Data center revenue grew strongly this quarter. ',
+    'Valuation remains stretched relative to peers. ',
+)
+SYMBOLS = ('NVDA', 'TSM', '2330', 'AAPL', 'TSLA', 'MSFT')
+TAGS = ('買入', '賣出', '觀察', '財報', '技術分析', '基本面', '風險', '機會')
+
+
+def build_notes(count, seed=42):
+    rng = random.Random(seed)
+    return [(f'{rng.choice(SYMBOLS)} 投資分析 #{i}',
+             ''.join(rng.choice(PHRASES) for _ in range(rng.randint(5, 40))),
+             rng.sample(TAGS, rng.randint(0, 3)))
+            for i in range(count)]
+
+
+def synthesize(count, seed=42):
+    """產生 count 筆 (詞 id, 次數)，詞依 Zipf 分布抽樣，每筆內不重複"""
+    rng = np.random.default_rng(seed)
+    lengths = np.minimum(rng.poisson(TERMS_PER_NOTE, count) + 1, MAX_TERMS)
+    rows = np.repeat(np.arange(count, dtype=np.int64), lengths)
+    terms = (rng.zipf(1.2, len(rows)) - 1) % (1 << HASH_BITS)
+    keys = np.sort((rows << HASH_BITS) | terms)
+    keys = keys[np.append(True, keys[1:] != keys[:-1])]
+    rows, terms = keys >> HASH_BITS, (keys & ((1 << HASH_BITS) - 1)).astype(np.int32)
+    counts = np.minimum(rng.geometric(0.6, len(terms)), 50).astype(np.float32)
+    starts = np.searchsorted(rows, np.arange(1, count))
+    return list(zip(np.split(terms, starts), np.split(counts, starts)))
+
+
+def timed(func, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    notes = build_notes(SAMPLE_NOTES)
+    packed, elapsed = timed(lambda: [pack_vector(term_counts(*note)) for note in notes])
+    sizes = np.array([len(data) for data in packed])
+    print(f'分詞 + 壓縮: {SAMPLE_NOTES / elapsed:,.0f} 筆/秒，平均 {sizes.mean():.0f} bytes/筆')
+    _, elapsed = timed(lambda: [unpack_vector(data) for data in packed], repeat=3)
+    print(f'解壓縮: {SAMPLE_NOTES / elapsed:,.0f} 筆/秒')
+
+    rows, elapsed = timed(lambda: synthesize(count))
+    total_terms = sum(len(terms) for terms, _ in rows)
+    print(f'\n產生 {count:,} 筆模擬向量（平均 {total_terms / count:.1f} 個詞）: {elapsed:.1f} s')
+    sample = random.Random(1).sample(range(count), min(count, 2000))
+    stored = np.mean([len(pack_vector(dict(zip(rows[i][0].tolist(), rows[i][1].tolist())))) for i in sample])
+    print(f'估計儲存大小: {stored * count / 1024 ** 2:,.0f} MiB（平均 {stored:.0f} bytes/筆）')
+
+    index, elapsed = timed(lambda: TermIndex(range(count), rows))
+    print(f'建立反向索引: {elapsed:.1f} s，記憶體 {index.nbytes / 1024 ** 2:,.0f} MiB，'
+          f'{len(index.terms):,} 個詞、{len(index.post_rows):,} 筆清單項目')
+
+    queries = random.Random(2).sample(range(count), min(count, QUERIES))
+    latencies = []
+    for row in queries:
+        terms, counts = rows[row]
+        _, elapsed = timed(lambda: index.top(terms, counts, TOP_K, exclude=row))
+        latencies.append(elapsed * 1000)
+    latencies = np.array(latencies)
+    print(f'查詢前 {TOP_K} 筆（{len(queries)} 次）: 平均 {latencies.mean():.1f} ms，'
+          f'p50 {np.percentile(latencies, 50):.1f} ms，p95 {np.percentile(latencies, 95):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
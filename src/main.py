@@ -3,16 +3,43 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from src.models.user import db
 from src.models.note import Note, Tag
-from src.models.news import NewsBookmark
+from src.models.news import NewsBookmark, NewsArticle
+from src.models.revision import NoteRevision
+from src.models.archive import NoteArchive
+from src.models.sync import NoteTombstone
+from src.models.vector import NoteVector
+from src.models.job import Job
+from src.models.symbol import Symbol
+from src.models.feed import FeedItem
+from src.models.alert import PriceAlert, AlertNotification
 from src.models.watchlist import Watchlist, SystemStats
+from src.models.shard import ShardAssignment
+from src.models.schema import upgrade_schema
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.admin import admin_bp
 from src.routes.notes import notes_bp
+from src.routes.batch import batch_bp
+from src.routes.prices import prices_bp
+from src.routes.indicators import indicators_bp
+from src.routes.watchlist import watchlist_bp
+from src.routes.symbols import symbols_bp
+from src.routes.news import news_bp
+from src.routes.alerts import alerts_bp
+from src.utils.static_assets import StaticManifest
+from src.utils.compression import ResponseCompressor
+from src.utils.rate_limit import limiter
+from src.utils.cache import cache
+from src.utils.sharding import shard_router
+from src.services.jobs import job_queue
+from src.services.price_store import price_store
+from src.services.archiver import schedule_archiving
+from src.services.related_notes import schedule_vector_backfill
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -20,20 +47,57 @@ app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 # 啟用CORS支援
 CORS(app)
 
+# 大型 JSON / 串流回應壓縮
+ResponseCompressor(app)
+
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(notes_bp, url_prefix='/api/notes')
+app.register_blueprint(batch_bp, url_prefix='/api')
+app.register_blueprint(prices_bp, url_prefix='/api/prices')
+app.register_blueprint(indicators_bp, url_prefix='/api/indicators')
+app.register_blueprint(watchlist_bp, url_prefix='/api/watchlist')
+app.register_blueprint(symbols_bp, url_prefix='/api/symbols')
+app.register_blueprint(news_bp, url_prefix='/api/news')
+app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
 
-# 數據庫配置
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+# 數據庫配置（DATABASE_URL 可改用其他資料庫檔案，例如測試時）
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+# 依用戶分片：SHARD_DATABASE_URIS 列出主資料庫以外的分片（例如 sqlite:///.../shard1.db），
+# 未設定時所有資料都在主資料庫；調整分片後以 src/shards.py 離線搬移用戶
+app.config.setdefault('SHARD_DATABASE_URIS', [
+    uri for uri in os.environ.get('SHARD_DATABASE_URIS', '').split(',') if uri.strip()
+])
+shard_router.init_app(app)
+
+# 限流狀態存放在本機 SQLite，所有 worker 共用
+limiter.init_app(app)
+
+# 部署在反向代理之後時設為前方可信代理的層數，以 X-Forwarded-For 還原用戶端 IP（依 IP 限流）；
+# 直接對外服務時保持 0，否則用戶端可以偽造標頭換用新的令牌桶
+app.config.setdefault('RATELIMIT_TRUSTED_PROXIES', int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', '0')))
+if app.config['RATELIMIT_TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['RATELIMIT_TRUSTED_PROXIES'])
+
+# 兩層快取（行程內 LRU + 本機 SQLite 共用層），跨 worker 失效
+cache.init_app(app)
+
+# 背景工作佇列（資料庫持久化，每個行程啟動工作執行緒）
+job_queue.init_app(app)
+
+# 價格歷史（記憶體映射檔案，不經過 ORM）
+price_store.init_app(app)
+
 def init_database():
     """初始化數據庫和預設數據"""
     with app.app_context():
         db.create_all()
+        upgrade_schema()
         
         # 初始化系統統計
         if SystemStats.query.count() == 0:
@@ -60,25 +124,49 @@ def init_database():
             ]
             for tag in default_tags:
                 db.session.add(tag)
+
+        # 初始化股票主檔（用於自動辨識筆記與新聞提及的股票）
+        if Symbol.query.count() == 0:
+            default_symbols = [
+                ('2330', 'TWSE', '台積電', '台灣積體電路, TSMC'),
+                ('2317', 'TWSE', '鴻海', '鴻海精密, Foxconn, Hon Hai'),
+                ('2454', 'TWSE', '聯發科', 'MediaTek'),
+                ('2303', 'TWSE', '聯電', '聯華電子, UMC'),
+                ('2412', 'TWSE', '中華電', '中華電信, Chunghwa Telecom'),
+                ('NVDA', 'NASDAQ', 'NVIDIA', '輝達'),
+                ('AAPL', 'NASDAQ', 'Apple', '蘋果公司'),
+                ('TSLA', 'NASDAQ', 'Tesla', '特斯拉'),
+                ('MSFT', 'NASDAQ', 'Microsoft', '微軟'),
+                ('GOOGL', 'NASDAQ', 'Alphabet', 'Google, 谷歌'),
+                ('AMZN', 'NASDAQ', 'Amazon', '亞馬遜'),
+                ('TSM', 'NYSE', 'Taiwan Semiconductor ADR', '台積電ADR')
+            ]
+            for symbol, market, name, aliases in default_symbols:
+                Symbol.upsert(symbol, market=market, name=name, aliases=aliases)
         
         db.session.commit()
+
+        # 定期將長期未修改的筆記移到封存表（工作完成後自動排入下一次）
+        schedule_archiving()
+        # 補算升級前既有筆記的相關筆記向量
+        schedule_vector_backfill()
         print("數據庫初始化完成")
 
+# 啟動時建立靜態資源清單（雜湊、大小、預壓縮版本）
+static_manifest = StaticManifest(app.static_folder) if app.static_folder else None
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    if static_manifest is None:
+        return "Static folder not configured", 404
+
+    response = static_manifest.serve(path)
+    if response is None:
+        if path and static_manifest.index is not None:
+            return "File not found", 404
+        return "index.html not found", 404
+    return response
 
 
 if __name__ == '__main__':
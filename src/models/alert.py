@@ -0,0 +1,87 @@
+from datetime import datetime
+from src.models.user import db
+
+ALERT_DIRECTIONS = ('above', 'below')
+ALERT_STATUSES = ('active', 'triggered', 'cancelled')
+
+class PriceAlert(db.Model):
+    """自選股的價格提醒：價格向上穿越（above）或向下穿越（below）門檻時觸發一次"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    watchlist_id = db.Column(db.Integer, db.ForeignKey('watchlist.id'), nullable=False)
+    symbol_key = db.Column(db.String(20), nullable=False)
+    market_key = db.Column(db.String(10), nullable=False)
+    direction = db.Column(db.String(10), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), default='active', nullable=False)
+    triggered_price = db.Column(db.Float)
+    triggered_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 引擎依此欄位增量同步規則，所有狀態變更都會更新
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_price_alert_user_status', 'user_id', 'status'),
+        db.Index('ix_price_alert_watchlist', 'watchlist_id'),
+    )
+
+    def __repr__(self):
+        return f'<PriceAlert {self.symbol_key} {self.direction} {self.threshold}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'watchlist_id': self.watchlist_id,
+            'symbol': self.symbol_key,
+            'market': self.market_key,
+            'direction': self.direction,
+            'threshold': self.threshold,
+            'status': self.status,
+            'triggered_price': self.triggered_price,
+            'triggered_at': self.triggered_at.isoformat() if self.triggered_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+# 各股票最近一次處理的報價，下一筆報價以此判斷穿越了哪些門檻（所有 worker 共用）
+alert_last_prices = db.Table('alert_last_prices',
+    db.Column('symbol_key', db.String(20), primary_key=True),
+    db.Column('market_key', db.String(10), primary_key=True),
+    db.Column('price', db.Float, nullable=False),
+    db.Column('updated_at', db.DateTime, default=datetime.utcnow)
+)
+
+class AlertNotification(db.Model):
+    """價格提醒通知寄件匣：觸發時寫入，由背景工作分批投遞"""
+    id = db.Column(db.Integer, primary_key=True)
+    # 每個提醒只觸發一次，多個 worker 同時處理報價時不會重複通知
+    alert_id = db.Column(db.Integer, db.ForeignKey('price_alert.id'), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    symbol_key = db.Column(db.String(20), nullable=False)
+    market_key = db.Column(db.String(10), nullable=False)
+    direction = db.Column(db.String(10), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, index=True)
+    read_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_alert_notification_user', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<AlertNotification {self.alert_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'alert_id': self.alert_id,
+            'symbol': self.symbol_key,
+            'market': self.market_key,
+            'direction': self.direction,
+            'threshold': self.threshold,
+            'price': self.price,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None,
+            'read_at': self.read_at.isoformat() if self.read_at else None
+        }
@@ -0,0 +1,44 @@
+import sqlite3
+import zlib
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.models.user import db
+from src.utils.sharding import sharded
+from src.utils.text_delta import pack_snapshot, unpack_snapshot
+
+@sharded
+class NoteArchive(db.Model):
+    """冷資料層：長期未修改筆記的壓縮內容（只有主鍵索引），筆記表保留不含內容的摘要列"""
+    __tablename__ = 'note_archive'
+
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), primary_key=True)
+    # zlib 壓縮的完整內容
+    data = db.Column(db.LargeBinary, nullable=False)
+    content_length = db.Column(db.Integer, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NoteArchive {self.note_id}>'
+
+    @staticmethod
+    def pack(content):
+        return pack_snapshot(content or '')
+
+    @property
+    def content(self):
+        return unpack_snapshot(self.data)
+
+
+def _unpack_text(data):
+    try:
+        return unpack_snapshot(data) if data is not None else None
+    except (zlib.error, UnicodeDecodeError):
+        return None
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sql_functions(dbapi_connection, connection_record):
+    """註冊 unpack_text(data)，讓搜尋可以比對封存的壓縮內容"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('unpack_text', 1, _unpack_text, deterministic=True)
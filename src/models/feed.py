@@ -0,0 +1,21 @@
+from datetime import datetime
+from src.models.user import db
+
+class FeedItem(db.Model):
+    """個人化新聞收件匣：新聞辨識出股票後推送給追蹤該股票的用戶，每人保留固定筆數"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    article_id = db.Column(db.Integer, db.ForeignKey('news_article.id'), nullable=False)
+    # 推送原因（提及的自選股）
+    symbol_id = db.Column(db.Integer, db.ForeignKey('symbol.id'))
+    published_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'article_id'),
+        # 讀取收件匣：單一索引範圍掃描
+        db.Index('ix_feed_item_user_published', 'user_id', 'published_at', 'article_id'),
+    )
+
+    def __repr__(self):
+        return f'<FeedItem {self.user_id}:{self.article_id}>'
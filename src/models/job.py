@@ -0,0 +1,60 @@
+import json
+from datetime import datetime
+from src.models.user import db
+
+# 佇列中或執行中的工作，dedup_key 在這些狀態下必須唯一
+ACTIVE_STATUSES = ('queued', 'running')
+
+class Job(db.Model):
+    """背景工作：以資料庫作為持久化佇列"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+    priority = db.Column(db.Integer, default=0, nullable=False)
+    dedup_key = db.Column(db.String(200))
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    progress = db.Column(db.Integer, default=0)
+    progress_message = db.Column(db.String(200))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # 取件順序：狀態 -> 優先級 -> 先進先出
+        db.Index('ix_job_claim', 'status', 'priority', 'run_at', 'id'),
+        db.Index('ix_job_dedup_active', 'dedup_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running') AND dedup_key IS NOT NULL")),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': self.get_payload(),
+            'status': self.status,
+            'priority': self.priority,
+            'dedup_key': self.dedup_key,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -1,6 +1,17 @@
 from datetime import datetime
+from sqlalchemy.orm import validates
 from src.models.user import db
+from src.utils.symbols import normalize_symbol
+from src.utils.sharding import sharded
 
+# 新聞收藏自動辨識出的股票關聯表
+news_bookmark_symbols = sharded(db.Table('news_bookmark_symbols',
+    db.Column('news_bookmark_id', db.Integer, db.ForeignKey('news_bookmark.id'), primary_key=True),
+    db.Column('symbol_id', db.Integer, db.ForeignKey('symbol.id'), primary_key=True),
+    db.Index('ix_news_bookmark_symbols_symbol', 'symbol_id', 'news_bookmark_id')
+))
+
+@sharded
 class NewsBookmark(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -9,13 +20,35 @@ class NewsBookmark(db.Model):
     source = db.Column(db.String(100))
     stock_symbol = db.Column(db.String(20))
     stock_name = db.Column(db.String(100))
+    # 正規化後的股票代碼與市場，用於精確比對與索引範圍掃描
+    symbol_key = db.Column(db.String(20), index=True)
+    market_key = db.Column(db.String(10))
     summary = db.Column(db.Text)
     published_at = db.Column(db.DateTime)
+    # 股票自動辨識的處理時間，標題或摘要修改後清空，由背景工作分批處理
+    linked_at = db.Column(db.DateTime, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_news_bookmark_user_symbol_created', 'user_id', 'symbol_key', 'created_at', 'id'),
+    )
+
+    # 標題與摘要中提及的股票（自動辨識）
+    linked_symbols = db.relationship('Symbol', secondary=news_bookmark_symbols, lazy=True)
+
     def __repr__(self):
         return f'<NewsBookmark {self.title}>'
 
+    @validates('stock_symbol')
+    def _sync_symbol_key(self, key, value):
+        self.symbol_key, self.market_key = normalize_symbol(value)
+        return value
+
+    @validates('title', 'summary')
+    def _reset_linked_at(self, key, value):
+        self.linked_at = None
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -25,8 +58,67 @@ class NewsBookmark(db.Model):
             'source': self.source,
             'stock_symbol': self.stock_symbol,
             'stock_name': self.stock_name,
+            'market': self.market_key,
             'summary': self.summary,
             'published_at': self.published_at.isoformat() if self.published_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+# 新聞文章的 MinHash LSH 分段鍵，以 (band, article_id) 索引查詢相似候選
+news_article_bands = db.Table('news_article_bands',
+    db.Column('article_id', db.Integer, db.ForeignKey('news_article.id'), primary_key=True),
+    db.Column('band', db.BigInteger, primary_key=True),
+    db.Index('ix_news_article_bands_band', 'band', 'article_id')
+)
+
+# 新聞文章自動辨識出的股票關聯表
+news_article_symbols = db.Table('news_article_symbols',
+    db.Column('article_id', db.Integer, db.ForeignKey('news_article.id'), primary_key=True),
+    db.Column('symbol_id', db.Integer, db.ForeignKey('symbol.id'), primary_key=True),
+    db.Index('ix_news_article_symbols_symbol', 'symbol_id', 'article_id')
+)
+
+class NewsArticle(db.Model):
+    """匯入的新聞文章；同一事件的多個來源歸為一群，群內第一篇為代表文章"""
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(500), nullable=False)
+    description = db.Column(db.Text)
+    url = db.Column(db.String(1000), nullable=False, unique=True)
+    source = db.Column(db.String(100))
+    published_at = db.Column(db.DateTime, index=True)
+    # 代表文章為 NULL，重複文章指向代表文章
+    canonical_id = db.Column(db.Integer, db.ForeignKey('news_article.id'), index=True)
+    similarity = db.Column(db.Float)
+    duplicate_count = db.Column(db.Integer, default=0, nullable=False)
+    # 股票自動辨識的處理時間，由背景工作分批處理
+    linked_at = db.Column(db.DateTime, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_news_article_canonical_published', 'canonical_id', 'published_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<NewsArticle {self.title}>'
+
+    def to_dict(self, alternates=None):
+        data = {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'url': self.url,
+            'source': self.source,
+            'published_at': self.published_at.isoformat() if self.published_at else None,
+            'canonical_id': self.canonical_id,
+            'duplicate_count': self.duplicate_count
+        }
+        if alternates is not None:
+            data['alternates'] = [{
+                'id': article.id,
+                'title': article.title,
+                'url': article.url,
+                'source': article.source,
+                'published_at': article.published_at.isoformat() if article.published_at else None
+            } for article in alternates]
+        return data
@@ -1,41 +1,144 @@
 from datetime import datetime
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
 from src.models.user import db
+from src.utils.symbols import normalize_symbol
+from src.utils.sharding import sharded
+
+EXCERPT_LENGTH = 120
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """產生列表預覽用的摘要（合併空白並截斷）"""
+    if not content:
+        return ''
+    text = ' '.join(content.split())
+    return text if len(text) <= length else text[:length].rstrip() + '…'
 
 # 筆記標籤關聯表
-note_tags = db.Table('note_tags',
+note_tags = sharded(db.Table('note_tags',
     db.Column('note_id', db.Integer, db.ForeignKey('note.id'), primary_key=True),
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
-)
+))
+
+# 筆記自動辨識出的股票關聯表（反向索引用於查詢某檔股票被哪些筆記提及）
+note_symbols = sharded(db.Table('note_symbols',
+    db.Column('note_id', db.Integer, db.ForeignKey('note.id'), primary_key=True),
+    db.Column('symbol_id', db.Integer, db.ForeignKey('symbol.id'), primary_key=True),
+    db.Index('ix_note_symbols_symbol', 'symbol_id', 'note_id')
+))
 
+@sharded
 class Note(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # 預先計算的內容摘要，列表不必載入完整內容
+    excerpt = db.Column(db.String(150))
     stock_symbol = db.Column(db.String(20))
     stock_name = db.Column(db.String(100))
+    # 正規化後的股票代碼與市場，用於精確比對與索引範圍掃描
+    symbol_key = db.Column(db.String(20), index=True)
+    market_key = db.Column(db.String(10))
+    # 股票自動辨識的處理時間，標題或內容修改後清空，由背景工作分批處理
+    linked_at = db.Column(db.DateTime, index=True)
+    # 封存時間：長期未修改的筆記內容移到 note_archive（壓縮），本表只保留標題、摘要等欄位
+    archived_at = db.Column(db.DateTime)
+    # 用戶筆記的變更序號（新增、修改內容或標籤時遞增），供增量同步使用
+    change_seq = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_note_user_symbol_created', 'user_id', 'symbol_key', 'created_at', 'id'),
+        db.Index('ix_note_user_change', 'user_id', 'change_seq'),
+    )
     
-    # 多對多關係：筆記可以有多個標籤
-    tags = db.relationship('Tag', secondary=note_tags, lazy='subquery',
+    # 多對多關係：筆記可以有多個標籤（列表查詢以 tag_registry.attach 批次填入，標籤物件取自行程內的登錄）
+    tags = db.relationship('Tag', secondary=note_tags, lazy='select',
                           backref=db.backref('notes', lazy=True))
+    # 版本歷史，刪除筆記時一併刪除
+    revisions = db.relationship('NoteRevision', backref='note', lazy='dynamic',
+                                cascade='all, delete-orphan')
+    # 內容中提及的股票（自動辨識）
+    linked_symbols = db.relationship('Symbol', secondary=note_symbols, lazy=True)
+    # 封存的壓縮內容（只在讀取已封存筆記的內容時載入）
+    archive = db.relationship('NoteArchive', uselist=False, lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Note {self.title}>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'title': self.title,
-            'content': self.content,
-            'stock_symbol': self.stock_symbol,
-            'stock_name': self.stock_name,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'tags': [tag.to_dict() for tag in self.tags]
+    # fields= 可選的輸出欄位及其需要載入的資料庫欄位
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'user_id': ('user_id',),
+        'title': ('title',),
+        'content': ('content', 'archived_at'),
+        'excerpt': ('excerpt',),
+        'stock_symbol': ('stock_symbol',),
+        'stock_name': ('stock_name',),
+        'market': ('market_key',),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+        'tags': (),
+    }
+    # 輸出欄位需要批次預先載入的關聯：已封存筆記的內容在封存表
+    FIELD_PRELOAD = {
+        'content': ('archive',),
+    }
+
+    @validates('stock_symbol')
+    def _sync_symbol_key(self, key, value):
+        self.symbol_key, self.market_key = normalize_symbol(value)
+        return value
+
+    @validates('content')
+    def _sync_excerpt(self, key, value):
+        self.excerpt = make_excerpt(value)
+        self.linked_at = None
+        return value
+
+    @validates('title')
+    def _reset_linked_at(self, key, value):
+        self.linked_at = None
+        return value
+
+    @property
+    def full_content(self):
+        """完整內容；已封存的筆記從封存表解壓縮"""
+        if self.archived_at is not None and self.archive is not None:
+            return self.archive.content
+        return self.content
+
+    def unarchive(self):
+        """將封存的內容移回筆記表（修改前呼叫），不改變修改時間與辨識狀態"""
+        if self.archived_at is None:
+            return
+        content = self.full_content
+        table = Note.__table__
+        db.session.execute(table.update().where(table.c.id == self.id)
+                           .values(content=content, archived_at=None, updated_at=table.c.updated_at))
+        if self.archive is not None:
+            db.session.delete(self.archive)
+        set_committed_value(self, 'content', content)
+        set_committed_value(self, 'archived_at', None)
+
+    def to_dict(self, fields=None):
+        data = {
+            'id': lambda: self.id,
+            'user_id': lambda: self.user_id,
+            'title': lambda: self.title,
+            'content': lambda: self.full_content,
+            'excerpt': lambda: self.excerpt,
+            'stock_symbol': lambda: self.stock_symbol,
+            'stock_name': lambda: self.stock_name,
+            'market': lambda: self.market_key,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None,
+            'tags': lambda: [tag.to_dict() for tag in self.tags]
         }
+        # 只序列化請求的欄位，避免觸發未載入欄位的延遲查詢
+        return {key: value() for key, value in data.items() if fields is None or key in fields}
 
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
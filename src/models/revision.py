@@ -0,0 +1,33 @@
+from datetime import datetime
+from src.models.user import db
+from src.utils.sharding import sharded
+
+@sharded
+class NoteRevision(db.Model):
+    """筆記版本歷史：定期完整快照加上壓縮的文字差異"""
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    # zlib 壓縮的完整內容（快照）或差異指令
+    data = db.Column(db.LargeBinary, nullable=False)
+    content_length = db.Column(db.Integer, default=0)
+    stored_size = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('note_id', 'revision'),)
+
+    def __repr__(self):
+        return f'<NoteRevision {self.note_id}@{self.revision}>'
+
+    def to_dict(self):
+        return {
+            'note_id': self.note_id,
+            'revision': self.revision,
+            'title': self.title,
+            'is_snapshot': self.is_snapshot,
+            'content_length': self.content_length,
+            'stored_size': self.stored_size,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,269 @@
+from functools import wraps
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from src.models.user import User, db
+from src.models.note import Note, make_excerpt
+from src.models.news import NewsBookmark
+from src.models.watchlist import Watchlist
+from src.models.sync import next_change_seq
+from src.utils.sharding import shard_router, use_shard
+from src.utils.symbols import normalize_symbol
+
+# 已上線資料庫需要補上的回填作業，依序執行
+BACKFILLS = []
+
+
+def backfill(func):
+    """註冊一個在結構升級後執行的資料回填函式"""
+    BACKFILLS.append(func)
+    return func
+
+
+def sharded_backfill(func):
+    """註冊一個在每個分片上各執行一次的資料回填函式（分片資料表）"""
+    @wraps(func)
+    def run(*args, **kwargs):
+        for shard in shard_router.shard_ids():
+            with use_shard(shard):
+                func(*args, **kwargs)
+    BACKFILLS.append(run)
+    return func
+
+
+def _add_missing_columns(conn, tables=None):
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in tables or db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def _create_missing_indexes(conn, tables=None):
+    for table in tables or db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+# 用戶名稱與電子郵件的三字元組全文索引（外部內容表，由觸發器同步），用於中間字串搜尋
+USER_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        username_lower, email_lower, content='user', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_search (rowid, username_lower, email_lower)
+        VALUES (new.id, new.username_lower, new.email_lower);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_search (user_search, rowid, username_lower, email_lower)
+        VALUES ('delete', old.id, old.username_lower, old.email_lower);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF username_lower, email_lower ON "user" BEGIN
+        INSERT INTO user_search (user_search, rowid, username_lower, email_lower)
+        VALUES ('delete', old.id, old.username_lower, old.email_lower);
+        INSERT INTO user_search (rowid, username_lower, email_lower)
+        VALUES (new.id, new.username_lower, new.email_lower);
+    END""",
+)
+
+
+def _create_search_indexes(conn):
+    """建立全文索引；SQLite 未編譯 FTS5 或不支援 trigram 時略過（搜尋改用前綴與掃描）"""
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        with conn.begin_nested():
+            for statement in USER_SEARCH_DDL:
+                conn.execute(text(statement))
+    except OperationalError:
+        return False
+    return True
+
+
+def upgrade_schema():
+    """輕量級結構升級：補上新增欄位與索引，並執行資料回填
+
+    db.create_all() 只會建立不存在的資料表，已存在的資料表不會新增欄位或索引。
+    """
+    with db.engine.begin() as conn:
+        added = _add_missing_columns(conn)
+        _create_missing_indexes(conn)
+
+    # 其他分片只有依用戶分片的資料表
+    shard_router.create_all(db.metadata)
+    tables = shard_router.sharded_tables(db.metadata)
+    for shard in shard_router.shard_ids()[1:]:
+        with shard_router.engine(shard).begin() as conn:
+            added += [f'{shard}:{name}' for name in _add_missing_columns(conn, tables)]
+            _create_missing_indexes(conn, tables)
+
+    for func in BACKFILLS:
+        func()
+    db.session.commit()
+    return added
+
+
+@sharded_backfill
+def backfill_symbol_keys(batch_size=1000):
+    """為舊資料補上正規化的股票代碼與市場"""
+    for model in (Note, NewsBookmark):
+        table = model.__table__
+        # 回填不算修改，保留原本的修改時間（否則 onupdate 會改寫，封存判斷也會失準）
+        keep = {'updated_at': table.c.updated_at} if 'updated_at' in table.c else {}
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(table.c.id, table.c.stock_symbol)
+                .where(table.c.id > last_id,
+                       table.c.stock_symbol.isnot(None),
+                       table.c.symbol_key.is_(None))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, stock_symbol in rows:
+                symbol_key, market_key = normalize_symbol(stock_symbol)
+                updates.append({'row_id': row_id, 'symbol_key': symbol_key, 'market_key': market_key})
+            db.session.execute(
+                table.update()
+                .where(table.c.id == db.bindparam('row_id'))
+                .values(symbol_key=db.bindparam('symbol_key'), market_key=db.bindparam('market_key'), **keep),
+                updates
+            )
+            db.session.commit()
+            last_id = rows[-1][0]
+
+
+@sharded_backfill
+def backfill_watchlist_symbol_keys(batch_size=1000):
+    """為舊自選股補上正規化的股票代碼與市場"""
+    table = Watchlist.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.stock_symbol, table.c.market)
+            .where(table.c.id > last_id, table.c.symbol_key.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for row_id, stock_symbol, market in rows:
+            symbol_key, market_key = normalize_symbol(stock_symbol, market)
+            updates.append({'row_id': row_id, 'symbol_key': symbol_key, 'market_key': market_key})
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('row_id'))
+            .values(symbol_key=db.bindparam('symbol_key'), market_key=db.bindparam('market_key')),
+            updates
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+
+
+@sharded_backfill
+def backfill_note_excerpts(batch_size=500):
+    """為舊筆記補上內容摘要"""
+    table = Note.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.content)
+            .where(table.c.id > last_id, table.c.excerpt.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('row_id'))
+            .values(excerpt=db.bindparam('excerpt'), updated_at=table.c.updated_at),
+            [{'row_id': row_id, 'excerpt': make_excerpt(content)} for row_id, content in rows]
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+
+
+@sharded_backfill
+def backfill_note_change_seq(batch_size=1000):
+    """為舊筆記依 id 順序補上每位用戶的變更序號"""
+    table = Note.__table__
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.user_id)
+            .where(table.c.change_seq.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        by_user = {}
+        for row_id, user_id in rows:
+            by_user.setdefault(user_id, []).append(row_id)
+        connection = db.session.connection(bind_arguments={'mapper': Note})
+        updates = []
+        for user_id, row_ids in by_user.items():
+            first = next_change_seq(connection, user_id, len(row_ids))
+            updates.extend({'row_id': row_id, 'change_seq': first + offset} for offset, row_id in enumerate(row_ids))
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('row_id'))
+            .values(change_seq=db.bindparam('change_seq'), updated_at=table.c.updated_at),
+            updates
+        )
+        db.session.commit()
+
+
+@backfill
+def backfill_user_search(batch_size=1000):
+    """為舊用戶補上小寫欄位，建立全文索引，並在索引與用戶表不一致時重建"""
+    table = User.__table__
+    last_id = 0
+    backfilled = False
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.username, table.c.email)
+            .where(table.c.id > last_id,
+                   ((table.c.username_lower.is_(None) & table.c.username.isnot(None)) |
+                    (table.c.email_lower.is_(None) & table.c.email.isnot(None))))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        if not backfilled:
+            # 更新觸發器會先從全文索引刪除舊值，對從未索引的舊列刪除會損壞索引；
+            # 補齊前先移除（舊版升級留下的也一併處理），補齊後重建索引
+            db.session.execute(text('DROP TRIGGER IF EXISTS user_search_au'))
+            backfilled = True
+        db.session.execute(
+            table.update()
+            .where(table.c.id == db.bindparam('row_id'))
+            .values(username_lower=db.bindparam('username_lower'), email_lower=db.bindparam('email_lower'),
+                    updated_at=table.c.updated_at),
+            [{'row_id': row_id,
+              'username_lower': username.lower() if username else None,
+              'email_lower': email.lower() if email else None} for row_id, username, email in rows]
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+
+    # 全文索引在小寫欄位補齊後才建立
+    with db.engine.begin() as conn:
+        if not _create_search_indexes(conn):
+            return
+    indexed = db.session.execute(text('SELECT COUNT(*) FROM user_search_docsize')).scalar()
+    if backfilled or indexed != db.session.query(db.func.count(User.id)).scalar():
+        db.session.execute(text("INSERT INTO user_search (user_search) VALUES ('rebuild')"))
+        db.session.commit()
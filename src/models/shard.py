@@ -0,0 +1,43 @@
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from src.models.user import User, db
+
+class ShardAssignment(db.Model):
+    """用戶所在分片（存放在主資料庫）；沒有紀錄的用戶在分片 0"""
+    __tablename__ = 'shard_map'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False, index=True)
+    moved_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'shard': self.shard,
+            'moved_at': self.moved_at.isoformat() if self.moved_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<ShardAssignment {self.user_id}:{self.shard}>'
+
+
+@event.listens_for(User, 'after_insert')
+def _assign_shard(mapper, connection, target):
+    """新用戶註冊時分配分片（與建立用戶在同一交易中）"""
+    router = current_app.extensions.get('shard_router') if has_app_context() else None
+    if router is not None and router.enabled:
+        connection.execute(ShardAssignment.__table__.insert().values(
+            user_id=target.id, shard=router.place(target.id), created_at=datetime.utcnow()
+        ))
+
+
+@event.listens_for(User, 'after_delete')
+def _release_shard(mapper, connection, target):
+    """刪除用戶時移除分片對應（SQLite 可能重複使用最大的用戶 id）"""
+    router = current_app.extensions.get('shard_router') if has_app_context() else None
+    if router is not None and router.enabled:
+        connection.execute(ShardAssignment.__table__.delete().where(ShardAssignment.user_id == target.id))
+        router.forget(target.id)
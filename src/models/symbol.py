@@ -0,0 +1,64 @@
+import re
+from datetime import datetime
+from sqlalchemy.orm import validates
+from src.models.user import db
+from src.utils.symbols import normalize_symbol
+
+ALIAS_SEPARATOR_RE = re.compile(r'[,，、\n]+')
+
+class Symbol(db.Model):
+    """股票代碼主檔：代碼、公司名稱與別名（中英文），用於自動辨識文章提及的股票"""
+    id = db.Column(db.Integer, primary_key=True)
+    symbol_key = db.Column(db.String(20), nullable=False)
+    market_key = db.Column(db.String(10), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    # 其他名稱，以逗號或換行分隔，例如 台積電、TSMC
+    aliases = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    # 追蹤人數（自選股或收藏過相關新聞），推送新聞時更新
+    follower_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('symbol_key', 'market_key'),)
+
+    def __repr__(self):
+        return f'<Symbol {self.market_key}:{self.symbol_key}>'
+
+    @validates('aliases')
+    def _normalize_aliases(self, key, value):
+        if isinstance(value, (list, tuple)):
+            value = '\n'.join(value)
+        names = [name.strip() for name in ALIAS_SEPARATOR_RE.split(value or '') if name.strip()]
+        return '\n'.join(dict.fromkeys(names)) or None
+
+    def alias_list(self):
+        return self.aliases.split('\n') if self.aliases else []
+
+    @classmethod
+    def upsert(cls, symbol, market=None, name=None, aliases=None, is_active=True):
+        """新增或更新一筆主檔資料（不提交）"""
+        symbol_key, market_key = normalize_symbol(symbol, market)
+        if not symbol_key:
+            raise ValueError('股票代碼不能為空')
+        record = cls.query.filter_by(symbol_key=symbol_key, market_key=market_key).first()
+        if record is None:
+            record = cls(symbol_key=symbol_key, market_key=market_key)
+            db.session.add(record)
+        record.name = (name or record.name or symbol_key)[:100]
+        if aliases is not None:
+            record.aliases = aliases
+        record.is_active = bool(is_active)
+        return record
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'symbol': self.symbol_key,
+            'market': self.market_key,
+            'name': self.name,
+            'aliases': self.alias_list(),
+            'is_active': self.is_active,
+            'follower_count': self.follower_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,111 @@
+from datetime import datetime
+from sqlalchemy import event, text
+from sqlalchemy.orm import object_session
+from src.models.user import db, User
+from src.models.note import Note
+from src.utils.sharding import sharded
+
+# 增量同步時一次變更超過此筆數就整份重新載入
+RELOAD_THRESHOLD = 2000
+# IN 查詢每批的 id 數（SQLite 參數數量限制）
+ID_BATCH_SIZE = 500
+
+# 每位用戶的筆記變更序號（單調遞增），同步時以此判斷是否有新變更
+note_change_counters = sharded(db.Table('note_change_counter',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('seq', db.Integer, nullable=False, default=0)
+))
+
+@sharded
+class NoteTombstone(db.Model):
+    """已刪除筆記的墓碑，讓增量同步的客戶端移除本機副本"""
+    __tablename__ = 'note_tombstone'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    change_seq = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NoteTombstone {self.user_id}:{self.note_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.note_id,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None
+        }
+
+
+def next_change_seq(connection, user_id, count=1):
+    """保留 count 個連續的變更序號，返回第一個（與寫入在同一交易中）"""
+    statement = text('UPDATE note_change_counter SET seq = seq + :count WHERE user_id = :user_id RETURNING seq')
+    last = connection.execute(statement, {'count': count, 'user_id': user_id}).scalar()
+    if last is None:
+        connection.execute(text('INSERT OR IGNORE INTO note_change_counter (user_id, seq) VALUES (:user_id, 0)'),
+                           {'user_id': user_id})
+        last = connection.execute(statement, {'count': count, 'user_id': user_id}).scalar()
+    return last - count + 1
+
+
+def current_change_seq(user_id):
+    """用戶目前的變更序號（主鍵查詢）"""
+    return db.session.execute(
+        db.select(note_change_counters.c.seq).where(note_change_counters.c.user_id == user_id)
+    ).scalar() or 0
+
+
+def id_batches(ids, size=ID_BATCH_SIZE):
+    """把 id 清單切成適合 IN 查詢的批次"""
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def changes_since(user_id, since, columns=None, threshold=RELOAD_THRESHOLD):
+    """讀取用戶在序號 since 之後的筆記變更，供行程內的索引增量同步
+
+    返回 (目前序號, 已刪除的筆記 id, 變更的筆記列, 是否需要重新載入)；變更的列依 columns 查詢，
+    預設只有 id。序號沒變時只需一次主鍵查詢；序號倒退（用戶已刪除且 id 被重新使用）或變更超過
+    threshold 筆時返回需要重新載入，由呼叫端整份重建。
+    """
+    seq = current_change_seq(user_id)
+    if seq == since:
+        return seq, [], [], False
+    if seq < since:
+        return seq, [], [], True
+    table = Note.__table__
+    deleted = [note_id for (note_id,) in db.session.execute(
+        db.select(NoteTombstone.note_id).where(NoteTombstone.user_id == user_id, NoteTombstone.change_seq > since)
+    )]
+    changed = db.session.execute(
+        db.select(*(columns or (table.c.id,))).where(table.c.user_id == user_id, table.c.change_seq > since)
+    ).all()
+    return seq, deleted, changed, len(deleted) + len(changed) > threshold
+
+
+@event.listens_for(Note, 'before_insert')
+def _stamp_new_note(mapper, connection, target):
+    target.change_seq = next_change_seq(connection, target.user_id)
+
+
+@event.listens_for(Note, 'before_update')
+def _stamp_changed_note(mapper, connection, target):
+    # 只有欄位或標籤真的改變時才需要重新同步
+    session = object_session(target)
+    if session is None or session.is_modified(target):
+        target.change_seq = next_change_seq(connection, target.user_id)
+
+
+@event.listens_for(Note, 'after_delete')
+def _bury_note(mapper, connection, target):
+    connection.execute(NoteTombstone.__table__.insert().values(
+        user_id=target.user_id, change_seq=next_change_seq(connection, target.user_id),
+        note_id=target.id, deleted_at=datetime.utcnow()
+    ))
+
+
+@event.listens_for(User, 'after_delete')
+def _drop_sync_state(mapper, connection, target):
+    # 用戶的同步資料在其分片上，刪除帳號時一併清除（包含剛才串聯刪除筆記產生的墓碑）
+    shard_connection = object_session(target).connection(bind_arguments={'mapper': NoteTombstone})
+    shard_connection.execute(NoteTombstone.__table__.delete().where(NoteTombstone.user_id == target.id))
+    shard_connection.execute(note_change_counters.delete().where(note_change_counters.c.user_id == target.id))
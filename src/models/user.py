@@ -1,8 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from src.utils.sharding import RoutingSession
 
-db = SQLAlchemy()
+# 分片資料表的語句依目前用戶路由到所屬分片（未設定分片時與預設 Session 相同）
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,11 +17,23 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
+    # 小寫的用戶名稱與電子郵件，供不分大小寫的前綴搜尋走索引
+    username_lower = db.Column(db.String(50), index=True)
+    email_lower = db.Column(db.String(100), index=True)
     
     # 關聯關係
     notes = db.relationship('Note', backref='user', lazy=True, cascade='all, delete-orphan')
     news_bookmarks = db.relationship('NewsBookmark', backref='user', lazy=True, cascade='all, delete-orphan')
     watchlist = db.relationship('Watchlist', backref='user', lazy=True, cascade='all, delete-orphan')
+    feed_items = db.relationship('FeedItem', lazy='dynamic', cascade='all, delete-orphan')
+    # 刪除用戶時一併刪除價格提醒與通知，引擎觸發前會確認提醒仍存在
+    price_alerts = db.relationship('PriceAlert', lazy='dynamic', cascade='all, delete-orphan')
+    alert_notifications = db.relationship('AlertNotification', lazy='dynamic', cascade='all, delete-orphan')
+
+    @validates('username', 'email')
+    def _sync_lower(self, key, value):
+        setattr(self, f'{key}_lower', value.lower() if value else None)
+        return value
 
     def set_password(self, password):
         """設置密碼哈希"""
@@ -33,16 +48,29 @@ class User(db.Model):
         self.last_login = datetime.utcnow()
         db.session.commit()
 
+    # fields= 可選的輸出欄位及其需要載入的資料庫欄位
+    FIELD_COLUMNS = {
+        'id': ('id',),
+        'username': ('username',),
+        'email': ('email',),
+        'is_admin': ('is_admin',),
+        'created_at': ('created_at',),
+        'last_login': ('last_login',),
+        'is_active': ('is_active',),
+    }
+
     def __repr__(self):
         return f'<User {self.username}>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'is_admin': self.is_admin,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'last_login': self.last_login.isoformat() if self.last_login else None,
-            'is_active': self.is_active
+    def to_dict(self, fields=None):
+        data = {
+            'id': lambda: self.id,
+            'username': lambda: self.username,
+            'email': lambda: self.email,
+            'is_admin': lambda: self.is_admin,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'last_login': lambda: self.last_login.isoformat() if self.last_login else None,
+            'is_active': lambda: self.is_active
         }
+        # 只序列化請求的欄位，避免觸發未載入欄位的延遲查詢
+        return {key: value() for key, value in data.items() if fields is None or key in fields}
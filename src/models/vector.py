@@ -0,0 +1,23 @@
+from datetime import datetime
+from src.models.user import db
+from src.utils.sharding import sharded
+from src.utils.tfidf import unpack_vector
+
+@sharded
+class NoteVector(db.Model):
+    """筆記的詞頻向量（壓縮），供相關筆記推薦；新增或修改筆記時同步更新"""
+    __tablename__ = 'note_vector'
+
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # pack_vector 產生的詞 id 差值與次數
+    data = db.Column(db.LargeBinary, nullable=False)
+    term_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<NoteVector {self.note_id}>'
+
+    @property
+    def terms(self):
+        return unpack_vector(self.data)
@@ -1,6 +1,10 @@
 from datetime import datetime
+from sqlalchemy.orm import validates
 from src.models.user import db
+from src.utils.sharding import sharded
+from src.utils.symbols import normalize_symbol
 
+@sharded
 class Watchlist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -10,13 +14,26 @@ class Watchlist(db.Model):
     stock_type = db.Column(db.String(20), default='listed')  # 'listed', 'unlisted', 'ipo', 'unicorn'
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 正規化後的股票代碼與市場（例如 2330.TW -> 2330 / TWSE），用於依股票查詢追蹤者
+    symbol_key = db.Column(db.String(20))
+    market_key = db.Column(db.String(10))
     
     # 複合唯一約束：同一用戶不能重複關注同一市場的同一股票
-    __table_args__ = (db.UniqueConstraint('user_id', 'stock_symbol', 'market'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'stock_symbol', 'market'),
+        db.Index('ix_watchlist_symbol_market', 'symbol_key', 'market_key'),
+    )
 
     def __repr__(self):
         return f'<Watchlist {self.stock_symbol}>'
 
+    @validates('stock_symbol', 'market')
+    def _sync_symbol_key(self, key, value):
+        stock_symbol = value if key == 'stock_symbol' else self.stock_symbol
+        market = value if key == 'market' else self.market
+        self.symbol_key, self.market_key = normalize_symbol(stock_symbol, market)
+        return value
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,43 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from src.main import app, init_database
+from src.models.note import Note
+from src.services.related_notes import rebuild_vectors, related_notes
+from src.utils.sharding import shard_router
+
+if __name__ == '__main__':
+    # 相關筆記向量維護工具：
+    #   python src/related.py rebuild [--user ID] [--missing]
+    #   python src/related.py show <user_id> <note_id> [--limit 5]
+    parser = argparse.ArgumentParser(description='相關筆記向量維護')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='重新計算筆記向量（分詞規則或權重調整後執行）')
+    rebuild.add_argument('--user', type=int, help='只處理指定用戶')
+    rebuild.add_argument('--missing', action='store_true', help='只補算缺少向量的筆記')
+    show = commands.add_parser('show', help='列出筆記的相關筆記')
+    show.add_argument('user_id', type=int)
+    show.add_argument('note_id', type=int)
+    show.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args()
+
+    init_database()
+    with app.app_context():
+        if args.command == 'rebuild':
+            def report(shard, last_id, processed):
+                print(f'分片 {shard} 已處理至 id {last_id}，共 {processed} 筆')
+            processed = rebuild_vectors(args.user, args.missing, report=report)
+            print(f'完成，共重新計算 {processed} 筆筆記向量')
+        else:
+            related = related_notes.related(args.user_id, args.note_id, args.limit)
+            with shard_router.for_user(args.user_id):
+                titles = dict(Note.query.with_entities(Note.id, Note.title).filter(
+                    Note.user_id == args.user_id, Note.id.in_([args.note_id] + [note_id for note_id, _ in related])))
+            if args.note_id not in titles:
+                print(f'用戶 {args.user_id} 沒有筆記 {args.note_id}')
+                sys.exit(1)
+            print(f'{args.note_id}: {titles[args.note_id]}')
+            for note_id, score in related:
+                print(f'  {score:.4f}  {note_id}: {titles.get(note_id, "")}')
@@ -1,12 +1,34 @@
+from datetime import datetime, timedelta
+from itertools import islice
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
-from src.models.watchlist import SystemStats
-from src.models.note import Note
+from src.models.watchlist import Watchlist, SystemStats
+from src.models.note import Note, Tag, note_tags
 from src.models.news import NewsBookmark
+from src.models.job import Job
 from src.routes.auth import admin_required
+from src.utils.fields import parse_fields, field_options
+from src.services.jobs import enqueue, HANDLERS
+from src.services.maintenance_jobs import recount_stats
+from src.services.archiver import storage_stats
+from src.services.user_search import search_user_ids, count_matches, MAX_SEARCH_DEPTH
+from src.utils.cache import cache
+from src.utils.export import parse_format, export_response
+from src.utils.sharding import shard_router, merge_counts, merge_scalars, merge_sorted
 
 admin_bp = Blueprint('admin', __name__)
 
+# 匯出時每次從資料庫取回的列數（伺服器端游標分塊）
+EXPORT_CHUNK_SIZE = 1000
+USER_EXPORT_COLUMNS = ('id', 'username', 'email', 'is_admin', 'is_active', 'created_at', 'last_login',
+                       'note_count', 'bookmark_count', 'watchlist_count')
+NOTE_EXPORT_COLUMNS = ('id', 'user_id', 'username', 'title', 'stock_symbol', 'market', 'tags',
+                       'created_at', 'updated_at')
+# 筆記數超過此值的帳號改由背景工作刪除
+LARGE_ACCOUNT_NOTES = 200
+# 統計數據超過此秒數視為過期，於背景重新計算
+STATS_MAX_AGE = 300
+
 @admin_bp.route('/users', methods=['GET'])
 @admin_required
 def get_all_users():
@@ -14,15 +36,19 @@ def get_all_users():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        try:
+            fields = parse_fields(request.args.get('fields'), User)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        users = User.query.paginate(
+        users = User.query.options(*field_options(User, fields)).paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
         return jsonify({
-            'users': [user.to_dict() for user in users.items],
+            'users': [user.to_dict(fields) for user in users.items],
             'total': users.total,
             'pages': users.pages,
             'current_page': page,
@@ -32,6 +58,96 @@ def get_all_users():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _count_by_user(column, user_ids):
+    """各分片依用戶 GROUP BY 後加總（用戶只在一個分片，但搬移期間可能兩邊都有）"""
+    return merge_counts(shard_router.scatter(
+        db.select(column, db.func.count()).where(column.in_(user_ids)).group_by(column)
+    ))
+
+def _with_counts(rows):
+    """每塊用戶以三次索引範圍 GROUP BY 取得筆記、收藏與自選股數量，不逐一查詢"""
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        user_ids = [row.id for row in chunk]
+        counts = [_count_by_user(column, user_ids)
+                  for column in (Note.user_id, NewsBookmark.user_id, Watchlist.user_id)]
+        for row in chunk:
+            yield tuple(row) + tuple(count.get(row.id, 0) for count in counts)
+
+def _stream_rows(statement):
+    """以伺服器端游標分塊讀取，不建立 ORM 物件"""
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+@admin_bp.route('/export/users', methods=['GET'])
+@admin_required
+def export_users():
+    """串流匯出所有用戶（含筆記、新聞收藏與自選股數量），format=csv 或 ndjson"""
+    try:
+        try:
+            fmt = parse_format(request.args.get('format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # 用戶在主資料庫，數量分散在各分片：分塊讀取用戶，再向各分片查詢該塊的數量
+        statement = db.select(
+            User.id, User.username, User.email, User.is_admin, User.is_active, User.created_at,
+            User.last_login
+        ).order_by(User.id)
+
+        total = db.session.query(db.func.count(User.id)).scalar()
+        return export_response(USER_EXPORT_COLUMNS, _with_counts(_stream_rows(statement)), fmt,
+                               f"users-{datetime.utcnow():%Y%m%d}", total=total)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/notes', methods=['GET'])
+@admin_required
+def export_notes():
+    """串流匯出筆記資料（不含內容），可依 user_id 或 since（建立時間）過濾"""
+    try:
+        try:
+            fmt = parse_format(request.args.get('format'))
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        user_id = request.args.get('user_id', type=int)
+
+        # 標籤以關聯子查詢合併成一個欄位，沿 note_tags 主鍵逐筆查找
+        tags = db.select(db.func.group_concat(Tag.name, ','))\
+                 .select_from(note_tags.join(Tag, Tag.id == note_tags.c.tag_id))\
+                 .where(note_tags.c.note_id == Note.id)\
+                 .scalar_subquery()
+        conditions = []
+        if user_id:
+            conditions.append(Note.user_id == user_id)
+        if since:
+            conditions.append(Note.created_at >= since)
+        statement = db.select(
+            Note.id, Note.user_id, User.username, Note.title, Note.stock_symbol, Note.market_key,
+            tags, Note.created_at, Note.updated_at
+        ).join(User, User.id == Note.user_id).where(*conditions).order_by(Note.id)
+
+        # 各分片依 id 排序串流，k 路合併後仍依 id 排序；指定用戶時只讀該用戶的分片
+        shards = [shard_router.shard_for_user(user_id)] if user_id else None
+        total = merge_scalars(shard_router.scatter(
+            db.select(db.func.count(Note.id)).where(*conditions), shards=shards
+        ))
+        rows = merge_sorted(shard_router.stream(statement, EXPORT_CHUNK_SIZE, shards=shards),
+                            key=lambda row: row.id)
+        return export_response(NOTE_EXPORT_COLUMNS, rows, fmt,
+                               f"notes-{datetime.utcnow():%Y%m%d}", total=total)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/users/<int:user_id>', methods=['PUT'])
 @admin_required
 def update_user_admin(user_id):
@@ -86,9 +202,18 @@ def delete_user_admin(user_id):
         from flask import session
         if user.id == session.get('user_id'):
             return jsonify({'error': '不能刪除自己的帳號'}), 400
-        
-        db.session.delete(user)
-        db.session.commit()
+
+        with shard_router.for_user(user.id):
+            # 大帳號的級聯刪除交給背景工作，先停用帳號
+            if Note.query.filter_by(user_id=user.id).count() > LARGE_ACCOUNT_NOTES:
+                user.is_active = False
+                db.session.commit()
+                job, _ = enqueue('delete_user', {'user_id': user.id}, priority=5,
+                                 dedup_key=f'delete_user:{user.id}')
+                return jsonify({'message': '用戶刪除已排入背景工作', 'job': job.to_dict()}), 202
+
+            db.session.delete(user)
+            db.session.commit()
         
         # 更新用戶統計
         SystemStats.increment_stat('total_users', -1)
@@ -104,63 +229,196 @@ def delete_user_admin(user_id):
 def get_system_stats():
     """獲取系統統計數據"""
     try:
-        # 實時計算統計數據
-        total_users = User.query.count()
-        total_notes = Note.query.count()
-        total_news = NewsBookmark.query.count()
-        
-        # 更新統計數據
-        SystemStats.update_stat('total_users', total_users)
-        SystemStats.update_stat('total_notes', total_notes)
-        SystemStats.update_stat('total_news', total_news)
-        
-        # 獲取所有統計數據
-        stats = SystemStats.query.all()
-        stats_dict = {stat.stat_name: stat.stat_value for stat in stats}
-        
-        # 添加額外統計
-        active_users = User.query.filter_by(is_active=True).count()
-        admin_users = User.query.filter_by(is_admin=True).count()
-        
-        stats_dict.update({
-            'active_users': active_users,
-            'admin_users': admin_users
-        })
+        stats = {stat.stat_name: stat for stat in SystemStats.query.all()}
+
+        # 從未計算過時同步計算一次，之後由背景工作定期重算
+        if 'active_users' not in stats:
+            recount_stats()
+            stats = {stat.stat_name: stat for stat in SystemStats.query.all()}
+
+        stats_dict = {name: stat.stat_value for name, stat in stats.items()}
+
+        computed_at = stats['active_users'].updated_at
+        stale = computed_at is None or computed_at < datetime.utcnow() - timedelta(seconds=STATS_MAX_AGE)
+        if stale or request.args.get('refresh', type=int):
+            job, _ = enqueue('recount_stats', dedup_key='recount_stats')
+            stats_dict['refresh_job_id'] = job.id
+        stats_dict['computed_at'] = computed_at.isoformat() if computed_at else None
         
         return jsonify(stats_dict), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/storage', methods=['GET'])
+@admin_required
+def get_storage_stats():
+    """筆記熱資料與封存資料的大小"""
+    try:
+        return jsonify(storage_stats()), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 快取監控API
+@admin_bp.route('/cache', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """獲取快取命中率與淘汰次數（計數器為目前 worker 的數值）"""
+    try:
+        stats = cache.stats
+        stats['shared_entries'] = cache.store.count() if cache.store is not None else 0
+        return jsonify(stats), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/cache/invalidate', methods=['POST'])
+@admin_required
+def invalidate_cache():
+    """依鍵或標籤清除快取（所有 worker），all=true 時全部清空"""
+    try:
+        data = request.json or {}
+        if data.get('all'):
+            cache.clear()
+            return jsonify({'message': '快取已全部清除'}), 200
+
+        keys = data.get('keys') or []
+        tags = data.get('tags') or []
+        if not keys and not tags:
+            return jsonify({'error': '需要提供 keys 或 tags'}), 400
+        removed = cache.invalidate(keys=keys, tags=tags)
+        return jsonify({'message': f'已清除 {removed} 筆快取', 'removed': removed}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 背景工作相關API
+@admin_bp.route('/jobs', methods=['POST'])
+@admin_required
+def create_job():
+    """加入背景工作"""
+    try:
+        data = request.json or {}
+        kind = data.get('kind')
+        if kind not in HANDLERS:
+            return jsonify({'error': '無效的工作類型', 'kinds': sorted(HANDLERS)}), 400
+
+        job, created = enqueue(
+            kind,
+            data.get('payload') or {},
+            priority=int(data.get('priority', 0)),
+            dedup_key=data.get('dedup_key'),
+            max_attempts=int(data.get('max_attempts', 3))
+        )
+
+        return jsonify({
+            'message': '工作已加入佇列' if created else '相同的工作已在佇列中',
+            'job': job.to_dict()
+        }), 201 if created else 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs', methods=['GET'])
+@admin_required
+def get_jobs():
+    """獲取背景工作列表"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        status = request.args.get('status')
+        kind = request.args.get('kind')
+
+        query = Job.query
+        if status:
+            query = query.filter_by(status=status)
+        if kind:
+            query = query.filter_by(kind=kind)
+
+        jobs = query.order_by(Job.id.desc()).paginate(
+            page=page,
+            per_page=per_page,
+            error_out=False
+        )
+
+        return jsonify({
+            'jobs': [job.to_dict() for job in jobs.items],
+            'total': jobs.total,
+            'pages': jobs.pages,
+            'current_page': page,
+            'per_page': per_page
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@admin_required
+def get_job(job_id):
+    """獲取單個背景工作狀態與進度"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': '工作不存在'}), 404
+    return jsonify(job.to_dict()), 200
+
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@admin_required
+def cancel_job(job_id):
+    """取消尚未開始的背景工作"""
+    try:
+        cancelled = Job.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'cancelled', 'finished_at': datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+        if not cancelled:
+            return jsonify({'error': '工作不存在或已開始執行'}), 400
+        return jsonify({'message': '工作已取消'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/users/search', methods=['GET'])
 @admin_required
 def search_users():
-    """搜索用戶"""
+    """搜索用戶：名稱或電子郵件前綴優先，其次為中間包含關鍵字（不分大小寫）
+
+    capped=1 時不計算總數（count=1 時才計算），只返回是否還有下一頁，且最多翻到前 MAX_SEARCH_DEPTH 筆。
+    """
     try:
         query = request.args.get('q', '').strip()
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        capped = bool(request.args.get('capped', type=int))
         
         if not query:
             return jsonify({'error': '搜索關鍵字不能為空'}), 400
-        
-        users = User.query.filter(
-            (User.username.contains(query)) | 
-            (User.email.contains(query))
-        ).paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        return jsonify({
-            'users': [user.to_dict() for user in users.items],
-            'total': users.total,
-            'pages': users.pages,
+        if capped and page * per_page > MAX_SEARCH_DEPTH:
+            return jsonify({'error': f'最多只能瀏覽前 {MAX_SEARCH_DEPTH} 筆結果，請輸入更精確的關鍵字'}), 400
+
+        try:
+            fields = parse_fields(request.args.get('fields'), User)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        ids, has_more = search_user_ids(query, per_page, offset=(page - 1) * per_page)
+        users = {user.id: user for user in
+                 User.query.options(*field_options(User, fields)).filter(User.id.in_(ids))} if ids else {}
+        
+        result = {
+            'users': [users[user_id].to_dict(fields) for user_id in ids if user_id in users],
+            'has_more': has_more,
             'current_page': page,
             'per_page': per_page,
             'query': query
-        }), 200
+        }
+        if not capped or request.args.get('count', type=int):
+            total = count_matches(query)
+            result.update(total=total, pages=-(-total // per_page))
+        return jsonify(result), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -197,7 +455,10 @@ def bulk_user_action():
             current_user_id = session.get('user_id')
             users = [user for user in users if user.id != current_user_id]
             for user in users:
-                db.session.delete(user)
+                # 級聯刪除的筆記等資料在用戶所屬的分片
+                with shard_router.for_user(user.id):
+                    db.session.delete(user)
+                    db.session.flush()
         else:
             return jsonify({'error': '無效的操作類型'}), 400
         
@@ -0,0 +1,165 @@
+from datetime import datetime
+from flask import Blueprint, jsonify, request
+from src.models.user import db
+from src.models.alert import PriceAlert, AlertNotification, ALERT_DIRECTIONS, ALERT_STATUSES
+from src.models.watchlist import Watchlist
+from src.routes.auth import login_required, admin_required
+from src.services.alerts import alert_engine
+from src.utils.symbols import normalize_symbol
+
+alerts_bp = Blueprint('alerts', __name__)
+
+# 每位用戶同時有效的提醒數上限
+MAX_ACTIVE_ALERTS = 200
+# 單次送入的報價筆數上限
+MAX_TICKS = 10000
+
+@alerts_bp.route('/', methods=['GET'])
+@login_required
+def get_alerts():
+    """獲取用戶的價格提醒"""
+    try:
+        from flask import session
+        status = request.args.get('status')
+        if status and status not in ALERT_STATUSES:
+            return jsonify({'error': '無效的狀態'}), 400
+
+        query = PriceAlert.query.filter_by(user_id=session['user_id'])
+        if status:
+            query = query.filter_by(status=status)
+        alerts = query.order_by(PriceAlert.id.desc()).limit(500).all()
+        return jsonify({'alerts': [alert.to_dict() for alert in alerts]}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@alerts_bp.route('/', methods=['POST'])
+@login_required
+def create_alert():
+    """為自選股建立價格提醒，例如 TSM 向上穿越 100"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+        data = request.json or {}
+        direction = data.get('direction')
+        if direction not in ALERT_DIRECTIONS:
+            return jsonify({'error': 'direction 必須是 above 或 below'}), 400
+        try:
+            threshold = float(data.get('threshold'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'threshold 必須是數字'}), 400
+        if not threshold > 0:
+            return jsonify({'error': 'threshold 必須大於 0'}), 400
+
+        entry = Watchlist.query.filter_by(id=data.get('watchlist_id'), user_id=user_id).first()
+        if entry is None:
+            return jsonify({'error': '自選股不存在'}), 404
+
+        active = PriceAlert.query.filter_by(user_id=user_id, status='active').count()
+        if active >= MAX_ACTIVE_ALERTS:
+            return jsonify({'error': f'有效提醒最多 {MAX_ACTIVE_ALERTS} 個'}), 400
+
+        symbol_key, market_key = normalize_symbol(entry.stock_symbol, entry.market)
+        alert = PriceAlert(
+            user_id=user_id,
+            watchlist_id=entry.id,
+            symbol_key=symbol_key,
+            market_key=market_key,
+            direction=direction,
+            threshold=threshold
+        )
+        db.session.add(alert)
+        db.session.commit()
+
+        return jsonify({'message': '價格提醒已建立', 'alert': alert.to_dict()}), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@alerts_bp.route('/<int:alert_id>', methods=['DELETE'])
+@login_required
+def cancel_alert(alert_id):
+    """取消價格提醒（保留紀錄，引擎同步後自索引移除）"""
+    try:
+        from flask import session
+        alert = PriceAlert.query.filter_by(id=alert_id, user_id=session['user_id']).first()
+        if alert is None:
+            return jsonify({'error': '提醒不存在'}), 404
+        if alert.status != 'active':
+            return jsonify({'error': '提醒已觸發或已取消'}), 400
+
+        alert.status = 'cancelled'
+        db.session.commit()
+        return jsonify({'message': '價格提醒已取消'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@alerts_bp.route('/notifications', methods=['GET'])
+@login_required
+def get_notifications():
+    """獲取已觸發的提醒通知（新到舊），before 為上一頁最後一筆的 id"""
+    try:
+        from flask import session
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        before = request.args.get('before', type=int)
+        unread = request.args.get('unread', type=int) == 1
+
+        query = AlertNotification.query.filter_by(user_id=session['user_id'])
+        if before:
+            query = query.filter(AlertNotification.id < before)
+        if unread:
+            query = query.filter(AlertNotification.read_at.is_(None))
+        notifications = query.order_by(AlertNotification.id.desc()).limit(limit).all()
+
+        return jsonify({
+            'notifications': [item.to_dict() for item in notifications],
+            'next_before': notifications[-1].id if len(notifications) == limit else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@alerts_bp.route('/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """將通知標記為已讀（未提供 ids 時全部標記）"""
+    try:
+        from flask import session
+        ids = (request.json or {}).get('ids')
+        query = AlertNotification.query.filter(AlertNotification.user_id == session['user_id'],
+                                               AlertNotification.read_at.is_(None))
+        if ids:
+            query = query.filter(AlertNotification.id.in_(ids))
+        updated = query.update({'read_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        return jsonify({'message': f'已標記 {updated} 則通知為已讀', 'updated': updated}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@alerts_bp.route('/ticks', methods=['POST'])
+@admin_required
+def push_ticks():
+    """送入一批即時報價 [{symbol, market, price}]，觸發被穿越的價格提醒"""
+    try:
+        ticks = (request.json or {}).get('ticks') or []
+        if not ticks:
+            return jsonify({'error': 'ticks 為必填項'}), 400
+        if len(ticks) > MAX_TICKS:
+            return jsonify({'error': f'單次最多 {MAX_TICKS} 筆報價'}), 400
+        if any(not isinstance(tick, dict) or not tick.get('symbol') for tick in ticks):
+            return jsonify({'error': '每筆報價需要提供 symbol 與 price'}), 400
+        try:
+            quotes = [(tick['symbol'], tick.get('market'), float(tick['price'])) for tick in ticks]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': '每筆報價需要提供 symbol 與 price'}), 400
+
+        triggered = alert_engine.evaluate(quotes)
+        return jsonify({'processed': len(quotes), 'triggered': triggered}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, session
 from src.models.user import User, db
 from src.models.watchlist import SystemStats
+from src.utils.rate_limit import limiter, ip_key
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
@@ -27,6 +28,7 @@ def admin_required(f):
     return decorated_function
 
 @auth_bp.route('/register', methods=['POST'])
+@limiter.limit('5/hour', key_func=ip_key)
 def register():
     """用戶註冊"""
     try:
@@ -67,6 +69,7 @@ def register():
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@limiter.limit('10/minute', key_func=ip_key)
 def login():
     """用戶登入"""
     try:
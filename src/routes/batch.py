@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from flask import Blueprint, current_app, jsonify, request, session
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+batch_bp = Blueprint('batch', __name__)
+
+MAX_SUB_REQUESTS = 20
+MAX_WORKERS = 4
+ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+
+def _build_environ(sub_request):
+    """以主請求的環境為基礎建立子請求的 WSGI environ"""
+    parts = urlsplit(sub_request['path'])
+    builder = EnvironBuilder(
+        path=parts.path,
+        method=sub_request.get('method', 'GET').upper(),
+        query_string=parts.query or None,
+        json=sub_request.get('body'),
+        headers={'Accept-Encoding': 'identity'},
+        environ_base={'REMOTE_ADDR': request.remote_addr},
+    )
+    try:
+        return builder.get_environ()
+    finally:
+        builder.close()
+
+
+def _dispatch(app, environ, shared_session):
+    """在目前的應用上下文中執行一個子請求，共用已解碼的登入會話"""
+    ctx = app.request_context(environ)
+    # 預先設定 session，push 時就不會再解碼一次 cookie
+    ctx.session = shared_session
+    with ctx:
+        try:
+            # 只轉發到 API 藍圖，不落入前端頁面的 catch-all 路由
+            if request.blueprint is None:
+                rv = (jsonify({'error': '找不到該 API'}), 404)
+            else:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = app.dispatch_request()
+        except HTTPException as e:
+            rv = e
+        except Exception as e:
+            rv = (jsonify({'error': str(e)}), 500)
+        response = app.make_response(rv)
+
+    body = response.get_json(silent=True)
+    if body is None:
+        body = response.get_data(as_text=True)
+    return {'status': response.status_code, 'body': body}
+
+
+def _dispatch_isolated(app, environ, shared_session):
+    """並行執行時每個執行緒使用自己的應用上下文（即自己的資料庫會話）"""
+    with app.app_context():
+        return _dispatch(app, environ, shared_session)
+
+
+@batch_bp.route('/batch', methods=['POST'])
+def batch():
+    """批次請求：一次送出多個 API 呼叫，合併成一個回應"""
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'error': '需要提供 requests 列表'}), 400
+    if len(sub_requests) > MAX_SUB_REQUESTS:
+        return jsonify({'error': f'一次最多 {MAX_SUB_REQUESTS} 個子請求'}), 400
+
+    environs = []
+    for index, sub_request in enumerate(sub_requests):
+        if not isinstance(sub_request, dict) or not str(sub_request.get('path', '')).startswith('/api/'):
+            return jsonify({'error': f'第 {index + 1} 個子請求的路徑無效'}), 400
+        if urlsplit(sub_request['path']).path.rstrip('/') == '/api/batch':
+            return jsonify({'error': '不支援巢狀批次請求'}), 400
+        if sub_request.get('method', 'GET').upper() not in ALLOWED_METHODS:
+            return jsonify({'error': f'第 {index + 1} 個子請求的方法無效'}), 400
+        environs.append(_build_environ(sub_request))
+
+    app = current_app._get_current_object()
+    shared_session = session._get_current_object()
+    read_only = all(environ['REQUEST_METHOD'] == 'GET' for environ in environs)
+
+    if data.get('parallel') and read_only and len(environs) > 1:
+        # 只有純讀取的批次才並行執行，寫入一律依序執行以保持順序語意
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(environs))) as executor:
+            results = list(executor.map(
+                lambda environ: _dispatch_isolated(app, environ, shared_session), environs
+            ))
+    else:
+        # 依序執行時共用同一個應用上下文與資料庫會話
+        results = [_dispatch(app, environ, shared_session) for environ in environs]
+
+    for sub_request, result in zip(sub_requests, results):
+        if 'id' in sub_request:
+            result['id'] = sub_request['id']
+
+    return jsonify({'responses': results}), 200
@@ -0,0 +1,89 @@
+import math
+from flask import Blueprint, jsonify, request
+from src.routes.auth import login_required
+from src.services.indicators import indicator_engine, DEFAULT_PARAMS
+
+indicators_bp = Blueprint('indicators', __name__)
+
+# 單次批次請求的上限
+MAX_BATCH_SYMBOLS = 50
+MAX_BATCH_INDICATORS = 10
+
+
+def _serialize(result):
+    """NumPy 陣列轉為 JSON，暖機期的 NaN 轉為 null"""
+    if 'error' in result:
+        return result
+    return {
+        'ts': result['ts'].tolist(),
+        'params': result['params'],
+        'values': {
+            name: [None if math.isnan(value) else value for value in series.tolist()]
+            for name, series in result['values'].items()
+        }
+    }
+
+@indicators_bp.route('/<symbol>', methods=['GET'])
+@login_required
+def get_indicator(symbol):
+    """計算單一股票的技術指標（SMA/EMA/RSI/MACD/布林通道）"""
+    try:
+        indicator = request.args.get('indicator', 'sma').lower()
+        if indicator not in DEFAULT_PARAMS:
+            return jsonify({'error': '不支援的指標', 'indicators': sorted(DEFAULT_PARAMS)}), 400
+        params = {name: request.args[name] for name in DEFAULT_PARAMS[indicator] if name in request.args}
+
+        try:
+            result = indicator_engine.get(
+                symbol,
+                indicator,
+                params,
+                interval=request.args.get('interval', '1d'),
+                market=request.args.get('market'),
+                start=request.args.get('start'),
+                end=request.args.get('end')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        data = _serialize(result)
+        data.update({'symbol': symbol.upper(), 'indicator': indicator})
+        return jsonify(data), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@indicators_bp.route('/batch', methods=['POST'])
+@login_required
+def get_indicators_batch():
+    """批次計算多檔股票的多個指標"""
+    try:
+        data = request.json or {}
+        symbols = data.get('symbols') or []
+        indicators = data.get('indicators') or []
+
+        if not symbols or not indicators:
+            return jsonify({'error': 'symbols 和 indicators 為必填項'}), 400
+        if len(symbols) > MAX_BATCH_SYMBOLS or len(indicators) > MAX_BATCH_INDICATORS:
+            return jsonify({'error': '批次請求數量超過上限'}), 400
+        if any(not isinstance(spec, dict) or not spec.get('name') for spec in indicators):
+            return jsonify({'error': '每個指標需要提供 name'}), 400
+
+        results = indicator_engine.get_many(
+            symbols,
+            indicators,
+            interval=data.get('interval', '1d'),
+            start=data.get('start'),
+            end=data.get('end')
+        )
+
+        return jsonify({
+            'results': {
+                symbol: {label: _serialize(result) for label, result in symbol_results.items()}
+                for symbol, symbol_results in results.items()
+            },
+            'cache': indicator_engine.stats
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
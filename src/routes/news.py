@@ -0,0 +1,118 @@
+from datetime import datetime
+from flask import Blueprint, jsonify, request
+from src.models.user import db
+from src.models.news import NewsArticle
+from src.models.symbol import Symbol
+from src.routes.auth import login_required, admin_required
+from src.services.news_ingest import ingest_articles, attach_alternates
+from src.services.news_feed import read_feed
+from src.utils.pagination import encode_cursor, decode_cursor
+
+news_bp = Blueprint('news', __name__)
+
+# 單次匯入的文章數上限
+MAX_INGEST_ARTICLES = 500
+
+@news_bp.route('/', methods=['GET'])
+def get_news():
+    """獲取新聞列表（同一事件只列出代表文章，其他來源附在 alternates）"""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        try:
+            position = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        query = NewsArticle.query.filter(NewsArticle.canonical_id.is_(None))
+        if position:
+            published_at = datetime.fromisoformat(position[0])
+            query = query.filter(
+                (NewsArticle.published_at < published_at) |
+                ((NewsArticle.published_at == published_at) & (NewsArticle.id < position[1]))
+            )
+        articles = query.order_by(NewsArticle.published_at.desc(), NewsArticle.id.desc())\
+                        .limit(limit + 1).all()
+
+        page = articles[:limit]
+        next_cursor = None
+        if len(articles) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor([last.published_at.isoformat(), last.id])
+
+        return jsonify({
+            'news': attach_alternates(page),
+            'next_cursor': next_cursor
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@news_bp.route('/feed', methods=['GET'])
+@login_required
+def get_news_feed():
+    """獲取個人化新聞（依自選股與新聞收藏紀錄推送）"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        try:
+            cursor = decode_cursor(request.args.get('cursor')) or {}
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        entries, has_more, pull_all = read_feed(user_id, cursor.get('p'), limit, cursor.get('a', False))
+
+        articles = {article.id: article for article in
+                    NewsArticle.query.filter(NewsArticle.id.in_([entry[0] for entry in entries])).all()}
+        symbols = {symbol.id: symbol for symbol in
+                   Symbol.query.filter(Symbol.id.in_({entry[2] for entry in entries if entry[2]})).all()}
+        page = [articles[entry[0]] for entry in entries if entry[0] in articles]
+        items = attach_alternates(page)
+        reasons = {entry[0]: symbols.get(entry[2]) for entry in entries}
+        for item in items:
+            symbol = reasons.get(item['id'])
+            item['symbol'] = {'symbol': symbol.symbol_key, 'market': symbol.market_key,
+                              'name': symbol.name} if symbol else None
+
+        next_cursor = None
+        if has_more and entries:
+            last = entries[-1]
+            next_cursor = encode_cursor({'p': [last[1].isoformat(), last[0]], 'a': pull_all})
+
+        return jsonify({'news': items, 'next_cursor': next_cursor}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@news_bp.route('/ingest', methods=['POST'])
+@admin_required
+def ingest_news():
+    """批次匯入新聞，內容相近的文章自動歸入同一群組"""
+    try:
+        data = request.json or {}
+        items = data.get('articles') or []
+        if not items:
+            return jsonify({'error': 'articles 為必填項'}), 400
+        if len(items) > MAX_INGEST_ARTICLES:
+            return jsonify({'error': f'單次最多匯入 {MAX_INGEST_ARTICLES} 篇'}), 400
+        if any(not isinstance(item, dict) for item in items):
+            return jsonify({'error': '文章格式錯誤'}), 400
+
+        try:
+            result = ingest_articles(items)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({
+            'message': f"已匯入 {len(result['created'])} 篇，合併 {len(result['duplicates'])} 篇重複新聞",
+            'created': [article.id for article in result['created']],
+            'duplicates': [{'id': article.id, 'canonical_id': article.canonical_id,
+                            'similarity': article.similarity} for article in result['duplicates']],
+            'skipped': result['skipped']
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
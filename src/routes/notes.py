@@ -1,11 +1,31 @@
+from datetime import datetime
 from flask import Blueprint, jsonify, request
 from src.models.user import db
 from src.models.note import Note, Tag
+from src.models.news import NewsBookmark
+from src.models.revision import NoteRevision
+from src.models.archive import NoteArchive
+from src.models.sync import NoteTombstone, current_change_seq
 from src.models.watchlist import SystemStats
 from src.routes.auth import login_required
+from src.utils.rate_limit import limiter
+from src.utils.symbols import normalize_symbol
+from src.utils.pagination import encode_cursor, decode_cursor
+from src.utils.fields import parse_fields, field_options
+from src.services.symbol_linker import schedule_linking
+from src.services.tag_index import tag_index, parse_tag_expression
+from src.services.tag_registry import tag_registry
+from src.services.related_notes import related_notes
+from src.utils.bitmap import Bitmap
+from src.utils.revisions import (
+    append_revision, load_revision_content, diff_revisions, inline_changes
+)
 
 notes_bp = Blueprint('notes', __name__)
 
+# 相關筆記每次最多返回的筆數
+MAX_RELATED_NOTES = 50
+
 @notes_bp.route('/', methods=['GET'])
 @login_required
 def get_notes():
@@ -17,17 +37,47 @@ def get_notes():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         tag_id = request.args.get('tag_id', type=int)
+        tag_expression = request.args.get('tags', '').strip()
         stock_symbol = request.args.get('stock_symbol', '').strip()
+        try:
+            fields = parse_fields(request.args.get('fields'), Note)
+            tree = parse_tag_expression(tag_expression) if tag_expression else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        query = Note.query.filter_by(user_id=user_id)
-        
-        # 按標籤過濾
-        if tag_id:
-            query = query.filter(Note.tags.any(Tag.id == tag_id))
+        query = Note.query.filter_by(user_id=user_id)\
+                          .options(*field_options(Note, fields, relationships=('tags',)))
         
-        # 按股票代碼過濾
+        # 按股票代碼過濾（正規化後精確比對，走 user_id + symbol_key 索引）
         if stock_symbol:
-            query = query.filter(Note.stock_symbol.contains(stock_symbol))
+            symbol_key, _ = normalize_symbol(stock_symbol)
+            query = query.filter(Note.symbol_key == symbol_key)
+        
+        # 按標籤過濾：tags= 為標籤運算式（例如「財報 AND 風險 NOT 賣出」），在記憶體的位元圖索引上計算
+        if tag_id:
+            tree = ('and', tree, ('tag', tag_id)) if tree else ('tag', tag_id)
+        if tree:
+            within = None
+            if stock_symbol:
+                within = Bitmap.from_ids(row_id for (row_id,) in db.session.query(Note.id).filter(
+                    Note.user_id == user_id, Note.symbol_key == symbol_key))
+            try:
+                note_ids = tag_index.select(user_id, tree, within)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            # 位元圖結果已依建立時間排序，只載入當頁的筆記
+            page, per_page = max(page, 1), per_page if per_page > 0 else 20
+            page_ids = note_ids[(page - 1) * per_page:page * per_page].tolist()
+            by_id = {note.id: note for note in query.filter(Note.id.in_(page_ids))} if page_ids else {}
+            tag_registry.attach(list(by_id.values()), fields)
+            total = len(note_ids)
+            return jsonify({
+                'notes': [by_id[row_id].to_dict(fields) for row_id in page_ids if row_id in by_id],
+                'total': total,
+                'pages': -(-total // per_page),
+                'current_page': page,
+                'per_page': per_page
+            }), 200
         
         # 按創建時間倒序排列
         query = query.order_by(Note.created_at.desc())
@@ -37,9 +87,10 @@ def get_notes():
             per_page=per_page, 
             error_out=False
         )
+        tag_registry.attach(notes.items, fields)
         
         return jsonify({
-            'notes': [note.to_dict() for note in notes.items],
+            'notes': [note.to_dict(fields) for note in notes.items],
             'total': notes.total,
             'pages': notes.pages,
             'current_page': page,
@@ -73,15 +124,18 @@ def create_note():
         # 處理標籤
         tag_ids = data.get('tag_ids', [])
         if tag_ids:
-            tags = Tag.query.filter(Tag.id.in_(tag_ids)).all()
-            note.tags = tags
+            note.tags = tag_registry.get_many(tag_ids)
         
         db.session.add(note)
+        db.session.flush()
+        append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         db.session.commit()
         
         # 更新筆記統計
         SystemStats.increment_stat('total_notes')
+        schedule_linking()
         
+        tag_registry.attach([note])
         return jsonify({
             'message': '筆記創建成功',
             'note': note.to_dict()
@@ -103,7 +157,10 @@ def get_note(note_id):
         if not note:
             return jsonify({'error': '筆記不存在'}), 404
         
-        return jsonify(note.to_dict()), 200
+        tag_registry.attach([note])
+        data = note.to_dict()
+        data['linked_symbols'] = [symbol.to_dict() for symbol in note.linked_symbols]
+        return jsonify(data), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -121,6 +178,13 @@ def update_note(note_id):
             return jsonify({'error': '筆記不存在'}), 404
         
         data = request.json
+
+        # 已封存的筆記先移回筆記表
+        note.unarchive()
+
+        # 沒有版本歷史的舊筆記，先保存修改前的內容作為第一個版本
+        if note.revisions.first() is None:
+            append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         
         # 更新基本資訊
         if 'title' in data:
@@ -131,18 +195,21 @@ def update_note(note_id):
             note.stock_symbol = data['stock_symbol'].strip() or None
         if 'stock_name' in data:
             note.stock_name = data['stock_name'].strip() or None
+
+        if 'title' in data or 'content' in data:
+            append_revision(db.session, NoteRevision, note.id, note.title, note.content)
         
         # 更新標籤
         if 'tag_ids' in data:
-            tag_ids = data['tag_ids']
-            if tag_ids:
-                tags = Tag.query.filter(Tag.id.in_(tag_ids)).all()
-                note.tags = tags
-            else:
-                note.tags = []
+            # 先載入目前的標籤，替換集合時才不會延遲查詢 Tag
+            tag_registry.attach([note])
+            note.tags = tag_registry.get_many(data['tag_ids'] or [])
         
         db.session.commit()
+        if note.linked_at is None:
+            schedule_linking()
         
+        tag_registry.attach([note])
         return jsonify({
             'message': '筆記更新成功',
             'note': note.to_dict()
@@ -176,8 +243,132 @@ def delete_note(note_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# 版本歷史相關API
+@notes_bp.route('/<int:note_id>/revisions', methods=['GET'])
+@login_required
+def get_note_revisions(note_id):
+    """獲取筆記的版本列表"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        note = Note.query.filter_by(id=note_id, user_id=user_id).first()
+        if not note:
+            return jsonify({'error': '筆記不存在'}), 404
+
+        revisions = NoteRevision.query.filter_by(note_id=note_id)\
+                                      .options(db.defer(NoteRevision.data))\
+                                      .order_by(NoteRevision.revision.desc()).all()
+
+        return jsonify({
+            'note_id': note_id,
+            'revisions': [revision.to_dict() for revision in revisions],
+            'total': len(revisions)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/<int:note_id>/revisions/<int:revision>', methods=['GET'])
+@login_required
+def get_note_revision(note_id, revision):
+    """獲取筆記的指定版本內容"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        note = Note.query.filter_by(id=note_id, user_id=user_id).first()
+        if not note:
+            return jsonify({'error': '筆記不存在'}), 404
+
+        row = NoteRevision.query.filter_by(note_id=note_id, revision=revision)\
+                                .options(db.defer(NoteRevision.data)).first()
+        content = load_revision_content(NoteRevision, note_id, revision) if row else None
+        if content is None:
+            return jsonify({'error': '版本不存在'}), 404
+
+        result = row.to_dict()
+        result['content'] = content
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/<int:note_id>/revisions/diff', methods=['GET'])
+@login_required
+def diff_note_revisions(note_id):
+    """比較筆記的兩個版本"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        from_revision = request.args.get('from', type=int)
+        to_revision = request.args.get('to', type=int)
+        if not from_revision or not to_revision:
+            return jsonify({'error': '需要提供 from 和 to 版本號'}), 400
+
+        note = Note.query.filter_by(id=note_id, user_id=user_id).first()
+        if not note:
+            return jsonify({'error': '筆記不存在'}), 404
+
+        rows = {row.revision: row for row in NoteRevision.query.filter(
+            NoteRevision.note_id == note_id,
+            NoteRevision.revision.in_([from_revision, to_revision])
+        ).options(db.defer(NoteRevision.data)).all()}
+        if from_revision not in rows or to_revision not in rows:
+            return jsonify({'error': '版本不存在'}), 404
+
+        old_content = load_revision_content(NoteRevision, note_id, from_revision)
+        new_content = load_revision_content(NoteRevision, note_id, to_revision)
+
+        return jsonify({
+            'note_id': note_id,
+            'from': rows[from_revision].to_dict(),
+            'to': rows[to_revision].to_dict(),
+            'title_changed': rows[from_revision].title != rows[to_revision].title,
+            'diff': diff_revisions(old_content, new_content,
+                                   f'revision {from_revision}', f'revision {to_revision}'),
+            'changes': inline_changes(old_content, new_content)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/<int:note_id>/related', methods=['GET'])
+@login_required
+def get_related_notes(note_id):
+    """獲取內容相似的筆記（只在自己的筆記中推薦）"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        limit = min(max(request.args.get('limit', 5, type=int), 1), MAX_RELATED_NOTES)
+        try:
+            fields = parse_fields(request.args.get('fields'), Note)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if not db.session.query(Note.query.filter_by(id=note_id, user_id=user_id).exists()).scalar():
+            return jsonify({'error': '筆記不存在'}), 404
+
+        scores = dict(related_notes.related(user_id, note_id, limit))
+        notes = Note.query.filter(Note.id.in_(list(scores)), Note.user_id == user_id)\
+                          .options(*field_options(Note, fields, relationships=('tags',))).all()
+        notes.sort(key=lambda note: -scores[note.id])
+        tag_registry.attach(notes, fields)
+
+        return jsonify({
+            'note_id': note_id,
+            'related': [dict(note.to_dict(fields), score=scores[note.id]) for note in notes]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @notes_bp.route('/search', methods=['GET'])
 @login_required
+@limiter.limit('30/minute', burst=10)
+@limiter.shed(max_in_flight=8, retry_after=2)
 def search_notes():
     """搜索筆記"""
     try:
@@ -190,11 +381,18 @@ def search_notes():
         
         if not query:
             return jsonify({'error': '搜索關鍵字不能為空'}), 400
+
+        try:
+            fields = parse_fields(request.args.get('fields'), Note)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        notes = Note.query.filter(
+        notes = Note.query.options(*field_options(Note, fields, relationships=('tags',))).filter(
             Note.user_id == user_id,
             (Note.title.contains(query)) | 
             (Note.content.contains(query)) |
+            # 已封存筆記的內容在封存表，解壓縮後比對
+            (Note.archived_at.isnot(None) & Note.archive.has(db.func.unpack_text(NoteArchive.data).contains(query))) |
             (Note.stock_symbol.contains(query)) |
             (Note.stock_name.contains(query))
         ).order_by(Note.created_at.desc()).paginate(
@@ -202,9 +400,10 @@ def search_notes():
             per_page=per_page, 
             error_out=False
         )
+        tag_registry.attach(notes.items, fields)
         
         return jsonify({
-            'notes': [note.to_dict() for note in notes.items],
+            'notes': [note.to_dict(fields) for note in notes.items],
             'total': notes.total,
             'pages': notes.pages,
             'current_page': page,
@@ -224,13 +423,151 @@ def get_recent_notes():
         user_id = session['user_id']
         
         limit = request.args.get('limit', 5, type=int)
+        try:
+            fields = parse_fields(request.args.get('fields'), Note)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         notes = Note.query.filter_by(user_id=user_id)\
+                         .options(*field_options(Note, fields, relationships=('tags',)))\
                          .order_by(Note.created_at.desc())\
                          .limit(limit).all()
+        tag_registry.attach(notes, fields)
+        
+        return jsonify([note.to_dict(fields) for note in notes]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@notes_bp.route('/changes', methods=['GET'])
+@login_required
+def get_note_changes():
+    """增量同步：返回 since 代表的序號之後新增、修改或刪除的筆記"""
+    try:
+        from flask import session
+        user_id = session['user_id']
         
-        return jsonify([note.to_dict() for note in notes]), 200
+        limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+        try:
+            fields = parse_fields(request.args.get('fields'), Note)
+            token = decode_cursor(request.args.get('since')) or {'u': user_id, 's': 0}
+            if not isinstance(token, dict) or token.get('u') != user_id or not isinstance(token.get('s'), int):
+                raise ValueError('無效的同步標記')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        since = token['s']
+        
+        # 沒有新變更時只需一次主鍵查詢，與筆記數量無關
+        if current_change_seq(user_id) <= since:
+            return jsonify({'changes': [], 'deleted': [], 'token': encode_cursor(token), 'has_more': False}), 200
+        
+        notes = Note.query.filter(Note.user_id == user_id, Note.change_seq > since)\
+                          .options(*field_options(Note, fields, relationships=('tags',)))\
+                          .order_by(Note.change_seq).limit(limit + 1).all()
+        tombstones = NoteTombstone.query.filter(NoteTombstone.user_id == user_id, NoteTombstone.change_seq > since)\
+                                        .order_by(NoteTombstone.change_seq).limit(limit + 1).all()
+        
+        # 依序號合併兩邊的變更，只取前 limit 筆，下一個標記停在最後一筆的序號
+        merged = sorted(notes + tombstones, key=lambda item: item.change_seq)
+        has_more = len(merged) > limit
+        merged = merged[:limit]
+        tag_registry.attach([item for item in merged if isinstance(item, Note)], fields)
+        last_seq = merged[-1].change_seq if merged else since
         
+        return jsonify({
+            'changes': [item.to_dict(fields) for item in merged if isinstance(item, Note)],
+            'deleted': [item.to_dict() for item in merged if isinstance(item, NoteTombstone)],
+            'token': encode_cursor({'u': user_id, 's': last_seq}),
+            'has_more': has_more
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _feed_position(value):
+    """解析游標中單一來源的位置：None 從頭讀取、False 已讀完，否則返回 (created_at, id)"""
+    if value is None or value is False:
+        return value
+    if not (isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+            and isinstance(value[1], int) and not isinstance(value[1], bool)):
+        raise ValueError('無效的分頁游標')
+    return datetime.fromisoformat(value[0]), value[1]
+
+def _feed_page(model, user_id, symbol_key, market_key, position, limit, options=()):
+    """沿著 (user_id, symbol_key, created_at, id) 索引取得游標之後的一頁"""
+    query = model.query.options(*options).filter(model.user_id == user_id, model.symbol_key == symbol_key)
+    if market_key:
+        query = query.filter(model.market_key == market_key)
+    if position:
+        created_at, row_id = position
+        query = query.filter(
+            (model.created_at < created_at) |
+            ((model.created_at == created_at) & (model.id < row_id))
+        )
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+@notes_bp.route('/symbols/<symbol>/feed', methods=['GET'])
+@login_required
+def get_symbol_feed(symbol):
+    """獲取單一股票的筆記與新聞收藏（游標分頁）"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        symbol_key, market_key = normalize_symbol(symbol, request.args.get('market'))
+        if not request.args.get('market'):
+            market_key = None
+
+        try:
+            cursor = decode_cursor(request.args.get('cursor')) or {}
+            if not isinstance(cursor, dict):
+                raise ValueError('無效的分頁游標')
+            positions = {key: _feed_position(cursor.get(key)) for key in ('n', 'b')}
+            fields = parse_fields(request.args.get('fields'), Note)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # 排序與游標需要 created_at
+        note_options = field_options(Note, fields | {'created_at'} if fields is not None else None,
+                                     relationships=('tags',))
+
+        # 兩個來源各自沿索引讀取，合併後依時間倒序截取一頁
+        streams = {}
+        if positions['n'] is not False:
+            streams['n'] = [('note', row) for row in
+                            _feed_page(Note, user_id, symbol_key, market_key, positions['n'], limit,
+                                       note_options)]
+        if positions['b'] is not False:
+            streams['b'] = [('news', row) for row in
+                            _feed_page(NewsBookmark, user_id, symbol_key, market_key, positions['b'], limit)]
+
+        merged = sorted(
+            (item + (key,) for key, items in streams.items() for item in items),
+            key=lambda item: (item[1].created_at or datetime.min, item[1].id),
+            reverse=True
+        )
+        page = merged[:limit]
+        tag_registry.attach([row for kind, row, _ in page if kind == 'note'], fields)
+
+        next_cursor = dict(cursor)
+        for key, items in streams.items():
+            consumed = [row for kind, row, source in page if source == key]
+            if consumed:
+                last = consumed[-1]
+                next_cursor[key] = [last.created_at.isoformat(), last.id]
+            if len(consumed) == len(items):
+                # 此來源已全部讀完
+                next_cursor[key] = False
+        has_more = len(merged) > limit
+
+        return jsonify({
+            'symbol': symbol_key,
+            'market': market_key,
+            'items': [{'type': kind, 'item': row.to_dict(fields) if kind == 'note' else row.to_dict()}
+                      for kind, row, _ in page],
+            'next_cursor': encode_cursor(next_cursor) if has_more else None
+        }), 200
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -240,8 +577,7 @@ def get_recent_notes():
 def get_tags():
     """獲取所有標籤"""
     try:
-        tags = Tag.query.all()
-        return jsonify([tag.to_dict() for tag in tags]), 200
+        return jsonify([tag.to_dict() for tag in tag_registry.all()]), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -267,6 +603,7 @@ def create_tag():
         
         db.session.add(tag)
         db.session.commit()
+        tag_registry.invalidate()
         
         return jsonify({
             'message': '標籤創建成功',
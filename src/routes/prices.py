@@ -0,0 +1,87 @@
+from flask import Blueprint, jsonify, request
+from src.routes.auth import login_required, admin_required
+from src.services.price_store import price_store, COLUMNS
+from src.utils.cache import cache
+from src.services.alerts import schedule_evaluation
+
+prices_bp = Blueprint('prices', __name__)
+
+@prices_bp.route('/', methods=['GET'])
+@login_required
+def get_price_index():
+    """獲取已儲存的價格序列列表"""
+    try:
+        return jsonify(price_store.index()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def price_tags(symbol):
+    return ('prices', f'prices:{symbol.upper()}')
+
+@prices_bp.route('/<symbol>', methods=['GET'])
+@login_required
+@cache.cached(ttl=300, tags=price_tags)
+def get_prices(symbol):
+    """獲取股票的 OHLCV 歷史"""
+    try:
+        interval = request.args.get('interval', '1d')
+        columns = request.args.get('columns')
+        columns = tuple(name for name in columns.split(',') if name in COLUMNS) if columns else None
+        if columns and 'ts' not in columns:
+            columns = ('ts',) + columns
+
+        try:
+            bars = price_store.get_range(
+                symbol,
+                interval,
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                market=request.args.get('market'),
+                columns=columns
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({
+            'symbol': symbol.upper(),
+            'interval': interval,
+            'count': len(bars['ts']),
+            'bars': {name: values.tolist() for name, values in bars.items()}
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@prices_bp.route('/<symbol>/import', methods=['POST'])
+@admin_required
+def import_prices(symbol):
+    """以 CSV 批次匯入價格歷史（上傳檔案 file 或直接以請求內容傳送）"""
+    try:
+        interval = request.args.get('interval', '1d')
+        replace = request.args.get('replace', type=int) == 1
+        upload = request.files.get('file')
+        source = upload.read() if upload else request.get_data()
+        if not source:
+            return jsonify({'error': '需要提供 CSV 內容'}), 400
+
+        try:
+            loaded = price_store.load_csv(symbol, source, interval,
+                                          market=request.args.get('market'), replace=replace)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        cache.invalidate(tags=price_tags(symbol))
+
+        # 最新收盤價視為一筆報價，排入背景工作觸發價格提醒（提醒判斷失敗不影響已完成的匯入）
+        market = request.args.get('market')
+        last_bar = price_store.last_bar(symbol, interval, market) if loaded else None
+        if last_bar is not None:
+            schedule_evaluation([(symbol, market, last_bar['close'])])
+
+        return jsonify({
+            'message': '價格資料匯入成功',
+            'loaded': loaded,
+            'count': price_store.count(symbol, interval, request.args.get('market'))
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
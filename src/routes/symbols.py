@@ -0,0 +1,127 @@
+from flask import Blueprint, jsonify, request
+from src.models.user import db
+from src.models.note import Note, note_symbols
+from src.models.news import NewsBookmark, news_bookmark_symbols
+from src.models.symbol import Symbol
+from src.routes.auth import login_required, admin_required
+from src.services.symbol_linker import symbol_linker, schedule_linking
+from src.utils.symbols import normalize_symbol
+from src.utils.fields import field_options
+from src.utils.cache import cache
+
+symbols_bp = Blueprint('symbols', __name__)
+
+# 單次匯入的主檔筆數上限
+MAX_IMPORT_SYMBOLS = 5000
+
+@symbols_bp.route('/', methods=['GET'])
+@login_required
+@cache.cached(ttl=600, tags=('symbols',))
+def get_symbols():
+    """查詢股票主檔（代碼或名稱）"""
+    try:
+        keyword = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', 50, type=int), 200)
+
+        query = Symbol.query.filter_by(is_active=True)
+        if keyword:
+            pattern = f'%{keyword}%'
+            query = query.filter(db.or_(
+                Symbol.symbol_key.like(f'{keyword.upper()}%'),
+                Symbol.name.ilike(pattern),
+                Symbol.aliases.ilike(pattern)
+            ))
+
+        symbols = query.order_by(Symbol.market_key, Symbol.symbol_key).limit(limit).all()
+        return jsonify({'symbols': [symbol.to_dict() for symbol in symbols]}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@symbols_bp.route('/import', methods=['POST'])
+@admin_required
+def import_symbols():
+    """批次新增或更新股票主檔，完成後重新辨識所有筆記與新聞"""
+    try:
+        data = request.json or {}
+        items = data.get('symbols') or []
+        if not items:
+            return jsonify({'error': 'symbols 為必填項'}), 400
+        if len(items) > MAX_IMPORT_SYMBOLS:
+            return jsonify({'error': f'單次最多匯入 {MAX_IMPORT_SYMBOLS} 筆'}), 400
+        if any(not isinstance(item, dict) or not item.get('symbol') for item in items):
+            return jsonify({'error': '每筆資料需要提供 symbol'}), 400
+
+        for item in items:
+            Symbol.upsert(
+                item['symbol'],
+                market=item.get('market'),
+                name=item.get('name'),
+                aliases=item.get('aliases'),
+                is_active=item.get('is_active', True)
+            )
+        db.session.commit()
+        cache.invalidate(tags='symbols')
+
+        symbol_linker.reset()
+        job = schedule_linking(delay=0)
+
+        return jsonify({
+            'message': f'已匯入 {len(items)} 筆股票主檔',
+            'total': Symbol.query.count(),
+            'job': job.to_dict()
+        }), 200
+
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@symbols_bp.route('/relink', methods=['POST'])
+@admin_required
+def relink_symbols():
+    """重新辨識所有筆記與新聞提及的股票"""
+    try:
+        symbol_linker.reset()
+        job = schedule_linking(delay=0)
+        return jsonify({'message': '已排入重新辨識', 'job': job.to_dict()}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@symbols_bp.route('/<symbol>/mentions', methods=['GET'])
+@login_required
+def get_symbol_mentions(symbol):
+    """獲取提及某檔股票的筆記與新聞收藏（依自動辨識結果）"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+        limit = min(request.args.get('limit', 20, type=int), 100)
+
+        symbol_key, market_key = normalize_symbol(symbol, request.args.get('market'))
+        record = Symbol.query.filter_by(symbol_key=symbol_key, market_key=market_key).first()
+        if record is None:
+            return jsonify({'error': '股票不存在'}), 404
+
+        fields = {'id', 'title', 'excerpt', 'stock_symbol', 'market', 'created_at', 'updated_at'}
+        notes = Note.query.join(note_symbols, note_symbols.c.note_id == Note.id)\
+                          .options(*field_options(Note, fields))\
+                          .filter(note_symbols.c.symbol_id == record.id, Note.user_id == user_id)\
+                          .order_by(Note.created_at.desc()).limit(limit).all()
+        bookmarks = NewsBookmark.query.join(news_bookmark_symbols,
+                                            news_bookmark_symbols.c.news_bookmark_id == NewsBookmark.id)\
+                                      .filter(news_bookmark_symbols.c.symbol_id == record.id,
+                                              NewsBookmark.user_id == user_id)\
+                                      .order_by(NewsBookmark.created_at.desc()).limit(limit).all()
+
+        return jsonify({
+            'symbol': record.to_dict(),
+            'notes': [note.to_dict(fields) for note in notes],
+            'news_bookmarks': [bookmark.to_dict() for bookmark in bookmarks]
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from src.models.user import User, db
+from src.utils.sharding import shard_router
 
 user_bp = Blueprint('user', __name__)
 
@@ -34,6 +35,7 @@ def update_user(user_id):
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
+    with shard_router.for_user(user.id):
+        db.session.delete(user)
+        db.session.commit()
     return '', 204
@@ -0,0 +1,44 @@
+from flask import Blueprint, jsonify, request
+from src.models.watchlist import Watchlist
+from src.routes.auth import login_required
+from src.services.portfolio import portfolio_analytics
+
+watchlist_bp = Blueprint('watchlist', __name__)
+
+# 單次分析的股票數上限
+MAX_ANALYTICS_SYMBOLS = 500
+
+@watchlist_bp.route('/analytics', methods=['GET'])
+@login_required
+def get_watchlist_analytics():
+    """自選股組合分析：相關係數矩陣、年化波動率、Beta 與最大回撤"""
+    try:
+        from flask import session
+        user_id = session['user_id']
+
+        # 依代碼排序，讓相同股票集合得到相同的快取鍵
+        rows = Watchlist.query.with_entities(Watchlist.stock_symbol, Watchlist.market)\
+                              .filter_by(user_id=user_id)\
+                              .order_by(Watchlist.stock_symbol, Watchlist.market).all()
+        if not rows:
+            return jsonify({'error': '自選股清單為空'}), 400
+        if len(rows) > MAX_ANALYTICS_SYMBOLS:
+            return jsonify({'error': f'自選股超過 {MAX_ANALYTICS_SYMBOLS} 檔，無法分析'}), 400
+
+        benchmark = request.args.get('benchmark', '').strip() or None
+        try:
+            result = portfolio_analytics.analyze(
+                [(row.stock_symbol, row.market) for row in rows],
+                benchmark=benchmark,
+                interval=request.args.get('interval', '1d'),
+                start=request.args.get('start'),
+                end=request.args.get('end')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        result['cache'] = portfolio_analytics.stats
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,287 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.models.user import db
+from src.models.alert import PriceAlert, AlertNotification, alert_last_prices
+from src.services.jobs import enqueue, job_handler
+from src.utils.symbols import normalize_symbol
+
+# 增量同步時往前多看的秒數，涵蓋較早開始但較晚提交的交易（重複套用不影響結果）
+SYNC_OVERLAP_SECONDS = 5
+# 觸發時每批更新的提醒筆數（SQLite 參數數量限制）
+TRIGGER_BATCH_SIZE = 500
+# 寄件匣每批投遞的通知筆數
+OUTBOX_BATCH_SIZE = 500
+# 觸發後稍等片刻再投遞，讓同一段時間的通知合併成一批
+DELIVERY_DELAY = 1
+
+# 通知投遞管道：函式接收一批 AlertNotification，拋出例外時整批稍後重試
+ALERT_CHANNELS = []
+
+
+def alert_channel(f):
+    """註冊價格提醒的投遞管道（例如推播或電子郵件）"""
+    ALERT_CHANNELS.append(f)
+    return f
+
+
+class ThresholdBook:
+    """單一股票的門檻索引：above 與 below 各自以門檻排序的平行陣列（門檻、提醒 id）
+
+    報價從 previous 變為 price 時，被穿越的門檻在排序陣列中是連續的一段，
+    以二分搜尋找出區間，成本為 O(log n + 觸發筆數)。
+    """
+
+    __slots__ = ('thresholds', 'ids')
+
+    def __init__(self):
+        self.thresholds = {'above': array('d'), 'below': array('d')}
+        self.ids = {'above': array('q'), 'below': array('q')}
+
+    def __len__(self):
+        return len(self.ids['above']) + len(self.ids['below'])
+
+    def append(self, direction, threshold, alert_id):
+        """依序載入時使用，呼叫端需保證門檻遞增"""
+        self.thresholds[direction].append(threshold)
+        self.ids[direction].append(alert_id)
+
+    def add(self, direction, threshold, alert_id):
+        thresholds = self.thresholds[direction]
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        self.ids[direction].insert(position, alert_id)
+
+    def remove(self, direction, threshold, alert_id):
+        thresholds, ids = self.thresholds[direction], self.ids[direction]
+        position = bisect_left(thresholds, threshold)
+        while position < len(thresholds) and thresholds[position] == threshold:
+            if ids[position] == alert_id:
+                del thresholds[position]
+                del ids[position]
+                return True
+            position += 1
+        return False
+
+    def _take(self, direction, lo, hi):
+        if lo >= hi:
+            return []
+        thresholds, ids = self.thresholds[direction], self.ids[direction]
+        crossed = list(zip(ids[lo:hi], thresholds[lo:hi]))
+        # 提醒只觸發一次，直接自索引移除
+        del thresholds[lo:hi]
+        del ids[lo:hi]
+        return [(alert_id, direction, threshold) for alert_id, threshold in crossed]
+
+    def crossed(self, previous, price):
+        """取出並返回報價由 previous 變為 price 時穿越的提醒 [(id, 方向, 門檻)]"""
+        if price > previous:
+            # 向上穿越：previous < 門檻 <= price
+            thresholds = self.thresholds['above']
+            return self._take('above', bisect_right(thresholds, previous), bisect_right(thresholds, price))
+        if price < previous:
+            # 向下穿越：price <= 門檻 < previous
+            thresholds = self.thresholds['below']
+            return self._take('below', bisect_left(thresholds, price), bisect_left(thresholds, previous))
+        return []
+
+
+class AlertEngine:
+    """價格提醒引擎：每個行程在記憶體中保存所有有效提醒的門檻索引
+
+    規則依 updated_at 增量同步；報價的前一筆價格存放在資料庫，讓不同 worker
+    處理同一檔股票的連續報價時結果一致。觸發結果寫入通知寄件匣後由背景工作投遞。
+    """
+
+    def __init__(self):
+        self._books = {}
+        self._watermark = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return sum(len(book) for book in self._books.values())
+
+    def _book(self, key):
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = ThresholdBook()
+        return book
+
+    def load(self):
+        """重新載入所有有效提醒（依股票、方向、門檻排序後直接追加）"""
+        books = {}
+        watermark = db.session.query(db.func.max(PriceAlert.updated_at)).scalar()
+        rows = db.session.query(PriceAlert.id, PriceAlert.symbol_key, PriceAlert.market_key,
+                                PriceAlert.direction, PriceAlert.threshold)\
+                         .filter(PriceAlert.status == 'active')\
+                         .order_by(PriceAlert.symbol_key, PriceAlert.market_key,
+                                   PriceAlert.direction, PriceAlert.threshold, PriceAlert.id)\
+                         .yield_per(10000)
+        for alert_id, symbol_key, market_key, direction, threshold in rows:
+            key = (symbol_key, market_key)
+            book = books.get(key)
+            if book is None:
+                book = books[key] = ThresholdBook()
+            book.append(direction, threshold, alert_id)
+        self._books = books
+        self._watermark = watermark or datetime.min
+
+    def sync(self):
+        """套用上次同步後新增、取消或觸發的提醒"""
+        if self._watermark is None:
+            self.load()
+            return
+        since = self._watermark - timedelta(seconds=SYNC_OVERLAP_SECONDS) \
+            if self._watermark > datetime.min + timedelta(seconds=SYNC_OVERLAP_SECONDS) else datetime.min
+        rows = db.session.query(PriceAlert.id, PriceAlert.symbol_key, PriceAlert.market_key,
+                                PriceAlert.direction, PriceAlert.threshold, PriceAlert.status,
+                                PriceAlert.updated_at)\
+                         .filter(PriceAlert.updated_at >= since).all()
+        for alert_id, symbol_key, market_key, direction, threshold, status, updated_at in rows:
+            book = self._book((symbol_key, market_key))
+            book.remove(direction, threshold, alert_id)
+            if status == 'active':
+                book.add(direction, threshold, alert_id)
+            if updated_at and updated_at > self._watermark:
+                self._watermark = updated_at
+
+    def reset(self):
+        with self._lock:
+            self._books = {}
+            self._watermark = None
+
+    def evaluate(self, ticks, now=None):
+        """處理一批報價 [(symbol, market, price)]，返回新寫入寄件匣的通知數
+
+        同一檔股票的多筆報價依序處理；第一次看到的股票只記錄價格，不觸發。
+        """
+        now = now or datetime.utcnow()
+        quotes = []
+        for symbol, market, price in ticks:
+            key = normalize_symbol(symbol, market)
+            if key[0] and price is not None:
+                quotes.append((key, float(price)))
+        if not quotes:
+            return 0
+
+        with self._lock:
+            try:
+                self.sync()
+                keys = {key for key, _ in quotes}
+                last_prices = {
+                    (row.symbol_key, row.market_key): row.price
+                    for row in db.session.execute(
+                        db.select(alert_last_prices).where(
+                            db.tuple_(alert_last_prices.c.symbol_key, alert_last_prices.c.market_key).in_(keys)
+                        )
+                    )
+                }
+                crossed = {}
+                for key, price in quotes:
+                    previous = last_prices.get(key)
+                    book = self._books.get(key)
+                    if previous is not None and book is not None:
+                        for alert_id, _, _ in book.crossed(previous, price):
+                            crossed[alert_id] = price
+                    last_prices[key] = price
+
+                upsert = sqlite_insert(alert_last_prices)
+                db.session.execute(
+                    upsert.on_conflict_do_update(
+                        index_elements=['symbol_key', 'market_key'],
+                        set_={'price': upsert.excluded.price, 'updated_at': upsert.excluded.updated_at}
+                    ),
+                    [{'symbol_key': key[0], 'market_key': key[1], 'price': last_prices[key], 'updated_at': now}
+                     for key in keys]
+                )
+                created = self._trigger(crossed, now)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # 索引已移除的提醒尚未寫回資料庫，下次重新載入
+                self._watermark = None
+                raise
+
+        if created:
+            schedule_delivery()
+        return created
+
+    def _trigger(self, crossed, now):
+        created = 0
+        alert_ids = list(crossed)
+        for start in range(0, len(alert_ids), TRIGGER_BATCH_SIZE):
+            batch = alert_ids[start:start + TRIGGER_BATCH_SIZE]
+            # 已取消、已刪除或已由其他 worker 觸發的提醒略過
+            alerts = db.session.query(PriceAlert.id, PriceAlert.user_id, PriceAlert.symbol_key,
+                                      PriceAlert.market_key, PriceAlert.direction, PriceAlert.threshold)\
+                               .filter(PriceAlert.id.in_(batch), PriceAlert.status == 'active').all()
+            if not alerts:
+                continue
+            db.session.execute(
+                PriceAlert.__table__.update()
+                .where(PriceAlert.id == db.bindparam('alert_id'), PriceAlert.status == 'active')
+                .values(status='triggered', triggered_price=db.bindparam('price'),
+                        triggered_at=now, updated_at=now),
+                [{'alert_id': alert.id, 'price': crossed[alert.id]} for alert in alerts]
+            )
+            result = db.session.execute(
+                AlertNotification.__table__.insert().prefix_with('OR IGNORE'),
+                [{
+                    'alert_id': alert.id,
+                    'user_id': alert.user_id,
+                    'symbol_key': alert.symbol_key,
+                    'market_key': alert.market_key,
+                    'direction': alert.direction,
+                    'threshold': alert.threshold,
+                    'price': crossed[alert.id],
+                    'created_at': now
+                } for alert in alerts]
+            )
+            created += result.rowcount
+        return created
+
+
+alert_engine = AlertEngine()
+
+
+def schedule_evaluation(ticks):
+    """排入一批報價 [(symbol, market, price)] 的提醒判斷，不在請求中執行（例如匯入價格後）"""
+    job, _ = enqueue('evaluate_alerts', {'ticks': [[symbol, market, price] for symbol, market, price in ticks]},
+                     priority=1)
+    return job
+
+
+@job_handler('evaluate_alerts')
+def evaluate_alerts_job(ctx):
+    created = alert_engine.evaluate([tuple(tick) for tick in ctx.payload.get('ticks', ())])
+    return {'created': created}
+
+
+def schedule_delivery(delay=DELIVERY_DELAY):
+    """排入通知投遞工作；已有排隊中的工作時合併處理"""
+    job, _ = enqueue('deliver_alerts', priority=1, dedup_key='deliver_alerts', delay=delay)
+    return job
+
+
+@job_handler('deliver_alerts')
+def deliver_alerts_job(ctx):
+    """分批投遞寄件匣中尚未投遞的通知，每批成功後才標記為已投遞"""
+    delivered = 0
+    while True:
+        batch = AlertNotification.query.filter(AlertNotification.delivered_at.is_(None))\
+                                       .order_by(AlertNotification.id).limit(OUTBOX_BATCH_SIZE).all()
+        if not batch:
+            break
+        for channel in ALERT_CHANNELS:
+            channel(batch)
+        AlertNotification.query.filter(AlertNotification.id.in_([item.id for item in batch]))\
+                               .update({'delivered_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        delivered += len(batch)
+        ctx.report(0, message=f'已投遞 {delivered} 筆通知')
+    return {'delivered': delivered}
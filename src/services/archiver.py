@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.models.note import Note
+from src.models.archive import NoteArchive
+from src.services.jobs import enqueue, job_handler
+from src.utils.sharding import shard_router, use_shard, merge_scalars
+
+# 超過這麼多天未修改的筆記移到封存表
+ARCHIVE_AFTER_DAYS = 180
+# 封存工作的執行間隔（秒）
+ARCHIVE_INTERVAL = 24 * 3600
+ARCHIVE_BATCH_SIZE = 500
+
+
+def archive_batch(cutoff, after_id=0, batch_size=ARCHIVE_BATCH_SIZE):
+    """封存 id 大於 after_id 的一批冷筆記，返回 (最後檢查的 id, 封存筆數)
+
+    只處理已完成股票辨識的筆記；讀取後又被修改的筆記保持原狀，留給下一輪。
+    """
+    table = Note.__table__
+    rows = db.session.execute(
+        db.select(table.c.id, table.c.content, table.c.updated_at)
+        .where(table.c.id > after_id,
+               table.c.archived_at.is_(None),
+               table.c.linked_at.isnot(None),
+               table.c.updated_at < cutoff)
+        .order_by(table.c.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None, 0
+
+    now = datetime.utcnow()
+    ids = [row.id for row in rows]
+    db.session.execute(
+        table.update()
+        .where(table.c.id == db.bindparam('row_id'),
+               table.c.updated_at.is_not_distinct_from(db.bindparam('seen_updated_at')),
+               table.c.archived_at.is_(None))
+        .values(content='', archived_at=now, updated_at=table.c.updated_at),
+        [{'row_id': row.id, 'seen_updated_at': row.updated_at} for row in rows]
+    )
+    archived = {row_id for (row_id,) in db.session.execute(
+        db.select(table.c.id).where(table.c.id.in_(ids), table.c.archived_at == now)
+    )}
+    if archived:
+        db.session.execute(
+            NoteArchive.__table__.insert().prefix_with('OR REPLACE'),
+            [{'note_id': row.id, 'data': NoteArchive.pack(row.content),
+              'content_length': len(row.content or ''), 'archived_at': now}
+             for row in rows if row.id in archived]
+        )
+    db.session.commit()
+    return ids[-1], len(archived)
+
+
+def archive_notes(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, report=None):
+    """將所有分片中超過 days 天未修改的筆記移到封存表，返回封存筆數"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    archived = 0
+    for shard in shard_router.shard_ids():
+        with use_shard(shard):
+            last_id = 0
+            while True:
+                last_id, count = archive_batch(cutoff, last_id, batch_size)
+                if last_id is None:
+                    break
+                archived += count
+                if report is not None:
+                    report(shard, last_id, archived)
+    return archived
+
+
+def _table_bytes(shard, names):
+    """資料表與索引實際佔用的頁面大小（需要 SQLite dbstat 模組）"""
+    placeholders = ', '.join(f':name{index}' for index in range(len(names)))
+    try:
+        with shard_router.engine(shard).connect() as conn:
+            return dict(conn.execute(
+                db.text(f"SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({placeholders}) GROUP BY name"),
+                {f'name{index}': name for index, name in enumerate(names)}
+            ).all())
+    except OperationalError:
+        return {}
+
+
+def storage_stats():
+    """熱資料與封存資料的筆數、內容大小與壓縮率（各分片加總）"""
+    note, archive = Note.__table__, NoteArchive.__table__
+    hot_notes = merge_scalars(shard_router.scatter(
+        db.select(db.func.count()).select_from(note).where(note.c.archived_at.is_(None))))
+    archived_notes = merge_scalars(shard_router.scatter(db.select(db.func.count()).select_from(archive)))
+    hot_bytes = merge_scalars(shard_router.scatter(db.select(db.func.sum(db.func.length(note.c.content)))))
+    archive_bytes = merge_scalars(shard_router.scatter(db.select(db.func.sum(db.func.length(archive.c.data)))))
+    archived_length = merge_scalars(shard_router.scatter(db.select(db.func.sum(archive.c.content_length))))
+
+    names = [note.name] + [index.name for index in note.indexes] + [archive.name]
+    table_bytes = {}
+    for shard in shard_router.shard_ids():
+        for name, size in _table_bytes(shard, names).items():
+            table_bytes[name] = table_bytes.get(name, 0) + size
+
+    return {
+        'hot_notes': hot_notes,
+        'archived_notes': archived_notes,
+        'hot_content_bytes': hot_bytes,
+        'archive_bytes': archive_bytes,
+        'archive_compression_ratio': round(archived_length / archive_bytes, 2) if archive_bytes else None,
+        'table_bytes': table_bytes,
+        'archive_after_days': ARCHIVE_AFTER_DAYS
+    }
+
+
+def schedule_archiving(delay=None):
+    """排入下一次封存工作；以執行時段去重，多個 worker 同時排程只會有一個"""
+    delay = ARCHIVE_INTERVAL if delay is None else delay
+    slot = int((datetime.utcnow() + timedelta(seconds=delay)).timestamp() // ARCHIVE_INTERVAL)
+    job, _ = enqueue('archive_notes', priority=-2, dedup_key=f'archive_notes:{slot}', delay=delay)
+    return job
+
+
+@job_handler('archive_notes')
+def archive_notes_job(ctx):
+    def report(shard, last_id, archived):
+        ctx.report(0, message=f'分片 {shard} 已處理至 id {last_id}，封存 {archived} 筆')
+    archived = archive_notes(ctx.payload.get('days', ARCHIVE_AFTER_DAYS), report=report)
+    schedule_archiving()
+    return {'archived': archived}
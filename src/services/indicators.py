@@ -0,0 +1,250 @@
+import numpy as np
+
+from src.services.price_store import price_store, to_timestamp
+from src.utils.lru import LRUCache
+
+# 分塊計算 EMA 的區塊大小：區塊內以卷積向量化，區塊間只傳遞一個狀態值
+EMA_BLOCK = 256
+
+DEFAULT_PARAMS = {
+    'sma': {'window': 20},
+    'ema': {'window': 20},
+    'rsi': {'window': 14},
+    'macd': {'fast': 12, 'slow': 26, 'signal': 9},
+    'bbands': {'window': 20, 'k': 2.0},
+}
+
+
+def ema(values, alpha, seed=None):
+    """指數移動平均：y[t] = alpha * x[t] + (1 - alpha) * y[t-1]，y[-1] 預設為 x[0]"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(values)
+    if not len(values):
+        return out
+    prev = values[0] if seed is None else seed
+    decay = (1.0 - alpha) ** np.arange(EMA_BLOCK + 1)
+    for start in range(0, len(values), EMA_BLOCK):
+        block = values[start:start + EMA_BLOCK]
+        size = len(block)
+        out[start:start + size] = (alpha * np.convolve(block, decay[:size])[:size]
+                                   + decay[1:size + 1] * prev)
+        prev = out[start + size - 1]
+    return out
+
+
+def sma(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.cumsum(np.insert(values, 0, 0.0))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def rolling_std(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        out[window - 1:] = windows.std(axis=1)
+    return out
+
+
+def wilder_averages(close, window):
+    """RSI 使用的 Wilder 平滑平均漲幅與跌幅（索引對齊 close）"""
+    deltas = np.diff(close)
+    gains = np.clip(deltas, 0, None)
+    losses = np.clip(-deltas, 0, None)
+    avg_gain = np.full(len(close), np.nan)
+    avg_loss = np.full(len(close), np.nan)
+    if len(deltas) >= window:
+        seed_gain = gains[:window].mean()
+        seed_loss = losses[:window].mean()
+        avg_gain[window] = seed_gain
+        avg_loss[window] = seed_loss
+        alpha = 1.0 / window
+        avg_gain[window + 1:] = ema(gains[window:], alpha, seed_gain)
+        avg_loss[window + 1:] = ema(losses[window:], alpha, seed_loss)
+    return avg_gain, avg_loss
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        out = 100.0 - 100.0 / (1.0 + rs)
+    out = np.where((avg_loss == 0) & ~np.isnan(avg_gain), 100.0, out)
+    return out
+
+
+def compute(indicator, close, params):
+    """以整段收盤價向量化計算指標，返回 (輸出欄位, 增量更新狀態)"""
+    if indicator == 'sma':
+        return {'sma': sma(close, params['window'])}, {}
+    if indicator == 'ema':
+        values = ema(close, 2.0 / (params['window'] + 1))
+        return {'ema': values}, {'ema': values[-1] if len(values) else None}
+    if indicator == 'rsi':
+        avg_gain, avg_loss = wilder_averages(close, params['window'])
+        state = {'gain': avg_gain[-1], 'loss': avg_loss[-1]} if len(close) else {}
+        return {'rsi': rsi_from_averages(avg_gain, avg_loss)}, state
+    if indicator == 'macd':
+        fast = ema(close, 2.0 / (params['fast'] + 1))
+        slow = ema(close, 2.0 / (params['slow'] + 1))
+        macd = fast - slow
+        signal = ema(macd, 2.0 / (params['signal'] + 1))
+        state = {'fast': fast[-1], 'slow': slow[-1], 'signal': signal[-1]} if len(close) else {}
+        return {'macd': macd, 'signal': signal, 'histogram': macd - signal}, state
+    if indicator == 'bbands':
+        middle = sma(close, params['window'])
+        std = rolling_std(close, params['window'])
+        return {'middle': middle, 'upper': middle + params['k'] * std,
+                'lower': middle - params['k'] * std}, {}
+    raise ValueError(f'不支援的指標: {indicator}')
+
+
+def step(indicator, close, params, state):
+    """新增一根 K 線時只計算最後一個值，返回 (各欄位的新值, 新狀態)"""
+    x = close[-1]
+    if indicator == 'sma':
+        window = params['window']
+        return {'sma': close[-window:].mean() if len(close) >= window else np.nan}, state
+    if indicator == 'ema':
+        alpha = 2.0 / (params['window'] + 1)
+        value = alpha * x + (1 - alpha) * state['ema']
+        return {'ema': value}, {'ema': value}
+    if indicator == 'rsi':
+        window = params['window']
+        if np.isnan(state.get('gain', np.nan)):
+            return None, state
+        delta = x - close[-2]
+        gain = (state['gain'] * (window - 1) + max(delta, 0.0)) / window
+        loss = (state['loss'] * (window - 1) + max(-delta, 0.0)) / window
+        value = 100.0 if loss == 0 else 100.0 - 100.0 / (1.0 + gain / loss)
+        return {'rsi': value}, {'gain': gain, 'loss': loss}
+    if indicator == 'macd':
+        fast = 2.0 / (params['fast'] + 1) * x + (1 - 2.0 / (params['fast'] + 1)) * state['fast']
+        slow = 2.0 / (params['slow'] + 1) * x + (1 - 2.0 / (params['slow'] + 1)) * state['slow']
+        macd = fast - slow
+        alpha = 2.0 / (params['signal'] + 1)
+        signal = alpha * macd + (1 - alpha) * state['signal']
+        return ({'macd': macd, 'signal': signal, 'histogram': macd - signal},
+                {'fast': fast, 'slow': slow, 'signal': signal})
+    if indicator == 'bbands':
+        window = params['window']
+        if len(close) < window:
+            return {'middle': np.nan, 'upper': np.nan, 'lower': np.nan}, state
+        tail = close[-window:]
+        middle, std = tail.mean(), tail.std()
+        return ({'middle': middle, 'upper': middle + params['k'] * std,
+                 'lower': middle - params['k'] * std}, state)
+    raise ValueError(f'不支援的指標: {indicator}')
+
+
+def normalize_params(indicator, params):
+    """補上預設參數並驗證"""
+    if indicator not in DEFAULT_PARAMS:
+        raise ValueError(f'不支援的指標: {indicator}')
+    merged = dict(DEFAULT_PARAMS[indicator])
+    for name, value in (params or {}).items():
+        if name not in merged:
+            raise ValueError(f'{indicator} 不支援參數 {name}')
+        merged[name] = float(value) if name == 'k' else int(value)
+    for name, value in merged.items():
+        if value <= 0 or (name != 'k' and value > 1000):
+            raise ValueError(f'參數 {name} 超出範圍')
+    return merged
+
+
+class CacheEntry:
+    __slots__ = ('count', 'last_ts', 'last_close', 'values', 'state')
+
+    def __init__(self, count, last_ts, last_close, values, state):
+        self.count = count
+        self.last_ts = last_ts
+        self.last_close = last_close
+        self.values = values
+        self.state = state
+
+
+class IndicatorEngine:
+    """技術指標計算與 LRU 快取
+
+    快取鍵為 (market, symbol, interval, indicator, params)，並記錄計算時的最後一根 K 線；
+    最後一根相同時直接命中，只多一根時以增量方式更新，否則整段重算。
+    """
+
+    def __init__(self, store=None, maxsize=256):
+        self.store = store or price_store
+        self._cache = LRUCache(maxsize)
+        self.counters = {'hits': 0, 'misses': 0, 'incremental': 0}
+
+    @property
+    def stats(self):
+        return dict(self.counters, evictions=self._cache.evictions, size=len(self._cache))
+
+    def _series_values(self, symbol, indicator, params, interval, market):
+        series_key = self.store.series_key(symbol, interval, market)
+        key = series_key + (indicator, tuple(sorted(params.items())))
+        bars = self.store.get_range(symbol, interval, market=market, columns=('ts', 'close'))
+        ts, close = bars['ts'], bars['close']
+        count = len(ts)
+        if not count:
+            return ts, {}
+
+        entry = self._cache.get(key)
+        last_ts, last_close = int(ts[-1]), float(close[-1])
+        if entry is not None and entry.count == count and entry.last_ts == last_ts \
+                and entry.last_close == last_close:
+            self.counters['hits'] += 1
+            return ts, entry.values
+
+        if entry is not None and entry.count == count - 1 and entry.state is not None \
+                and count >= 2 and entry.last_ts == int(ts[-2]) and entry.last_close == float(close[-2]):
+            new_values, state = step(indicator, close, params, entry.state)
+            if new_values is not None:
+                values = {name: np.append(entry.values[name], new_values[name])
+                          for name in entry.values}
+                self._cache.put(key, CacheEntry(count, last_ts, last_close, values, state))
+                self.counters['incremental'] += 1
+                return ts, values
+
+        self.counters['misses'] += 1
+        values, state = compute(indicator, close, params)
+        self._cache.put(key, CacheEntry(count, last_ts, last_close, values, state))
+        return ts, values
+
+    def get(self, symbol, indicator, params=None, interval='1d', market=None, start=None, end=None):
+        """計算指標並返回 [start, end] 區間的結果"""
+        params = normalize_params(indicator, params)
+        ts, values = self._series_values(symbol, indicator, params, interval, market)
+        if not len(ts):
+            return {'ts': ts, 'values': {}, 'params': params}
+        lo = 0 if start is None else int(np.searchsorted(ts, to_timestamp(start), side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, to_timestamp(end), side='right'))
+        return {
+            'ts': ts[lo:hi],
+            'values': {name: series[lo:hi] for name, series in values.items()},
+            'params': params
+        }
+
+    def get_many(self, symbols, indicators, interval='1d', start=None, end=None):
+        """批次計算多檔股票的多個指標；單檔錯誤不影響其他結果"""
+        results = {}
+        for symbol in symbols:
+            symbol_results = {}
+            for spec in indicators:
+                name = spec['name']
+                label = spec.get('label') or name
+                try:
+                    symbol_results[label] = self.get(symbol, name, spec.get('params'),
+                                                     interval, start=start, end=end)
+                except ValueError as e:
+                    symbol_results[label] = {'error': str(e)}
+            results[symbol] = symbol_results
+        return results
+
+    def clear(self):
+        self._cache.clear()
+
+
+indicator_engine = IndicatorEngine()
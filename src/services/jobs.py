@@ -0,0 +1,302 @@
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.job import Job, ACTIVE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# 工作類型 -> 處理函式
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """註冊背景工作處理函式，函式接收 JobContext 並返回可 JSON 序列化的結果"""
+    def decorator(f):
+        HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+class JobContext:
+    """傳給處理函式的執行上下文，用於讀取參數與回報進度"""
+
+    def __init__(self, job):
+        self.job = job
+        self.payload = job.get_payload()
+
+    def report(self, done, total=None, message=None):
+        """回報進度並更新心跳；會一併提交目前的資料庫交易"""
+        if total:
+            self.job.progress = min(100, int(done * 100 / total))
+        else:
+            self.job.progress = min(100, int(done))
+        if message is not None:
+            self.job.progress_message = message[:200]
+        self.job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+
+def enqueue(kind, payload=None, priority=0, dedup_key=None, max_attempts=3, delay=0):
+    """加入一個背景工作；相同 dedup_key 的工作尚未完成時直接返回既有工作
+
+    返回 (job, created)。
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'未知的工作類型: {kind}')
+
+    if dedup_key:
+        existing = Job.query.filter(Job.dedup_key == dedup_key,
+                                    Job.status.in_(ACTIVE_STATUSES)).first()
+        if existing:
+            return existing, False
+
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}, ensure_ascii=False),
+        priority=priority,
+        dedup_key=dedup_key,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 另一個請求同時加入了相同的工作
+        db.session.rollback()
+        existing = Job.query.filter(Job.dedup_key == dedup_key,
+                                    Job.status.in_(ACTIVE_STATUSES)).first()
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+
+def recover_stale_jobs(stale_after):
+    """回收心跳逾時的執行中工作（例如 worker 當機）"""
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = Job.query.filter(Job.status == 'running', Job.heartbeat_at < cutoff).all()
+    for job in stale:
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.error = '工作逾時'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = 'queued'
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+
+def claim_next(worker_id):
+    """以條件更新原子性地取得下一個待執行工作，多個 worker 之間不會重複取件"""
+    for _ in range(5):
+        now = datetime.utcnow()
+        candidate = db.session.query(Job.id).filter(
+            Job.status == 'queued', Job.run_at <= now
+        ).order_by(Job.priority.desc(), Job.run_at, Job.id).first()
+        if candidate is None:
+            return None
+
+        claimed = Job.query.filter(Job.id == candidate.id, Job.status == 'queued').update({
+            'status': 'running',
+            'locked_by': worker_id,
+            'attempts': Job.attempts + 1,
+            'started_at': now,
+            'heartbeat_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id)
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """執行中工作的心跳執行緒
+
+    處理函式可能長時間不呼叫 ctx.report（例如單一步驟就超過 JOBS_STALE_AFTER），
+    由這個執行緒定期更新 heartbeat_at，避免工作仍在執行時被 recover_stale_jobs 重新排入佇列。
+    使用獨立的連線，不影響處理函式的資料庫交易。
+    """
+
+    def __init__(self, app, job_id, worker_id, interval):
+        super().__init__(name=f'job-heartbeat-{job_id}', daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def beat(self):
+        """更新一次心跳，返回工作是否仍由這個 worker 持有"""
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                return conn.execute(update(Job.__table__).where(
+                    Job.id == self.job_id, Job.locked_by == self.worker_id, Job.status == 'running'
+                ).values(heartbeat_at=datetime.utcnow())).rowcount > 0
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                if not self.beat():
+                    return  # 工作已被回收，不再更新
+            except Exception:
+                # 資料庫暫時鎖定等錯誤：下一輪再試
+                logger.warning('背景工作 %s 心跳更新失敗', self.job_id, exc_info=True)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def _finish(job_id, worker_id, values):
+    """僅在工作仍由這個 worker 持有時寫入最終狀態，返回是否寫入
+
+    心跳中斷後工作可能已被回收並由其他 worker 重新執行，此時不能覆蓋對方的狀態。
+    """
+    finished = Job.query.filter(Job.id == job_id, Job.locked_by == worker_id,
+                                Job.status == 'running').update(values, synchronize_session=False)
+    db.session.commit()
+    if not finished:
+        logger.warning('背景工作 %s 已不由 %s 持有，略過狀態更新', job_id, worker_id)
+    return bool(finished)
+
+
+def run_job(job, retry_base=5, heartbeat_interval=30):
+    """執行一個已取得的工作，失敗時依指數退避重試"""
+    handler = HANDLERS.get(job.kind)
+    job_id = job.id
+    worker_id = job.locked_by
+    heartbeat = Heartbeat(current_app._get_current_object(), job_id, worker_id, heartbeat_interval)
+    heartbeat.start()
+    try:
+        if handler is None:
+            raise ValueError(f'未知的工作類型: {job.kind}')
+        result = handler(JobContext(job))
+        heartbeat.stop()
+        # 先提交處理函式的變更，再以條件更新寫入最終狀態
+        db.session.commit()
+        _finish(job_id, worker_id, {
+            'status': 'succeeded',
+            'progress': 100,
+            'result': json.dumps(result, ensure_ascii=False) if result is not None else None,
+            'error': None,
+            'finished_at': datetime.utcnow(),
+            'locked_by': None
+        })
+    except Exception:
+        heartbeat.stop()
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        logger.warning('背景工作 %s 失敗: %s', job_id, error)
+        attempts, max_attempts = db.session.query(Job.attempts, Job.max_attempts).filter(Job.id == job_id).one()
+        values = {'error': error, 'locked_by': None}
+        if attempts >= max_attempts:
+            values.update(status='failed', finished_at=datetime.utcnow())
+        else:
+            values.update(status='queued',
+                          run_at=datetime.utcnow() + timedelta(seconds=retry_base * 2 ** (attempts - 1)))
+        _finish(job_id, worker_id, values)
+    return db.session.get(Job, job_id, populate_existing=True)
+
+
+class JobWorker(threading.Thread):
+    """輪詢資料庫佇列的工作執行緒"""
+
+    def __init__(self, app, queue, index=0):
+        super().__init__(name=f'job-worker-{index}', daemon=True)
+        self.app = app
+        self.queue = queue
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        self.stop_event = threading.Event()
+
+    def run(self):
+        config = self.app.config
+        while not self.stop_event.is_set():
+            job = None
+            try:
+                with self.app.app_context():
+                    recover_stale_jobs(config['JOBS_STALE_AFTER'])
+                    job = claim_next(self.worker_id)
+                    if job is not None:
+                        run_job(job, config['JOBS_RETRY_BASE'], config['JOBS_HEARTBEAT_INTERVAL'])
+            except Exception:
+                logger.exception('背景工作執行緒錯誤')
+            if job is None:
+                self.stop_event.wait(config['JOBS_POLL_INTERVAL'])
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class JobQueue:
+    """背景工作佇列：資料庫持久化，每個行程啟動少量工作執行緒"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = []
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_START_WORKERS', True)
+        app.config.setdefault('JOBS_WORKER_THREADS', 1)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOBS_STALE_AFTER', 300)
+        # 心跳間隔需明顯短於 JOBS_STALE_AFTER
+        app.config.setdefault('JOBS_HEARTBEAT_INTERVAL', 30)
+        app.config.setdefault('JOBS_RETRY_BASE', 5)
+        self.app = app
+        app.extensions['job_queue'] = self
+        if app.config['JOBS_START_WORKERS']:
+            # 延遲到第一個請求才啟動，避免 gunicorn fork 前建立的執行緒遺失
+            app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.start()
+
+    def start(self, threads=None):
+        count = threads or self.app.config['JOBS_WORKER_THREADS']
+        self.workers = [JobWorker(self.app, self, index) for index in range(count)]
+        for worker in self.workers:
+            worker.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self._pid = None
+
+    def run_pending(self, worker_id='inline'):
+        """在目前執行緒中執行所有已到期的工作（獨立 worker 行程或維護腳本使用）"""
+        count = 0
+        while True:
+            job = claim_next(worker_id)
+            if job is None:
+                return count
+            run_job(job, self.app.config['JOBS_RETRY_BASE'], self.app.config['JOBS_HEARTBEAT_INTERVAL'])
+            count += 1
+
+
+job_queue = JobQueue()
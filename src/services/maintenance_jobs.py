@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from src.models.user import User, db
+from src.models.note import Note, note_tags, note_symbols
+from src.models.news import NewsBookmark, news_bookmark_symbols
+from src.models.revision import NoteRevision
+from src.models.archive import NoteArchive
+from src.models.vector import NoteVector
+from src.models.watchlist import Watchlist, SystemStats
+from src.models.feed import FeedItem
+from src.models.alert import PriceAlert, AlertNotification
+from src.services.jobs import job_handler
+from src.utils.sharding import shard_router, merge_scalars
+
+DELETE_BATCH_SIZE = 200
+
+
+@job_handler('delete_user')
+def delete_user_job(ctx):
+    """分批刪除用戶及其筆記、收藏與自選股"""
+    user_id = ctx.payload['user_id']
+    user = db.session.get(User, user_id)
+    if user is None:
+        return {'deleted': False, 'reason': 'not_found'}
+
+    # 筆記、收藏與自選股在用戶所屬的分片，其餘資料在主資料庫
+    with shard_router.for_user(user_id):
+        total_notes = Note.query.filter_by(user_id=user_id).count()
+        deleted_notes = 0
+        while True:
+            note_ids = [row.id for row in db.session.query(Note.id)
+                        .filter(Note.user_id == user_id).limit(DELETE_BATCH_SIZE)]
+            if not note_ids:
+                break
+            db.session.execute(note_tags.delete().where(note_tags.c.note_id.in_(note_ids)))
+            db.session.execute(note_symbols.delete().where(note_symbols.c.note_id.in_(note_ids)))
+            NoteRevision.query.filter(NoteRevision.note_id.in_(note_ids)).delete(synchronize_session=False)
+            NoteArchive.query.filter(NoteArchive.note_id.in_(note_ids)).delete(synchronize_session=False)
+            NoteVector.query.filter(NoteVector.note_id.in_(note_ids)).delete(synchronize_session=False)
+            Note.query.filter(Note.id.in_(note_ids)).delete(synchronize_session=False)
+            deleted_notes += len(note_ids)
+            ctx.report(deleted_notes, total_notes + 1, f'已刪除 {deleted_notes}/{total_notes} 筆筆記')
+
+        bookmark_ids = db.session.query(NewsBookmark.id).filter(NewsBookmark.user_id == user_id)
+        db.session.execute(news_bookmark_symbols.delete()
+                           .where(news_bookmark_symbols.c.news_bookmark_id.in_(bookmark_ids.scalar_subquery())))
+        NewsBookmark.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        AlertNotification.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        PriceAlert.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        Watchlist.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        FeedItem.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        db.session.expire_all()
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+
+    SystemStats.increment_stat('total_users', -1)
+    SystemStats.increment_stat('total_notes', -deleted_notes)
+    return {'deleted': True, 'notes': deleted_notes}
+
+
+def recount_stats(ctx=None):
+    """重新計算系統統計數據"""
+    counts = {
+        'total_users': User.query.count(),
+        # 筆記與新聞收藏分散在各分片，各自計數後加總
+        'total_notes': merge_scalars(shard_router.scatter(db.select(db.func.count(Note.id)))),
+        'total_news': merge_scalars(shard_router.scatter(db.select(db.func.count(NewsBookmark.id)))),
+        'active_users': User.query.filter_by(is_active=True).count(),
+        'admin_users': User.query.filter_by(is_admin=True).count(),
+    }
+    for index, (stat_name, value) in enumerate(counts.items(), start=1):
+        SystemStats.update_stat(stat_name, value)
+        if ctx is not None:
+            ctx.report(index, len(counts))
+    counts['computed_at'] = datetime.utcnow().isoformat()
+    return counts
+
+
+@job_handler('recount_stats')
+def recount_stats_job(ctx):
+    return recount_stats(ctx)
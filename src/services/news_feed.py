@@ -0,0 +1,186 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.models.user import db
+from src.models.feed import FeedItem
+from src.models.news import NewsArticle, NewsBookmark, news_article_symbols, news_bookmark_symbols
+from src.models.symbol import Symbol
+from src.models.watchlist import Watchlist
+from src.services.symbol_linker import on_linked
+from src.utils.sharding import shard_router, use_shard
+
+# 每位用戶收件匣保留的筆數，超過 10% 時一次修剪
+INBOX_LIMIT = 500
+# 追蹤人數超過此值的熱門股票不推送，改在讀取時合併
+FANOUT_LIMIT = 1000
+# 熱門股票清單的快取秒數
+HOT_SYMBOLS_TTL = 60
+
+_hot_symbols = {'expires': 0, 'ids': frozenset()}
+
+
+def followers(symbols):
+    """返回 {symbol_id: 追蹤該股票的 user_id 集合}（自選股與新聞收藏紀錄）"""
+    by_key = {(symbol.symbol_key, symbol.market_key): symbol.id for symbol in symbols}
+    result = {symbol.id: set() for symbol in symbols}
+    if not symbols:
+        return result
+    # 自選股與新聞收藏依用戶分片，逐一查詢每個分片後合併
+    for shard in shard_router.shard_ids():
+        with use_shard(shard):
+            _collect_followers(result, by_key)
+    return result
+
+
+def _collect_followers(result, by_key):
+    symbol_keys = {symbol_key for symbol_key, _ in by_key}
+
+    rows = db.session.query(Watchlist.user_id, Watchlist.symbol_key, Watchlist.market_key)\
+                     .filter(Watchlist.symbol_key.in_(symbol_keys))
+    for user_id, symbol_key, market_key in rows:
+        symbol_id = by_key.get((symbol_key, market_key))
+        if symbol_id is not None:
+            result[symbol_id].add(user_id)
+
+    rows = db.session.query(NewsBookmark.user_id, NewsBookmark.symbol_key, NewsBookmark.market_key)\
+                     .filter(NewsBookmark.symbol_key.in_(symbol_keys)).distinct()
+    for user_id, symbol_key, market_key in rows:
+        symbol_id = by_key.get((symbol_key, market_key))
+        if symbol_id is not None:
+            result[symbol_id].add(user_id)
+
+    rows = db.session.query(news_bookmark_symbols.c.symbol_id, NewsBookmark.user_id)\
+                     .join(NewsBookmark, NewsBookmark.id == news_bookmark_symbols.c.news_bookmark_id)\
+                     .filter(news_bookmark_symbols.c.symbol_id.in_(list(result))).distinct()
+    for symbol_id, user_id in rows:
+        result[symbol_id].add(user_id)
+
+
+def hot_symbol_ids():
+    """追蹤人數超過推送上限的股票 id（短暫快取）"""
+    now = time.monotonic()
+    if now >= _hot_symbols['expires']:
+        _hot_symbols['ids'] = frozenset(
+            symbol_id for (symbol_id,) in
+            db.session.query(Symbol.id).filter(Symbol.follower_count > FANOUT_LIMIT)
+        )
+        _hot_symbols['expires'] = now + HOT_SYMBOLS_TTL
+    return _hot_symbols['ids']
+
+
+def followed_symbols(user_id):
+    """用戶追蹤的股票（自選股、收藏新聞的股票及其中辨識出的股票）"""
+    with shard_router.for_user(user_id):
+        pairs = set(db.session.query(Watchlist.symbol_key, Watchlist.market_key)
+                    .filter(Watchlist.user_id == user_id))
+        pairs.update(db.session.query(NewsBookmark.symbol_key, NewsBookmark.market_key)
+                     .filter(NewsBookmark.user_id == user_id, NewsBookmark.symbol_key.isnot(None)).distinct())
+        linked_ids = {symbol_id for (symbol_id,) in
+                      db.session.query(news_bookmark_symbols.c.symbol_id)
+                      .join(NewsBookmark, NewsBookmark.id == news_bookmark_symbols.c.news_bookmark_id)
+                      .filter(NewsBookmark.user_id == user_id).distinct()}
+
+    conditions = [Symbol.id.in_(linked_ids)] if linked_ids else []
+    conditions.extend((Symbol.symbol_key == symbol_key) & (Symbol.market_key == market_key)
+                      for symbol_key, market_key in pairs if symbol_key)
+    if not conditions:
+        return []
+    return Symbol.query.filter(Symbol.is_active.is_(True), db.or_(*conditions)).all()
+
+
+@on_linked('news_article')
+def fan_out(links):
+    """新聞辨識出股票後推送到追蹤者的收件匣（與辨識在同一交易中）"""
+    article_ids = {link['article_id'] for link in links}
+    articles = dict(db.session.query(NewsArticle.id, NewsArticle.published_at)
+                    .filter(NewsArticle.id.in_(article_ids), NewsArticle.canonical_id.is_(None)))
+    if not articles:
+        return 0
+
+    symbols = Symbol.query.filter(Symbol.id.in_({link['symbol_id'] for link in links})).all()
+    audience = followers(symbols)
+    db.session.execute(
+        Symbol.__table__.update()
+        .where(Symbol.id == db.bindparam('symbol_id'))
+        .values(follower_count=db.bindparam('count'), updated_at=Symbol.__table__.c.updated_at),
+        [{'symbol_id': symbol_id, 'count': len(users)} for symbol_id, users in audience.items()]
+    )
+
+    rows = {}
+    for link in links:
+        users = audience.get(link['symbol_id'], ())
+        if link['article_id'] not in articles or len(users) > FANOUT_LIMIT:
+            continue
+        for user_id in users:
+            rows.setdefault((user_id, link['article_id']), {
+                'user_id': user_id,
+                'article_id': link['article_id'],
+                'symbol_id': link['symbol_id'],
+                'published_at': articles[link['article_id']],
+                'created_at': datetime.utcnow()
+            })
+    if not rows:
+        return 0
+    db.session.execute(FeedItem.__table__.insert().prefix_with('OR IGNORE'), list(rows.values()))
+    trim_inboxes({user_id for user_id, _ in rows})
+    return len(rows)
+
+
+def trim_inboxes(user_ids):
+    """刪除超過上限的舊項目；超出 10% 才修剪，避免每次推送都要刪除"""
+    if not user_ids:
+        return
+    oversized = [user_id for user_id, _ in
+                 db.session.query(FeedItem.user_id, func.count())
+                 .filter(FeedItem.user_id.in_(user_ids))
+                 .group_by(FeedItem.user_id)
+                 .having(func.count() > INBOX_LIMIT * 1.1)]
+    for user_id in oversized:
+        keep = db.session.query(FeedItem.id).filter(FeedItem.user_id == user_id)\
+                         .order_by(FeedItem.published_at.desc(), FeedItem.article_id.desc())\
+                         .limit(INBOX_LIMIT)
+        FeedItem.query.filter(FeedItem.user_id == user_id, FeedItem.id.notin_(keep.scalar_subquery()))\
+                      .delete(synchronize_session=False)
+
+
+def _before(published_column, id_column, position):
+    published_at = datetime.fromisoformat(position[0])
+    return (published_column < published_at) | ((published_column == published_at) & (id_column < position[1]))
+
+
+def read_feed(user_id, position=None, limit=20, pull_all=False):
+    """讀取個人化新聞：收件匣一次索引範圍讀取，熱門股票（未推送）於讀取時合併
+
+    收件匣尚未建立（新用戶或剛加入自選股）時，改以讀取時合併所有追蹤股票，
+    後續分頁以 pull_all 延續同一模式。返回 ([(article_id, published_at, symbol_id)], has_more, pull_all)。
+    """
+    query = db.session.query(FeedItem.article_id, FeedItem.published_at, FeedItem.symbol_id)\
+                      .filter(FeedItem.user_id == user_id)
+    if position:
+        query = query.filter(_before(FeedItem.published_at, FeedItem.article_id, position))
+    entries = query.order_by(FeedItem.published_at.desc(), FeedItem.article_id.desc()).limit(limit + 1).all()
+    if not entries and not position:
+        pull_all = True
+
+    pull_ids = []
+    hot_ids = hot_symbol_ids()
+    if hot_ids or pull_all:
+        pull_ids = [symbol.id for symbol in followed_symbols(user_id) if pull_all or symbol.id in hot_ids]
+    if pull_ids:
+        query = db.session.query(NewsArticle.id, NewsArticle.published_at, news_article_symbols.c.symbol_id)\
+                          .join(news_article_symbols, news_article_symbols.c.article_id == NewsArticle.id)\
+                          .filter(news_article_symbols.c.symbol_id.in_(pull_ids),
+                                  NewsArticle.canonical_id.is_(None))
+        if position:
+            query = query.filter(_before(NewsArticle.published_at, NewsArticle.id, position))
+        # 同一篇新聞可能對應多檔股票，多取一些以確保去重後仍有足夠筆數
+        pulled = query.order_by(NewsArticle.published_at.desc(), NewsArticle.id.desc())\
+                      .limit((limit + 1) * len(pull_ids)).all()
+        merged = {}
+        for entry in list(entries) + pulled:
+            merged.setdefault(entry[0], tuple(entry))
+        entries = sorted(merged.values(), key=lambda entry: (entry[1], entry[0]), reverse=True)
+
+    return [tuple(entry) for entry in entries[:limit]], len(entries) > limit, pull_all
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from src.models.user import db
+from src.models.news import NewsArticle, news_article_bands
+from src.services.symbol_linker import schedule_linking
+from src.utils.minhash import features, band_keys, jaccard, DUPLICATE_THRESHOLD
+
+# 只與最近這段時間內的文章比對
+DEDUP_WINDOW_HOURS = 72
+# 共用分段最多的前幾篇才做精確比對
+MAX_CANDIDATES = 20
+
+
+def article_features(title, description):
+    return features(title) | features(description)
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def find_duplicate(tokens, keys, since):
+    """以 LSH 分段索引找出候選文章並計算精確相似度，返回 (代表文章 id, 相似度) 或 None"""
+    if not keys:
+        return None
+    candidates = db.session.execute(
+        db.select(news_article_bands.c.article_id, func.count().label('shared'))
+        .join(NewsArticle, NewsArticle.id == news_article_bands.c.article_id)
+        .where(news_article_bands.c.band.in_(keys), NewsArticle.created_at >= since)
+        .group_by(news_article_bands.c.article_id)
+        .order_by(func.count().desc(), news_article_bands.c.article_id)
+        .limit(MAX_CANDIDATES)
+    ).all()
+    if not candidates:
+        return None
+
+    rows = db.session.execute(
+        db.select(NewsArticle.id, NewsArticle.canonical_id, NewsArticle.title, NewsArticle.description)
+        .where(NewsArticle.id.in_([row.article_id for row in candidates]))
+    ).all()
+    best = None
+    for row in rows:
+        score = jaccard(tokens, article_features(row.title, row.description))
+        if score >= DUPLICATE_THRESHOLD and (best is None or score > best[1]):
+            best = (row.canonical_id or row.id, score)
+    return best
+
+
+def ingest_articles(items, now=None):
+    """匯入一批新聞：網址重複的略過，內容相近的歸入既有文章的群組
+
+    返回 {'created': [...], 'duplicates': [...], 'skipped': n}。
+    """
+    now = now or datetime.utcnow()
+    since = now - timedelta(hours=DEDUP_WINDOW_HOURS)
+    urls = [item.get('url') for item in items if item.get('url')]
+    existing_urls = {url for (url,) in db.session.query(NewsArticle.url).filter(NewsArticle.url.in_(urls))}
+
+    created, duplicates, skipped = [], [], 0
+    for item in items:
+        title = (item.get('title') or '').strip()
+        url = (item.get('url') or '').strip()
+        if not title or not url or url in existing_urls:
+            skipped += 1
+            continue
+        existing_urls.add(url)
+
+        tokens = article_features(title, item.get('description'))
+        keys = sorted(set(band_keys(tokens)))
+        match = find_duplicate(tokens, keys, since)
+
+        article = NewsArticle(
+            title=title[:500],
+            description=item.get('description'),
+            url=url[:1000],
+            source=(item.get('source') or '')[:100] or None,
+            published_at=_parse_datetime(item.get('published_at')) or now,
+            created_at=now
+        )
+        if match:
+            article.canonical_id, article.similarity = match[0], round(match[1], 4)
+        db.session.add(article)
+        db.session.flush()
+        if keys:
+            db.session.execute(news_article_bands.insert(),
+                               [{'article_id': article.id, 'band': key} for key in keys])
+
+        if match:
+            NewsArticle.query.filter_by(id=match[0]).update(
+                {'duplicate_count': NewsArticle.duplicate_count + 1}, synchronize_session=False)
+            duplicates.append(article)
+        else:
+            created.append(article)
+
+    db.session.commit()
+    if created or duplicates:
+        schedule_linking()
+    return {'created': created, 'duplicates': duplicates, 'skipped': skipped}
+
+
+def attach_alternates(articles):
+    """一次查詢取得各代表文章的其他來源"""
+    ids = [article.id for article in articles]
+    alternates = {article_id: [] for article_id in ids}
+    if ids:
+        rows = NewsArticle.query.filter(NewsArticle.canonical_id.in_(ids))\
+                                .order_by(NewsArticle.published_at, NewsArticle.id).all()
+        for row in rows:
+            alternates[row.canonical_id].append(row)
+    return [article.to_dict(alternates[article.id]) for article in articles]
@@ -0,0 +1,183 @@
+import hashlib
+
+import numpy as np
+
+from src.services.price_store import price_store, to_timestamp
+from src.utils.arrays import sorted_unique
+from src.utils.lru import LRUCache
+
+# 各週期一年的 K 線數，用於年化波動率
+PERIODS_PER_YEAR = {
+    '1m': 252 * 390,
+    '5m': 252 * 78,
+    '15m': 252 * 26,
+    '1h': 252 * 7,
+    '1d': 252,
+}
+
+
+def max_drawdown(prices):
+    """每一欄的最大回撤（負值），缺值不影響累積高點"""
+    if not len(prices):
+        return np.full(prices.shape[1], np.nan)
+    running_max = np.fmax.accumulate(prices, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.nan_to_num(prices / running_max - 1.0, nan=0.0).min(axis=0)
+    drawdown[np.isnan(prices).all(axis=0)] = np.nan
+    return drawdown
+
+
+def pairwise_moments(returns):
+    """以矩陣乘法一次算出兩兩重疊樣本的共變異數與各自變異數
+
+    缺值以遮罩處理：每一對只使用兩者都有資料的期間。
+    """
+    mask = ~np.isnan(returns)
+    x = np.where(mask, returns, 0.0)
+    m = mask.astype(np.float64)
+    n = m.T @ m                       # 重疊樣本數
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sum_i = x.T @ m               # [i, j]：在 j 有資料的期間 i 的總和
+        sum_ii = (x * x).T @ m
+        mean_i = sum_i / n
+        mean_j = mean_i.T
+        cov = (x.T @ x) / n - mean_i * mean_j
+        var_i = sum_ii / n - mean_i ** 2
+        var_j = var_i.T
+    return n, cov, np.clip(var_i, 0, None), np.clip(var_j, 0, None)
+
+
+class PortfolioAnalytics:
+    """自選股組合分析：相關係數矩陣、年化波動率、Beta 與最大回撤
+
+    所有指標都在對齊後的價格矩陣上一次向量化計算。對齊後的單一股票欄位
+    以 (股票版本, 交易日曆) 為鍵快取，重疊的自選股清單可以共用；整個報酬矩陣
+    另以股票集合及其版本為鍵快取，價格更新後自動失效。
+    """
+
+    def __init__(self, store=None, column_cache_size=2048, matrix_cache_size=64):
+        self.store = store or price_store
+        self._columns = LRUCache(column_cache_size)
+        self._matrices = LRUCache(matrix_cache_size)
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def _load(self, symbol, market, interval):
+        """讀取收盤價（零複製視圖）與版本（筆數、最後一根 K 線），版本改變時快取自然失效"""
+        series_key = self.store.series_key(symbol, interval, market)
+        bars = self.store.get_range(symbol, interval, market=market, columns=('ts', 'close'))
+        ts, close = bars['ts'], bars['close']
+        version = (len(ts), int(ts[-1]), float(close[-1])) if len(ts) else (0,)
+        return series_key, version, ts, close
+
+    def _aligned_column(self, loaded, calendar, calendar_key):
+        """將單一股票收盤價對齊到交易日曆（向前填補），結果可被不同清單共用"""
+        series_key, version, ts, close = loaded
+        key = (series_key, version, calendar_key)
+        column = self._columns.get(key)
+        if column is not None:
+            return column
+        column = np.full(len(calendar), np.nan)
+        if len(ts):
+            idx = np.searchsorted(ts, calendar, side='right') - 1
+            valid = idx >= 0
+            column[valid] = close[idx[valid]]
+        self._columns.put(key, column)
+        return column
+
+    def aligned_matrix(self, members, benchmark=None, interval='1d', start=None, end=None):
+        """返回 (交易日曆, 價格矩陣, 報酬矩陣)，欄位順序與 members 相同，基準（如有）在最後一欄
+
+        交易日曆以基準的時間軸為準；沒有基準資料時取所有股票時間戳的聯集。
+        """
+        lo, hi = to_timestamp(start), to_timestamp(end)
+        loaded = [self._load(symbol, market, interval) for symbol, market in members]
+        if benchmark:
+            loaded.append(self._load(benchmark, None, interval))
+        versions = tuple((item[0], item[1]) for item in loaded)
+        matrix_key = (versions, lo, hi, bool(benchmark))
+        cached = self._matrices.get(matrix_key)
+        if cached is not None:
+            self.counters['hits'] += 1
+            return cached
+        self.counters['misses'] += 1
+
+        def clip(ts):
+            left = 0 if lo is None else int(np.searchsorted(ts, lo, side='left'))
+            right = len(ts) if hi is None else int(np.searchsorted(ts, hi, side='right'))
+            return ts[left:right]
+
+        if benchmark and len(loaded[-1][2]):
+            calendar = clip(loaded[-1][2])
+            calendar_key = ('bench',) + versions[-1] + (lo, hi)
+        else:
+            arrays = [clip(item[2]) for item in loaded if len(item[2])]
+            calendar = sorted_unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+            # 聯集日曆以內容為鍵：成員不同但日曆相同（例如同市場的日線）的清單可以共用對齊後的欄位
+            calendar_key = ('union', len(calendar), hashlib.blake2b(calendar.tobytes(), digest_size=16).digest())
+
+        if len(calendar) and loaded:
+            prices = np.column_stack([self._aligned_column(item, calendar, calendar_key) for item in loaded])
+        else:
+            prices = np.empty((len(calendar), len(loaded)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1.0
+        result = (calendar, prices, returns)
+        self._matrices.put(matrix_key, result)
+        return result
+
+    @property
+    def stats(self):
+        return dict(self.counters, columns=len(self._columns), matrices=len(self._matrices),
+                    evictions=self._columns.evictions + self._matrices.evictions)
+
+    def analyze(self, members, benchmark=None, interval='1d', start=None, end=None):
+        """members 為 [(symbol, market), ...]"""
+        if interval not in PERIODS_PER_YEAR:
+            raise ValueError(f'無效的週期: {interval}')
+        calendar, prices, returns = self.aligned_matrix(members, benchmark, interval, start, end)
+        count = len(members)
+        symbols = [symbol for symbol, _ in members]
+        if len(calendar) < 3:
+            return {'symbols': symbols, 'observations': int(len(calendar)),
+                    'correlation': None, 'volatility': {}, 'beta': {}, 'max_drawdown': {}}
+
+        n, cov, var_i, var_j = pairwise_moments(returns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.sqrt(var_i * var_j)
+        corr = np.clip(corr, -1.0, 1.0)
+        corr[n < 3] = np.nan
+
+        diag_var = np.diag(var_i) * np.diag(n) / np.maximum(np.diag(n) - 1, 1)
+        volatility = np.sqrt(diag_var * PERIODS_PER_YEAR[interval])
+        volatility[np.diag(n) < 3] = np.nan
+        drawdowns = max_drawdown(prices)
+
+        beta = np.full(count, np.nan)
+        if benchmark:
+            b = count  # 基準在最後一欄
+            with np.errstate(divide='ignore', invalid='ignore'):
+                beta = cov[:count, b] / var_j[:count, b]
+            beta[n[:count, b] < 3] = np.nan
+
+        def clean(values):
+            values = np.round(values, 6)
+            values[~np.isfinite(values)] = np.nan
+            return [None if value != value else value for value in values.tolist()]
+
+        correlation = np.round(corr[:count, :count], 6).tolist()
+        volatility, beta, drawdowns = clean(volatility), clean(beta), clean(drawdowns)
+        return {
+            'symbols': symbols,
+            'benchmark': benchmark,
+            'observations': int(len(returns)),
+            'start': int(calendar[0]),
+            'end': int(calendar[-1]),
+            'correlation': [[None if value != value else value for value in row] for row in correlation],
+            'volatility': dict(zip(symbols, volatility)),
+            'beta': dict(zip(symbols, beta)) if benchmark else {},
+            'max_drawdown': dict(zip(symbols, drawdowns)),
+            'missing': [symbol for i, symbol in enumerate(symbols) if np.isnan(prices[:, i]).all()]
+        }
+
+
+portfolio_analytics = PortfolioAnalytics()
@@ -0,0 +1,372 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能在單一行程內寫入
+    fcntl = None
+
+from src.utils.symbols import normalize_symbol
+
+# 每個欄位一個固定寬度的檔案（欄式儲存），時間戳為 UTC epoch 秒
+COLUMNS = {
+    'ts': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+    'volume': np.dtype('<f8'),
+}
+# ts 最後寫入，筆數以 ts 檔案長度為準，寫入中斷時其他欄位多出的部分會被忽略
+WRITE_ORDER = ('open', 'high', 'low', 'close', 'volume', 'ts')
+INTERVALS = ('1m', '5m', '15m', '1h', '1d')
+
+CSV_TIME_FIELDS = ('ts', 'timestamp', 'date', 'datetime', 'time')
+# 記錄目前世代目錄名稱的檔案；取代序列時寫入新世代目錄後再原子切換這個檔案
+CURRENT_FILE = 'CURRENT'
+
+
+def to_timestamp(value):
+    """將 epoch 秒、ISO 日期或 datetime 轉為 UTC epoch 秒"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    text = str(value).strip()
+    if text.lstrip('-').isdigit():
+        return int(text)
+    parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def read_generation(path):
+    """序列目前的世代目錄名稱；舊版直接寫在序列目錄下的資料為空字串"""
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ''
+
+
+class PriceSeries:
+    """單一股票單一週期的記憶體映射欄位集合"""
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = ''
+        self.version = None
+        self.columns = {}
+
+    def column_path(self, name, generation=None):
+        return os.path.join(self.path, self.generation if generation is None else generation, f'{name}.bin')
+
+    def refresh(self):
+        """世代或 ts 檔案改變時（本行程或其他行程追加、取代）重新映射"""
+        while True:
+            generation = read_generation(self.path)
+            try:
+                stat = os.stat(self.column_path('ts', generation))
+                version = (generation, stat.st_ino, stat.st_size)
+            except FileNotFoundError:
+                version = (generation, None, 0)
+            if version == self.version:
+                return
+            count = version[2] // COLUMNS['ts'].itemsize
+            columns = {}
+            try:
+                if count:
+                    for name, dtype in COLUMNS.items():
+                        data = np.memmap(self.column_path(name, generation), dtype=dtype, mode='r')
+                        # 轉為一般 ndarray 視圖，切片時不經過 memmap 子類別的額外開銷
+                        columns[name] = data[:count].view(np.ndarray)
+            except FileNotFoundError:
+                # 讀取途中舊世代已被取代並刪除，改讀新世代
+                continue
+            self.generation = generation
+            self.columns = columns
+            self.version = version
+            return
+
+    def __len__(self):
+        return len(self.columns['ts']) if self.columns else 0
+
+
+class PriceStore:
+    """以記憶體映射的欄式檔案保存每檔股票的 OHLCV 歷史，不經過 ORM
+
+    目錄結構：<root>/<market>/<symbol>/<interval>/<generation>/<column>.bin，
+    <interval>/CURRENT 指向目前的世代；另有 index.json 記錄每個序列的筆數與時間範圍。
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self._series = {}
+        self._lock = threading.RLock()
+
+    def init_app(self, app):
+        default_root = os.path.join(app.root_path, 'database', 'prices')
+        app.config.setdefault('PRICE_STORE_PATH', default_root)
+        self.root = app.config['PRICE_STORE_PATH']
+        app.extensions['price_store'] = self
+
+    # 路徑與索引
+    def series_key(self, symbol, interval='1d', market=None):
+        if interval not in INTERVALS:
+            raise ValueError(f'無效的週期: {interval}')
+        symbol_key, market_key = normalize_symbol(symbol, market)
+        if not symbol_key:
+            raise ValueError('股票代碼不能為空')
+        return market_key, symbol_key, interval
+
+    def series_path(self, key):
+        market_key, symbol_key, interval = key
+        return os.path.join(self.root, market_key, symbol_key.replace('/', '_'), interval)
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _update_index(self, key, series):
+        # 不同序列的寫入各自持有序列鎖，索引的讀取—修改—寫入需要整個存儲共用的鎖
+        with self._write_lock(self.root):
+            index = self._load_index()
+            name = '/'.join(key)
+            if len(series):
+                ts = series.columns['ts']
+                index[name] = {'count': len(series), 'first_ts': int(ts[0]), 'last_ts': int(ts[-1])}
+            else:
+                index.pop(name, None)
+            self._write_atomic(self._index_path(), json.dumps(index, ensure_ascii=False, sort_keys=True))
+
+    def index(self):
+        """所有序列的摘要（筆數、起訖時間）"""
+        return self._load_index()
+
+    @contextmanager
+    def _write_lock(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_atomic(file_path, text):
+        """寫入同目錄下唯一命名的暫存檔後原子取代"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _get_series(self, key):
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, PriceSeries(self.series_path(key)))
+        series.refresh()
+        return series
+
+    # 讀取
+    def get_range(self, symbol, interval='1d', start=None, end=None, market=None, columns=None):
+        """返回 [start, end] 區間內各欄位的 NumPy 視圖（零複製，唯讀）"""
+        series = self._get_series(self.series_key(symbol, interval, market))
+        names = columns or tuple(COLUMNS)
+        if not len(series):
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in names}
+        ts = series.columns['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, to_timestamp(start), side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, to_timestamp(end), side='right'))
+        return {name: series.columns[name][lo:hi] for name in names}
+
+    def last_bar(self, symbol, interval='1d', market=None):
+        series = self._get_series(self.series_key(symbol, interval, market))
+        if not len(series):
+            return None
+        return {name: series.columns[name][-1].item() for name in COLUMNS}
+
+    def count(self, symbol, interval='1d', market=None):
+        return len(self._get_series(self.series_key(symbol, interval, market)))
+
+    # 寫入
+    def append(self, symbol, bars, interval='1d', market=None):
+        """追加 K 線；bars 為 dict 欄位陣列或 dict 列表，時間需晚於現有資料
+
+        與最後一根時間相同的 K 線會覆寫最後一根（盤中更新）。返回新增筆數。
+        """
+        key = self.series_key(symbol, interval, market)
+        arrays = self._to_arrays(bars)
+        if not len(arrays['ts']):
+            return 0
+        path = self.series_path(key)
+        with self._write_lock(path):
+            series = self._get_series(key)
+            count = len(series)
+            ts = arrays['ts']
+            if np.any(np.diff(ts) <= 0):
+                raise ValueError('K 線時間必須嚴格遞增')
+            # 清除中斷寫入留下的尾端（只會截掉讀取端不會存取的部分）
+            self._truncate(os.path.join(path, series.generation), count)
+            if count:
+                last_ts = int(series.columns['ts'][-1])
+                if ts[0] < last_ts:
+                    raise ValueError('只能追加晚於最後一根 K 線的資料')
+                if ts[0] == last_ts:
+                    # 原地覆寫最後一根，已映射的讀取端會直接看到新值
+                    for name in WRITE_ORDER:
+                        with open(series.column_path(name), 'r+b') as f:
+                            f.seek((count - 1) * COLUMNS[name].itemsize)
+                            f.write(arrays[name][:1].astype(COLUMNS[name], copy=False).tobytes())
+                    arrays = {name: values[1:] for name, values in arrays.items()}
+            os.makedirs(os.path.join(path, series.generation), exist_ok=True)
+            for name in WRITE_ORDER:
+                with open(series.column_path(name), 'ab') as f:
+                    f.write(arrays[name].astype(COLUMNS[name], copy=False).tobytes())
+            series.refresh()
+            self._update_index(key, series)
+        return len(ts)
+
+    def replace(self, symbol, bars, interval='1d', market=None):
+        """以新資料完整取代序列"""
+        key = self.series_key(symbol, interval, market)
+        arrays = self._to_arrays(bars)
+        path = self.series_path(key)
+        if np.any(np.diff(arrays['ts']) <= 0):
+            raise ValueError('K 線時間必須嚴格遞增')
+        with self._write_lock(path):
+            # 整個序列寫入新的世代目錄後才切換 CURRENT，讀取端不會看到新舊欄位混雜；
+            # 既有的記憶體映射仍指向舊檔案不受影響
+            old_generation = read_generation(path)
+            generation = f'gen-{int(old_generation[4:] or 0) + 1}'
+            generation_path = os.path.join(path, generation)
+            # 先前中斷的取代可能留下同名的未完成目錄
+            shutil.rmtree(generation_path, ignore_errors=True)
+            os.makedirs(generation_path)
+            for name in WRITE_ORDER:
+                with open(os.path.join(generation_path, f'{name}.bin'), 'wb') as f:
+                    f.write(arrays[name].astype(COLUMNS[name], copy=False).tobytes())
+            self._write_atomic(os.path.join(path, CURRENT_FILE), generation)
+            if old_generation:
+                shutil.rmtree(os.path.join(path, old_generation), ignore_errors=True)
+            else:
+                for name in COLUMNS:
+                    try:
+                        os.unlink(os.path.join(path, f'{name}.bin'))
+                    except FileNotFoundError:
+                        pass
+            series = self._get_series(key)
+            self._update_index(key, series)
+        return len(arrays['ts'])
+
+    def load_csv(self, symbol, source, interval='1d', market=None, replace=False):
+        """從 CSV 批次載入（欄位：date/ts, open, high, low, close, volume）
+
+        replace=False 時只追加晚於現有資料的列，重疊的列會被略過。
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, newline='', encoding='utf-8') as f:
+                return self.load_csv(symbol, f, interval, market, replace)
+        if isinstance(source, (bytes, bytearray)):
+            source = io.StringIO(source.decode('utf-8-sig'))
+
+        reader = csv.DictReader(source)
+        fields = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        time_field = next((fields[name] for name in CSV_TIME_FIELDS if name in fields), None)
+        if time_field is None:
+            raise ValueError('CSV 缺少時間欄位')
+        missing = [name for name in ('open', 'high', 'low', 'close') if name not in fields]
+        if missing:
+            raise ValueError(f"CSV 缺少欄位: {', '.join(missing)}")
+
+        rows = {name: [] for name in COLUMNS}
+        for row in reader:
+            ts = to_timestamp(row[time_field])
+            if ts is None:
+                continue
+            rows['ts'].append(ts)
+            for name in ('open', 'high', 'low', 'close'):
+                rows[name].append(float(row[fields[name]]))
+            volume = row[fields['volume']] if 'volume' in fields else ''
+            rows['volume'].append(float(volume) if volume not in (None, '') else 0.0)
+
+        arrays = self._to_arrays(rows)
+        # 排序並以最後出現的列去除重複時間
+        order = np.argsort(arrays['ts'], kind='stable')
+        arrays = {name: values[order] for name, values in arrays.items()}
+        if len(arrays['ts']):
+            keep = np.append(arrays['ts'][1:] != arrays['ts'][:-1], True)
+            arrays = {name: values[keep] for name, values in arrays.items()}
+
+        if replace:
+            return self.replace(symbol, arrays, interval, market)
+        last = self.last_bar(symbol, interval, market)
+        if last is not None:
+            newer = arrays['ts'] > last['ts']
+            arrays = {name: values[newer] for name, values in arrays.items()}
+        return self.append(symbol, arrays, interval, market)
+
+    @staticmethod
+    def _to_arrays(bars):
+        if isinstance(bars, dict):
+            arrays = {}
+            for name, dtype in COLUMNS.items():
+                if name == 'ts':
+                    values = [to_timestamp(value) for value in bars['ts']] \
+                        if not isinstance(bars['ts'], np.ndarray) else bars['ts']
+                else:
+                    values = bars.get(name)
+                    if values is None:
+                        values = np.zeros(len(bars['ts'])) if name == 'volume' else None
+                    if values is None:
+                        raise ValueError(f'缺少欄位: {name}')
+                arrays[name] = np.asarray(values, dtype=dtype)
+        else:
+            bars = list(bars)
+            arrays = {name: np.asarray(
+                [to_timestamp(bar['ts']) if name == 'ts' else bar.get(name, 0.0) for bar in bars],
+                dtype=dtype) for name, dtype in COLUMNS.items()}
+        lengths = {len(values) for values in arrays.values()}
+        if len(lengths) > 1:
+            raise ValueError('各欄位長度不一致')
+        return arrays
+
+    @staticmethod
+    def _truncate(path, count):
+        """將比 ts 長的欄位檔案截斷到 count 筆"""
+        for name, dtype in COLUMNS.items():
+            file_path = os.path.join(path, f'{name}.bin')
+            if os.path.exists(file_path) and os.path.getsize(file_path) > count * dtype.itemsize:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(count * dtype.itemsize)
+
+
+price_store = PriceStore()
@@ -0,0 +1,234 @@
+import threading
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.models.user import db
+from src.models.note import Note, note_tags
+from src.models.archive import NoteArchive
+from src.models.sync import changes_since, current_change_seq, id_batches
+from src.models.vector import NoteVector
+from src.services.jobs import enqueue, job_handler
+from src.services.tag_registry import tag_registry
+from src.utils.cache import cache
+from src.utils.lru import LRUCache
+from src.utils.sharding import RoutingSession, shard_router, use_shard
+from src.utils.text_delta import unpack_snapshot
+from src.utils.tfidf import TermIndex, term_counts, pack_vector, unpack_vector
+
+# 行程內保留向量索引的用戶數
+RELATED_INDEX_USERS = 200
+# 向量重建後以快取標籤 'note_vectors' 失效版本號，各 worker 重新載入
+VERSION_KEY = 'note_vectors:version'
+VERSION_TTL = 3600
+REBUILD_BATCH_SIZE = 500
+
+VECTOR_FIELDS = ('title', 'content', 'tags')
+
+
+def _tag_names(tag_ids):
+    by_id = {tag.id: tag.name for tag in tag_registry.all()}
+    return [by_id[tag_id] for tag_id in tag_ids if tag_id in by_id]
+
+
+def _vector_rows(notes):
+    """[(note_id, user_id, 標題, 內容, 標籤 id)] 轉成 note_vector 的資料列"""
+    now = datetime.utcnow()
+    rows = []
+    for note_id, user_id, title, content, tag_ids in notes:
+        counts = term_counts(title, content, _tag_names(tag_ids))
+        rows.append({'note_id': note_id, 'user_id': user_id, 'data': pack_vector(counts),
+                     'term_count': len(counts), 'updated_at': now})
+    return rows
+
+
+def _upsert(connection, rows):
+    if not rows:
+        return
+    upsert = sqlite_insert(NoteVector.__table__)
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=['note_id'],
+        set_={'data': upsert.excluded.data, 'term_count': upsert.excluded.term_count,
+              'updated_at': upsert.excluded.updated_at}
+    ), rows)
+
+
+def _vector_changed(note):
+    state = inspect(note)
+    if state.was_deleted:
+        return False
+    return any(state.attrs[name].history.has_changes() for name in VECTOR_FIELDS)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _update_note_vectors(session, flush_context):
+    # 筆記與 note_tags 都已寫入，在同一個交易中更新向量
+    notes = [obj for obj in session.new | session.dirty if isinstance(obj, Note) and _vector_changed(obj)]
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Note)]
+    if not notes and not deleted:
+        return
+    connection = session.connection(bind_arguments={'mapper': NoteVector})
+    if deleted:
+        connection.execute(NoteVector.__table__.delete().where(NoteVector.note_id.in_(deleted)))
+    if notes:
+        pairs = {}
+        note_ids = [note.id for note in notes]
+        for batch in id_batches(note_ids):
+            for note_id, tag_id in connection.execute(
+                db.select(note_tags.c.note_id, note_tags.c.tag_id).where(note_tags.c.note_id.in_(batch))
+            ):
+                pairs.setdefault(note_id, []).append(tag_id)
+        _upsert(connection, _vector_rows(
+            (note.id, note.user_id, note.title, note.full_content, pairs.get(note.id, ())) for note in notes
+        ))
+
+
+def _batch(after_id, batch_size, user_id=None, missing_only=False):
+    table = Note.__table__
+    query = db.select(table.c.id, table.c.user_id, table.c.title, table.c.content, NoteArchive.data)\
+              .outerjoin(NoteArchive.__table__, NoteArchive.note_id == table.c.id)\
+              .where(table.c.id > after_id)
+    if user_id is not None:
+        query = query.where(table.c.user_id == user_id)
+    if missing_only:
+        query = query.where(~db.exists().where(NoteVector.note_id == table.c.id))
+    return db.session.execute(query.order_by(table.c.id).limit(batch_size)).all()
+
+
+def rebuild_vectors(user_id=None, missing_only=False, batch_size=REBUILD_BATCH_SIZE, report=None):
+    """重新計算筆記向量（user_id 指定時只處理該用戶），返回處理筆數；完成後各 worker 重新載入索引"""
+    shards = [shard_router.shard_for_user(user_id)] if user_id is not None else shard_router.shard_ids()
+    processed = 0
+    for shard in shards:
+        with use_shard(shard):
+            last_id = 0
+            while True:
+                rows = _batch(last_id, batch_size, user_id, missing_only)
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                pairs = {}
+                for note_id, tag_id in db.session.execute(
+                    db.select(note_tags.c.note_id, note_tags.c.tag_id).where(note_tags.c.note_id.in_(ids))
+                ):
+                    pairs.setdefault(note_id, []).append(tag_id)
+                _upsert(db.session.connection(bind_arguments={'mapper': NoteVector}), _vector_rows(
+                    (row.id, row.user_id, row.title,
+                     unpack_snapshot(row.data) if row.data is not None else row.content,
+                     pairs.get(row.id, ())) for row in rows
+                ))
+                db.session.commit()
+                last_id = ids[-1]
+                processed += len(rows)
+                if report is not None:
+                    report(shard, last_id, processed)
+    if processed:
+        related_notes.invalidate()
+    return processed
+
+
+def _version():
+    # 停用共用快取時只在本行程內失效
+    if not cache.enabled:
+        return 'local'
+    return cache.get_or_set(VERSION_KEY, lambda: uuid4().hex, ttl=VERSION_TTL, tags=('note_vectors',))
+
+
+class UserVectors:
+    """單一用戶的筆記向量與 TF-IDF 反向索引（有變更時才重建索引）"""
+
+    __slots__ = ('seq', 'version', 'rows', 'index', 'lock')
+
+    def __init__(self):
+        self.seq = 0
+        self.version = None
+        self.rows = {}
+        self.index = None
+        self.lock = threading.Lock()
+
+    def _read(self, query):
+        for note_id, data in db.session.execute(query):
+            self.rows[note_id] = unpack_vector(data)
+
+    def load(self, user_id, version):
+        """自 note_vector 重新載入（先讀序號，之後的變更留給下一次同步）"""
+        self.seq = current_change_seq(user_id)
+        self.version = version
+        self.rows = {}
+        self.index = None
+        self._read(db.select(NoteVector.note_id, NoteVector.data).where(NoteVector.user_id == user_id))
+
+    def sync(self, user_id, version):
+        """套用序號 seq 之後的新增、修改與刪除；沒有變更時只需一次主鍵查詢"""
+        if version != self.version:
+            self.load(user_id, version)
+            return
+        seq, deleted, changed, reload = changes_since(user_id, self.seq)
+        if reload:
+            self.load(user_id, version)
+            return
+        if seq == self.seq:
+            return
+        changed = [note_id for (note_id,) in changed]
+        for note_id in deleted + changed:
+            self.rows.pop(note_id, None)
+        for batch in id_batches(changed):
+            self._read(db.select(NoteVector.note_id, NoteVector.data).where(NoteVector.note_id.in_(batch)))
+        self.index = None
+        self.seq = seq
+
+    def related(self, note_id, k):
+        vector = self.rows.get(note_id)
+        if vector is None:
+            return []
+        if self.index is None:
+            keys = list(self.rows)
+            self.index = TermIndex(keys, [self.rows[key] for key in keys])
+        return self.index.top(*vector, k=k, exclude=note_id)
+
+
+class RelatedNotes:
+    """相關筆記推薦：每位用戶只在自己的筆記中以 TF-IDF 餘弦相似度取前 k 筆
+
+    向量在寫入筆記時更新並存於 note_vector；行程內依用戶快取反向索引（LRU），
+    每次查詢前以筆記變更序號增量同步，其他 worker 的寫入也會反映出來。
+    """
+
+    def __init__(self, maxsize=RELATED_INDEX_USERS):
+        self._users = LRUCache(maxsize=maxsize)
+
+    def related(self, user_id, note_id, k=5):
+        """返回 [(note_id, 分數)]"""
+        version = _version()
+        with shard_router.for_user(user_id):
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = UserVectors()
+                self._users.put(user_id, entry)
+            with entry.lock:
+                entry.sync(user_id, version)
+                return entry.related(note_id, k)
+
+    def invalidate(self):
+        cache.invalidate(tags='note_vectors')
+        self._users.clear()
+
+
+related_notes = RelatedNotes()
+
+
+def schedule_vector_backfill():
+    """排入補算缺少向量的筆記（升級後的舊筆記）；已有排隊中的工作時不重複"""
+    job, _ = enqueue('rebuild_note_vectors', {'missing_only': True}, priority=-2,
+                     dedup_key='rebuild_note_vectors:missing')
+    return job
+
+
+@job_handler('rebuild_note_vectors')
+def rebuild_note_vectors_job(ctx):
+    def report(shard, last_id, processed):
+        ctx.report(0, message=f'分片 {shard} 已處理至 id {last_id}，共 {processed} 筆')
+    processed = rebuild_vectors(ctx.payload.get('user_id'), ctx.payload.get('missing_only', False), report=report)
+    return {'processed': processed}
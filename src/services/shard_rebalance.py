@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.models.user import db
+from src.models.note import Note
+from src.models.news import NewsBookmark
+from src.models.watchlist import Watchlist
+from src.models.shard import ShardAssignment
+from src.utils.sharding import shard_router
+
+# 搬移時每批複製的列數
+COPY_BATCH_SIZE = 1000
+# 各分片資料量與平均值的差距在此比例內視為平衡
+REBALANCE_TOLERANCE = 0.1
+
+# 計算分片負載的資料表（每位用戶擁有的列數）
+LOAD_MODELS = (Note, NewsBookmark, Watchlist)
+
+
+def _owned(table, user_id):
+    """用戶在分片資料表中的資料列條件（關聯表經由父資料表判斷）"""
+    if 'user_id' in table.c:
+        return table.c.user_id == user_id
+    for column in table.c:
+        for foreign_key in column.foreign_keys:
+            parent = foreign_key.column.table
+            if 'user_id' in parent.c:
+                return column.in_(select(parent.c.id).where(parent.c.user_id == user_id))
+    raise ValueError(f'無法判斷 {table.name} 的資料擁有者')
+
+
+def user_loads():
+    """返回 {分片: {user_id: 列數}}，依資料實際所在的分片統計"""
+    loads = {shard: {} for shard in shard_router.shard_ids()}
+    for model in LOAD_MODELS:
+        statement = db.select(model.user_id, db.func.count()).group_by(model.user_id)
+        for shard, rows in shard_router.scatter(statement):
+            for user_id, count in rows:
+                loads[shard][user_id] = loads[shard].get(user_id, 0) + count
+    return loads
+
+
+def shard_status():
+    """各分片的用戶數與資料列數"""
+    mapped = dict(db.session.query(ShardAssignment.shard, db.func.count()).group_by(ShardAssignment.shard).all())
+    loads = user_loads()
+    return [{
+        'shard': shard,
+        'assigned_users': mapped.get(shard, 0),
+        'users_with_data': len(loads[shard]),
+        'rows': sum(loads[shard].values())
+    } for shard in shard_router.shard_ids()]
+
+
+def move_user(user_id, target):
+    """將用戶的分片資料搬到 target 分片（保留原本的 id），返回搬移的列數
+
+    必須在停止寫入時執行（離線工具）。步驟可重複執行：先清除目標分片上殘留的副本再複製，
+    複製完成後才更新分片對應，最後刪除來源分片的資料。完成後需重新啟動各 worker，
+    讓行程內的分片對應快取失效。
+    """
+    source = shard_router.shard_for_user(user_id)
+    if source == target:
+        return 0
+    if target not in shard_router.shard_ids():
+        raise ValueError(f'分片 {target} 不存在')
+    tables = shard_router.sharded_tables(db.metadata)
+
+    moved = 0
+    with shard_router.engine(target).begin() as destination:
+        for table in reversed(tables):
+            destination.execute(table.delete().where(_owned(table, user_id)))
+        with shard_router.engine(source).connect() as origin:
+            for table in tables:
+                result = origin.execution_options(yield_per=COPY_BATCH_SIZE)\
+                               .execute(select(table).where(_owned(table, user_id)))
+                for rows in result.mappings().partitions():
+                    destination.execute(table.insert(), [dict(row) for row in rows])
+                    moved += len(rows)
+
+    upsert = sqlite_insert(ShardAssignment.__table__)
+    with shard_router.engine(0).begin() as primary:
+        primary.execute(
+            upsert.values(user_id=user_id, shard=target, moved_at=datetime.utcnow(), created_at=datetime.utcnow())
+            .on_conflict_do_update(index_elements=['user_id'],
+                                   set_={'shard': upsert.excluded.shard, 'moved_at': upsert.excluded.moved_at})
+        )
+    shard_router.forget(user_id)
+
+    with shard_router.engine(source).begin() as origin:
+        for table in reversed(tables):
+            origin.execute(table.delete().where(_owned(table, user_id)))
+    return moved
+
+
+def plan_rebalance(tolerance=REBALANCE_TOLERANCE):
+    """規劃搬移 [(user_id, 來源分片, 目標分片, 列數)]：反覆將最重分片中適當大小的用戶移到最輕的分片"""
+    loads = user_loads()
+    totals = {shard: sum(users.values()) for shard, users in loads.items()}
+    average = sum(totals.values()) / len(totals)
+    moves = []
+    while True:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        if totals[heaviest] - average <= average * tolerance:
+            return moves
+        # 搬移後兩個分片的差距要縮小：用戶的資料量必須小於兩者差距
+        gap = totals[heaviest] - totals[lightest]
+        candidates = [(rows, user_id) for user_id, rows in loads[heaviest].items() if rows < gap]
+        if not candidates:
+            return moves
+        rows, user_id = max(candidates, key=lambda item: min(item[0], gap - item[0]))
+        del loads[heaviest][user_id]
+        loads[lightest][user_id] = rows
+        totals[heaviest] -= rows
+        totals[lightest] += rows
+        moves.append((user_id, heaviest, lightest, rows))
@@ -0,0 +1,232 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.models.user import db
+from src.models.note import Note, note_symbols
+from src.models.archive import NoteArchive
+from src.models.news import NewsBookmark, NewsArticle, news_bookmark_symbols, news_article_symbols
+from src.models.symbol import Symbol
+from src.services.jobs import enqueue, job_handler
+from src.utils.aho_corasick import Automaton
+from src.utils.text_delta import unpack_snapshot
+from src.utils.sharding import SHARDED_TABLES, shard_router, use_shard
+
+LINK_BATCH_SIZE = 500
+# 新增或修改後稍等片刻再處理，讓短時間內的多筆寫入合併成同一批
+LINK_DELAY = 2
+# 至少兩個字元的代碼才比對，避免單一字母代碼大量誤判
+MIN_TICKER_LENGTH = 2
+
+# 需要辨識的資料表：(模型, 關聯表, 關聯表中的外鍵欄位, 掃描的文字欄位)
+TARGETS = {
+    'note': (Note, note_symbols, 'note_id', ('title', 'content')),
+    'news_bookmark': (NewsBookmark, news_bookmark_symbols, 'news_bookmark_id', ('title', 'summary')),
+    'news_article': (NewsArticle, news_article_symbols, 'article_id', ('title', 'description')),
+}
+
+# 辨識完成後的處理函式：目標類型 -> [函式(links)]，在同一交易中執行
+LINK_HOOKS = {}
+
+
+def on_linked(target):
+    """註冊辨識完成後的處理函式，函式接收 [{外鍵欄位: id, 'symbol_id': id}, ...]"""
+    def decorator(f):
+        LINK_HOOKS.setdefault(target, []).append(f)
+        return f
+    return decorator
+
+
+def _is_word_char(char):
+    return char.isascii() and char.isalnum()
+
+
+class SymbolMatcher:
+    """由股票主檔建立的多模式比對器
+
+    代碼（如 AAPL、2330）需區分大小寫並以單字邊界比對；公司名稱與別名
+    不分大小寫，英文名稱同樣需要單字邊界，中文名稱（如 台積電）直接比對。
+    """
+
+    def __init__(self, symbols):
+        self.automaton = Automaton()
+        for symbol in symbols:
+            if len(symbol.symbol_key) >= MIN_TICKER_LENGTH:
+                self.automaton.add(symbol.symbol_key.lower(), (symbol.id, symbol.symbol_key))
+            for name in [symbol.name] + symbol.alias_list():
+                if name and name != symbol.symbol_key:
+                    self.automaton.add(name.lower(), (symbol.id, None))
+        self.automaton.build()
+
+    def find(self, text):
+        """返回文字中提及的股票 id 集合"""
+        found = set()
+        if not text:
+            return found
+        lowered = text.lower()
+        if len(lowered) != len(text):  # 少數字元轉小寫後長度改變，無法以位置對照原文
+            lowered, text = text, text
+        last = len(text)
+        for start, end, (symbol_id, exact) in self.automaton.iter_matches(lowered):
+            if symbol_id in found:
+                continue
+            if exact is not None and text[start:end] != exact:
+                continue
+            if _is_word_char(lowered[start]) and start > 0 and _is_word_char(lowered[start - 1]):
+                continue
+            if _is_word_char(lowered[end - 1]) and end < last and _is_word_char(lowered[end]):
+                continue
+            found.add(symbol_id)
+        return found
+
+
+class SymbolLinker:
+    """股票提及辨識：比對器依主檔版本快取，主檔變更時自動重建"""
+
+    def __init__(self):
+        self._matcher = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _master_version(self):
+        return tuple(db.session.query(func.count(Symbol.id), func.max(Symbol.updated_at)).one())
+
+    def matcher(self):
+        version = self._master_version()
+        if self._matcher is None or version != self._version:
+            with self._lock:
+                if self._matcher is None or version != self._version:
+                    symbols = Symbol.query.filter_by(is_active=True).all()
+                    self._matcher = SymbolMatcher(symbols)
+                    self._version = version
+        return self._matcher
+
+    def link_batch(self, target, after_id=0, batch_size=LINK_BATCH_SIZE, matcher=None):
+        """處理 id 大於 after_id 的一批尚未辨識資料，返回 (最後處理的 id, 筆數)"""
+        model, link_table, fk_name, text_columns = TARGETS[target]
+        table = model.__table__
+        matcher = matcher or self.matcher()
+        guard_column = table.c.updated_at if 'updated_at' in table.c else None
+        selected = [table.c.id] + [table.c[name] for name in text_columns]
+        if guard_column is not None:
+            selected.append(guard_column)
+
+        rows = db.session.execute(
+            db.select(*selected)
+            .where(table.c.linked_at.is_(None), table.c.id > after_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return None, 0
+
+        ids = [row[0] for row in rows]
+        # 已封存筆記的內容在封存表（筆記表只剩空白內容）
+        archived = {}
+        if model is Note:
+            archived = {note_id: unpack_snapshot(data) for note_id, data in
+                        db.session.query(NoteArchive.note_id, NoteArchive.data).filter(NoteArchive.note_id.in_(ids))}
+        links = []
+        for row in rows:
+            values = [value for value in row[1:1 + len(text_columns)] if value]
+            if row[0] in archived:
+                values.append(archived[row[0]])
+            text = '\n'.join(values)
+            links.extend({fk_name: row[0], 'symbol_id': symbol_id} for symbol_id in matcher.find(text))
+
+        fk_column = link_table.c[fk_name]
+        db.session.execute(link_table.delete().where(fk_column.in_(ids)))
+        if links:
+            db.session.execute(link_table.insert(), links)
+            for hook in LINK_HOOKS.get(target, ()):
+                hook(links)
+
+        values = {'linked_at': datetime.utcnow()}
+        if guard_column is not None:
+            # 保留原本的修改時間；讀取後又被修改的資料保持未處理，留給下一輪
+            values['updated_at'] = guard_column
+            db.session.execute(
+                table.update()
+                .where(table.c.id == db.bindparam('row_id'),
+                       guard_column.is_not_distinct_from(db.bindparam('seen_updated_at')),
+                       table.c.linked_at.is_(None))
+                .values(**values),
+                [{'row_id': row[0], 'seen_updated_at': row[-1]} for row in rows]
+            )
+        else:
+            db.session.execute(
+                table.update().where(table.c.id.in_(ids), table.c.linked_at.is_(None)).values(**values)
+            )
+        db.session.commit()
+        return ids[-1], len(ids)
+
+    @staticmethod
+    def _shards(model):
+        """依用戶分片的資料表需要在每個分片各處理一次"""
+        return shard_router.shard_ids() if model.__table__.name in SHARDED_TABLES else (0,)
+
+    def link_pending(self, batch_size=LINK_BATCH_SIZE, max_passes=3, report=None):
+        """分批處理所有尚未辨識的筆記與新聞，返回各類型處理筆數
+
+        處理期間新增或修改的資料會在下一輪掃到，最多重複 max_passes 輪。
+        """
+        matcher = self.matcher()
+        counts = dict.fromkeys(TARGETS, 0)
+        for _ in range(max_passes):
+            processed = 0
+            for target, (model, _, _, _) in TARGETS.items():
+                for shard in self._shards(model):
+                    with use_shard(shard):
+                        processed += self._link_all(target, batch_size, matcher, counts, report)
+            if not processed or not self.has_pending():
+                break
+        return counts
+
+    def _link_all(self, target, batch_size, matcher, counts, report):
+        processed = 0
+        last_id = 0
+        while True:
+            last_id, count = self.link_batch(target, last_id, batch_size, matcher)
+            if last_id is None:
+                return processed
+            counts[target] += count
+            processed += count
+            if report is not None:
+                report(target, last_id)
+
+    def has_pending(self):
+        for model, _, _, _ in TARGETS.values():
+            for shard in self._shards(model):
+                with use_shard(shard):
+                    if db.session.query(model.id).filter(model.linked_at.is_(None)).first() is not None:
+                        return True
+        return False
+
+    def reset(self):
+        """主檔變更後將所有資料標記為未處理"""
+        for model, _, _, _ in TARGETS.values():
+            table = model.__table__
+            values = {'linked_at': None}
+            if 'updated_at' in table.c:
+                values['updated_at'] = table.c.updated_at
+            for shard in self._shards(model):
+                with use_shard(shard):
+                    db.session.execute(table.update().values(**values))
+                    db.session.commit()
+
+
+symbol_linker = SymbolLinker()
+
+
+def schedule_linking(delay=LINK_DELAY):
+    """排入股票辨識工作；已有排隊中的工作時合併處理"""
+    job, _ = enqueue('link_symbols', priority=-1, dedup_key='link_symbols', delay=delay)
+    return job
+
+
+@job_handler('link_symbols')
+def link_symbols_job(ctx):
+    def report(target, last_id):
+        ctx.report(0, message=f'{target} 已處理至 id {last_id}')
+    return symbol_linker.link_pending(report=report)
@@ -0,0 +1,236 @@
+import re
+import threading
+
+import numpy as np
+
+from src.models.user import db
+from src.models.note import Note, note_tags
+from src.models.sync import changes_since, current_change_seq, id_batches
+from src.services.tag_registry import tag_registry
+from src.utils.bitmap import Bitmap
+from src.utils.lru import LRUCache
+from src.utils.sharding import shard_router
+
+# 行程內保留標籤索引的用戶數
+TAG_INDEX_USERS = 1000
+
+TOKEN_RE = re.compile(r'\s*(\(|\)|"[^"]*"|[^\s()"]+)')
+
+
+def parse_tag_expression(expression):
+    """解析標籤運算式，例如「財報 AND 風險 NOT 賣出」、「(買入 OR 觀察) 長期」
+
+    優先順序 NOT > AND > OR；相鄰的標籤視為 AND，「A NOT B」表示 A AND NOT B，
+    含空白的標籤名稱以雙引號括起。返回 ('tag', 名稱) / ('not', x) / ('and' | 'or', a, b) 組成的樹，
+    格式錯誤時拋出 ValueError。
+    """
+    if (expression or '').count('"') % 2:
+        raise ValueError('標籤運算式的引號不成對')
+    tokens = TOKEN_RE.findall(expression or '')
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def factor():
+        token = peek()
+        if token is None or token == ')' or token.upper() in ('AND', 'OR'):
+            raise ValueError('標籤運算式不完整')
+        take()
+        if token.upper() == 'NOT':
+            return ('not', factor())
+        if token == '(':
+            node = either()
+            if peek() != ')':
+                raise ValueError('標籤運算式缺少右括號')
+            take()
+            return node
+        name = token[1:-1] if token.startswith('"') else token
+        if not name:
+            raise ValueError('標籤名稱不可為空')
+        return ('tag', name)
+
+    def both():
+        node = factor()
+        while peek() is not None and peek() != ')' and peek().upper() != 'OR':
+            if peek().upper() == 'AND':
+                take()
+            node = ('and', node, factor())
+        return node
+
+    def either():
+        node = both()
+        while peek() is not None and peek().upper() == 'OR':
+            take()
+            node = ('or', node, both())
+        return node
+
+    if not tokens:
+        raise ValueError('標籤運算式不可為空')
+    tree = either()
+    if peek() is not None:
+        raise ValueError('標籤運算式格式錯誤')
+    return tree
+
+
+def tag_names(tree):
+    if tree[0] == 'tag':
+        return {tree[1]} if isinstance(tree[1], str) else set()
+    return set().union(*(tag_names(child) for child in tree[1:]))
+
+
+def _note_columns():
+    """筆記 id 與建立時間；時間直接取資料庫中的 ISO 字串再由 numpy 解析，省去逐列轉換"""
+    table = Note.__table__
+    return table.c.id, db.type_coerce(table.c.created_at, db.String)
+
+
+def _note_rows(*conditions):
+    return db.session.execute(db.select(*_note_columns()).where(*conditions)).all()
+
+
+class UserTagIndex:
+    """單一用戶的標籤位元圖：每個標籤一個筆記 id 集合，加上依建立時間排序的筆記 id"""
+
+    __slots__ = ('seq', 'notes', 'tags', 'order', 'created', 'lock')
+
+    def __init__(self):
+        self.seq = 0
+        self.notes = Bitmap()
+        self.tags = {}
+        self.order = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype=np.int64)
+        self.lock = threading.Lock()
+
+    def _add_notes(self, rows):
+        """加入新筆記 [(id, 建立時間字串)]，維持 (建立時間, id) 的排序"""
+        if not rows:
+            return
+        ids = np.fromiter((row_id for row_id, _ in rows), dtype=np.int64, count=len(rows))
+        created = np.array([created_at or 'NaT' for _, created_at in rows], dtype='datetime64[us]').astype(np.int64)
+        self.order = np.concatenate([self.order, ids])
+        self.created = np.concatenate([self.created, created])
+        ranks = np.lexsort((self.order, self.created))
+        self.order, self.created = self.order[ranks], self.created[ranks]
+        self.notes = self.notes | Bitmap.from_ids(ids)
+
+    def _remove_notes(self, ids):
+        if not ids:
+            return
+        self.notes.discard_many(ids)
+        for bitmap in self.tags.values():
+            bitmap.discard_many(ids)
+        keep = ~np.isin(self.order, np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        self.order, self.created = self.order[keep], self.created[keep]
+
+    def load(self, user_id):
+        """自資料庫重建（先讀序號，之後的變更留給下一次同步）"""
+        self.seq = current_change_seq(user_id)
+        rows = _note_rows(Note.__table__.c.user_id == user_id)
+        self.notes, self.tags = Bitmap(), {}
+        self.order = np.empty(0, dtype=np.int64)
+        self.created = np.empty(0, dtype=np.int64)
+        self._add_notes(rows)
+        pairs = db.session.execute(
+            db.select(note_tags.c.tag_id, note_tags.c.note_id)
+            .join(Note.__table__, Note.__table__.c.id == note_tags.c.note_id)
+            .where(Note.__table__.c.user_id == user_id)
+        ).all()
+        grouped = {}
+        for tag_id, note_id in pairs:
+            grouped.setdefault(tag_id, []).append(note_id)
+        self.tags = {tag_id: Bitmap.from_ids(note_ids) for tag_id, note_ids in grouped.items()}
+
+    def sync(self, user_id):
+        """套用序號 seq 之後的新增、修改（含標籤）與刪除；沒有變更時只需一次主鍵查詢"""
+        seq, deleted, changed, reload = changes_since(user_id, self.seq, _note_columns())
+        if reload:
+            self.load(user_id)
+            return
+        if seq == self.seq:
+            return
+        # 先處理刪除再處理修改：被刪除後重新使用的 id 以目前的筆記為準
+        self._remove_notes(deleted)
+        self._add_notes([row for row in changed if row[0] not in self.notes])
+        changed_ids = [row_id for row_id, _ in changed]
+        for bitmap in self.tags.values():
+            bitmap.discard_many(changed_ids)
+        for batch in id_batches(changed_ids):
+            for tag_id, note_id in db.session.execute(
+                db.select(note_tags.c.tag_id, note_tags.c.note_id).where(note_tags.c.note_id.in_(batch))
+            ):
+                bitmap = self.tags.get(tag_id)
+                if bitmap is None:
+                    bitmap = self.tags[tag_id] = Bitmap()
+                bitmap.add(note_id)
+        self.tags = {tag_id: bitmap for tag_id, bitmap in self.tags.items() if bitmap}
+        self.seq = seq
+
+    def evaluate(self, tree, tag_ids):
+        kind = tree[0]
+        if kind == 'tag':
+            key = tree[1]
+            return self.tags.get(tag_ids.get(key) if isinstance(key, str) else key, Bitmap())
+        if kind == 'not':
+            return self.notes - self.evaluate(tree[1], tag_ids)
+        left = self.evaluate(tree[1], tag_ids)
+        if kind == 'and':
+            # A AND NOT B 直接做差集，不必先取補集
+            if tree[2][0] == 'not':
+                return left - self.evaluate(tree[2][1], tag_ids)
+            return left & self.evaluate(tree[2], tag_ids)
+        return left | self.evaluate(tree[2], tag_ids)
+
+    def newest_first(self, bitmap):
+        """依建立時間新到舊排列集合中的筆記 id"""
+        return self.order[np.isin(self.order, bitmap.to_array(), assume_unique=True)][::-1]
+
+
+class TagIndex:
+    """行程內的標籤位元圖索引（依用戶分開，LRU 淘汰）
+
+    每次查詢前以筆記變更序號（見 src/models/sync.py）增量同步，所以其他 worker 行程
+    寫入的筆記也會反映出來；標籤運算在位元圖上完成，再依建立時間排序分頁。
+    """
+
+    def __init__(self, maxsize=TAG_INDEX_USERS):
+        self._users = LRUCache(maxsize=maxsize)
+
+    def _entry(self, user_id):
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = UserTagIndex()
+            with entry.lock:
+                entry.load(user_id)
+            self._users.put(user_id, entry)
+        return entry
+
+    def select(self, user_id, tree, within=None):
+        """返回符合標籤運算式的筆記 id（numpy 陣列，新到舊）；within 為額外限制的 id 集合"""
+        names = tag_names(tree)
+        tag_ids = tag_registry.ids_by_name(names)
+        missing = names - tag_ids.keys()
+        if missing:
+            raise ValueError(f"找不到標籤: {', '.join(sorted(missing))}")
+        with shard_router.for_user(user_id):
+            entry = self._entry(user_id)
+            with entry.lock:
+                entry.sync(user_id)
+                matched = entry.evaluate(tree, tag_ids)
+                if within is not None:
+                    matched = matched & within
+                return entry.newest_first(matched)
+
+    def forget(self, user_id):
+        self._users.pop(user_id)
+
+    def clear(self):
+        self._users.clear()
+
+
+tag_index = TagIndex()
@@ -0,0 +1,110 @@
+import threading
+from uuid import uuid4
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.models.user import db
+from src.models.note import Note, Tag, note_tags
+from src.utils.cache import cache
+from src.utils.sharding import RoutingSession
+
+# 標籤登錄的版本號存放在共用快取；新增標籤時以快取標籤 'tags' 失效，各 worker 看到新版本號後重新載入
+REGISTRY_KEY = 'tag_registry:version'
+REGISTRY_TTL = 3600
+# IN 查詢每批的筆記數（SQLite 參數數量限制）
+ID_BATCH_SIZE = 500
+
+
+def _load_rows():
+    return [{'id': tag.id, 'name': tag.name, 'color': tag.color, 'created_at': tag.created_at}
+            for tag in db.session.query(Tag.id, Tag.name, Tag.color, Tag.created_at).order_by(Tag.id)]
+
+
+class TagRegistry:
+    """行程內的標籤登錄：標籤數量少且很少變動，載入一次後依 id 或名稱查找
+
+    登錄中的 Tag 是分離（detached）的唯讀物件；放進筆記的關聯時以 merge(load=False)
+    複製到目前的 session，不必查詢資料庫。
+    """
+
+    def __init__(self):
+        self._version = None
+        self._by_id = None
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        # 停用共用快取時只在本行程內失效
+        version = cache.get_or_set(REGISTRY_KEY, lambda: uuid4().hex, ttl=REGISTRY_TTL, tags=('tags',)) \
+            if cache.enabled else 'local'
+        with self._lock:
+            if self._by_id is not None and version == self._version:
+                return self._by_id, self._by_name
+        return self.reload(version)
+
+    def reload(self, version=None):
+        """重新自資料庫載入（遇到尚未同步的新標籤時也會呼叫）"""
+        by_id = {}
+        for row in _load_rows():
+            tag = Tag(**row)
+            make_transient_to_detached(tag)
+            by_id[tag.id] = tag
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = {tag.name: tag for tag in by_id.values()}
+            if version is not None:
+                self._version = version
+            return self._by_id, self._by_name
+
+    def invalidate(self):
+        """新增標籤後呼叫，所有 worker 下次查找時重新載入"""
+        cache.invalidate(tags='tags')
+        with self._lock:
+            self._by_id = None
+
+    def all(self):
+        by_id, _ = self._snapshot()
+        return list(by_id.values())
+
+    def ids_by_name(self, names):
+        _, by_name = self._snapshot()
+        return {name: by_name[name].id for name in names if name in by_name}
+
+    def get_many(self, tag_ids):
+        """目前 session 中的 Tag（依 id 去重，不存在的 id 略過）"""
+        by_id, _ = self._snapshot()
+        if any(tag_id not in by_id for tag_id in tag_ids):
+            by_id, _ = self.reload()
+        return [db.session.merge(by_id[tag_id], load=False)
+                for tag_id in dict.fromkeys(tag_ids) if tag_id in by_id]
+
+    def attach(self, notes, fields=None):
+        """以批次 IN 查詢只讀取 (note_id, tag_id)，標籤物件取自登錄，填入各筆記的 tags 關聯"""
+        if fields is not None and 'tags' not in fields:
+            return notes
+        note_ids = [note.id for note in notes]
+        pairs = {}
+        for start in range(0, len(note_ids), ID_BATCH_SIZE):
+            for note_id, tag_id in db.session.execute(
+                db.select(note_tags.c.note_id, note_tags.c.tag_id)
+                .where(note_tags.c.note_id.in_(note_ids[start:start + ID_BATCH_SIZE]))
+                .order_by(note_tags.c.note_id, note_tags.c.tag_id)
+            ):
+                pairs.setdefault(note_id, []).append(tag_id)
+        tags = {tag.id: tag for tag in self.get_many([tag_id for ids in pairs.values() for tag_id in ids])}
+        for note in notes:
+            set_committed_value(note, 'tags', [tags[tag_id] for tag_id in pairs.get(note.id, ()) if tag_id in tags])
+        return notes
+
+
+tag_registry = TagRegistry()
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _load_deleted_note_tags(session, flush_context, instances):
+    # 刪除筆記時 SQLAlchemy 需要標籤集合才能刪除 note_tags；一次批次載入，避免逐筆延遲查詢
+    notes = [obj for obj in session.deleted if isinstance(obj, Note) and 'tags' in inspect(obj).unloaded]
+    if notes:
+        tag_registry.attach(notes)
@@ -0,0 +1,80 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import User, db
+
+# 三字元組索引至少需要三個字元，較短的關鍵字以有筆數上限的逐筆掃描找中間包含的用戶
+MIN_INFIX_LENGTH = 3
+# 搜尋結果最多往後翻到第幾筆（capped=1 不計算總數的模式）
+MAX_SEARCH_DEPTH = 200
+
+
+def prefix_bounds(prefix):
+    """前綴搜尋的索引範圍 [lower, upper)，避免 LIKE 無法使用索引"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def fts_phrase(keyword):
+    return '"' + keyword.replace('"', '""') + '"'
+
+
+def _contains(keyword):
+    pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return User.username_lower.like(pattern, escape='\\') | User.email_lower.like(pattern, escape='\\')
+
+
+def _prefix_ids(column, keyword, limit):
+    lower, upper = prefix_bounds(keyword)
+    return [row_id for (row_id,) in
+            db.session.query(User.id).filter(column >= lower, column < upper).order_by(column, User.id).limit(limit)]
+
+
+def _scan_ids(keyword, limit):
+    return [row_id for (row_id,) in
+            db.session.query(User.id).filter(_contains(keyword)).order_by(User.id).limit(limit)]
+
+
+def _infix_ids(keyword, limit):
+    if len(keyword) < MIN_INFIX_LENGTH:
+        return _scan_ids(keyword, limit)
+    try:
+        rows = db.session.execute(
+            text('SELECT rowid FROM user_search WHERE user_search MATCH :phrase ORDER BY rowid LIMIT :limit'),
+            {'phrase': fts_phrase(keyword), 'limit': limit}
+        )
+        return [row_id for (row_id,) in rows]
+    except OperationalError:
+        # 沒有全文索引時退回逐筆掃描（仍有筆數上限）
+        db.session.rollback()
+        return _scan_ids(keyword, limit)
+
+
+def search_user_ids(keyword, limit, offset=0):
+    """返回 (依相關度排序的用戶 id, 是否還有更多)
+
+    排序：用戶名稱前綴、電子郵件前綴，接著是名稱或電子郵件中間包含關鍵字的用戶。
+    每個來源都只讀取需要的筆數（短關鍵字的中間比對是有筆數上限的逐筆掃描），不計算總數。
+    """
+    keyword = keyword.lower()
+    needed = offset + limit + 1
+    ids = dict.fromkeys(_prefix_ids(User.username_lower, keyword, needed))
+    if len(ids) < needed:
+        ids.update(dict.fromkeys(_prefix_ids(User.email_lower, keyword, needed)))
+    if len(ids) < needed:
+        ids.update(dict.fromkeys(_infix_ids(keyword, needed)))
+    ids = list(ids)[offset:offset + limit + 1]
+    return ids[:limit], len(ids) > limit
+
+
+def count_matches(keyword):
+    """符合條件的用戶總數（capped=1 的模式只在明確要求時計算）"""
+    keyword = keyword.lower()
+    if len(keyword) >= MIN_INFIX_LENGTH:
+        try:
+            return db.session.execute(
+                text('SELECT COUNT(*) FROM user_search WHERE user_search MATCH :phrase'),
+                {'phrase': fts_phrase(keyword)}
+            ).scalar()
+        except OperationalError:
+            db.session.rollback()
+    return db.session.query(db.func.count(User.id)).filter(_contains(keyword)).scalar()
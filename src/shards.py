@@ -0,0 +1,48 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from src.main import app, init_database
+from src.services.shard_rebalance import shard_status, move_user, plan_rebalance, REBALANCE_TOLERANCE
+from src.utils.sharding import shard_router
+
+if __name__ == '__main__':
+    # 離線分片維護工具（執行前先停止網站與背景工作行程，完成後重新啟動）：
+    #   python src/shards.py status
+    #   python src/shards.py move <user_id> <shard>
+    #   python src/shards.py rebalance [--tolerance 0.1] [--apply]
+    parser = argparse.ArgumentParser(description='用戶分片維護')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='各分片的用戶數與資料列數')
+    move = commands.add_parser('move', help='將用戶搬到指定分片')
+    move.add_argument('user_id', type=int)
+    move.add_argument('shard', type=int)
+    rebalance = commands.add_parser('rebalance', help='規劃並執行（--apply）分片平衡')
+    rebalance.add_argument('--tolerance', type=float, default=REBALANCE_TOLERANCE)
+    rebalance.add_argument('--apply', action='store_true')
+    args = parser.parse_args()
+
+    init_database()
+    with app.app_context():
+        if not shard_router.enabled:
+            print('未設定 SHARD_DATABASE_URIS，所有資料都在主資料庫')
+            sys.exit(1)
+
+        if args.command == 'status':
+            for row in shard_status():
+                print(f"分片 {row['shard']}: 分配用戶 {row['assigned_users']}，"
+                      f"有資料的用戶 {row['users_with_data']}，資料列 {row['rows']}")
+        elif args.command == 'move':
+            moved = move_user(args.user_id, args.shard)
+            print(f'用戶 {args.user_id} 已搬到分片 {args.shard}（{moved} 列）')
+        else:
+            moves = plan_rebalance(args.tolerance)
+            for user_id, source, target, rows in moves:
+                print(f'用戶 {user_id}: 分片 {source} -> {target}（{rows} 列）')
+                if args.apply:
+                    move_user(user_id, target)
+            if not moves:
+                print('分片已平衡')
+            elif not args.apply:
+                print('加上 --apply 執行搬移')
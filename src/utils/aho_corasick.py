@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class Automaton:
+    """Aho-Corasick 多模式字串比對
+
+    所有模式建成一個自動機，掃描一次文字即可找出全部出現位置，
+    成本只與文字長度及命中數成正比，與模式數量無關。
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+        self.size = 0
+
+    def add(self, pattern, value):
+        """加入一個模式；同一模式可以對應多個值"""
+        if not pattern:
+            return
+        if self._built:
+            raise RuntimeError('自動機建立後不能再加入模式')
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((len(pattern), value))
+        self.size += 1
+
+    def build(self):
+        """以廣度優先計算失敗連結，並把失敗狀態的輸出合併進來"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                if self._out[self._fail[next_state]]:
+                    self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text):
+        """逐一產生 (起點, 終點, 值)，終點不含"""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                end = index + 1
+                for length, value in out[state]:
+                    yield end - length, end, value
@@ -0,0 +1,19 @@
+import numpy as np
+
+
+def first_of_runs(sorted_values):
+    """已排序陣列中每段相同值的第一個位置（布林遮罩）"""
+    mask = np.empty(len(sorted_values), dtype=bool)
+    mask[:1] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=mask[1:])
+    return mask
+
+
+def sorted_unique(values):
+    """排序並去除重複值
+
+    np.unique 的通用路徑（NaN 處理、回傳索引與計數）在大陣列上明顯較慢，
+    這裡只需排序後比較相鄰元素。
+    """
+    values = np.sort(np.asarray(values))
+    return values[first_of_runs(values)]
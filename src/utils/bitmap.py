@@ -0,0 +1,201 @@
+import numpy as np
+
+from src.utils.arrays import first_of_runs, sorted_unique
+
+# Roaring 格式：id 依高位（id >> 16）分桶，每桶存低 16 位
+# 筆數不超過 ARRAY_MAX 的桶用排序的 uint16 陣列，較密的桶改用 8KB 位元集
+ARRAY_MAX = 4096
+BITSET_BYTES = 1 << 13
+
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint16)
+
+
+def _to_bitset(container):
+    if len(container) == BITSET_BYTES and container.dtype == np.uint8:
+        return container
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder='little')
+
+
+def _to_array(bitset):
+    return np.flatnonzero(np.unpackbits(bitset, bitorder='little')).astype(np.uint16)
+
+
+def _is_bitset(container):
+    return container.dtype == np.uint8
+
+
+def _cardinality(container):
+    return int(_POPCOUNT[container].sum()) if _is_bitset(container) else len(container)
+
+
+def _normalize(container):
+    """依筆數選擇容器格式，空桶返回 None"""
+    count = _cardinality(container)
+    if count == 0:
+        return None
+    if _is_bitset(container):
+        return _to_array(container) if count <= ARRAY_MAX else container
+    return _to_bitset(container) if count > ARRAY_MAX else container
+
+
+def _bit_test(bitset, lows):
+    return (bitset[lows >> 3] >> (lows & 7).astype(np.uint8)) & 1 == 1
+
+
+def _and(a, b):
+    if not _is_bitset(a) and not _is_bitset(b):
+        return np.intersect1d(a, b, assume_unique=True)
+    if not _is_bitset(a):
+        return a[_bit_test(b, a)]
+    if not _is_bitset(b):
+        return b[_bit_test(a, b)]
+    return _normalize(a & b)
+
+
+def _or(a, b):
+    if not _is_bitset(a) and not _is_bitset(b) and len(a) + len(b) <= ARRAY_MAX:
+        return sorted_unique(np.concatenate([a, b]))
+    return _normalize(_to_bitset(a) | _to_bitset(b))
+
+
+def _sub(a, b):
+    if not _is_bitset(a):
+        return a[~_bit_test(b, a)] if _is_bitset(b) else np.setdiff1d(a, b, assume_unique=True)
+    return _normalize(a & ~_to_bitset(b))
+
+
+def _buckets(ids):
+    """依高位分桶，逐桶返回 (高位, 排序且不重複的低 16 位)"""
+    values = sorted_unique(np.fromiter(ids, dtype=np.int64))
+    if not len(values):
+        return
+    # 值已排序，高位相同的 id 相鄰，每段的起點就是一個桶
+    highs = values >> 16
+    starts = np.flatnonzero(first_of_runs(highs))
+    for key, chunk in zip(highs[starts].tolist(), np.split(values, starts[1:])):
+        yield key, (chunk & 0xFFFF).astype(np.uint16)
+
+
+class Bitmap:
+    """壓縮的整數集合（Roaring bitmap），支援交集、聯集與差集
+
+    稀疏的 id 只佔每筆 2 bytes，密集的區段每 65536 個 id 固定 8KB；
+    集合運算逐桶進行，兩邊都沒有的桶直接略過。
+    """
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, containers=None):
+        self._containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        return cls({key: _normalize(lows) for key, lows in _buckets(ids)})
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self._containers.values())
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if _is_bitset(container):
+            return bool(container[low >> 3] >> (low & 7) & 1)
+        position = np.searchsorted(container, low)
+        return position < len(container) and container[position] == low
+
+    def add(self, value):
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = np.array([low], dtype=np.uint16)
+        elif _is_bitset(container):
+            container[low >> 3] |= 1 << (low & 7)
+        else:
+            position = np.searchsorted(container, low)
+            if position == len(container) or container[position] != low:
+                self._containers[key] = _normalize(np.insert(container, position, low))
+
+    def discard(self, value):
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            return
+        if _is_bitset(container):
+            container[low >> 3] &= ~np.uint8(1 << (low & 7))
+            updated = _normalize(container)
+        else:
+            position = np.searchsorted(container, low)
+            if position == len(container) or container[position] != low:
+                return
+            updated = np.delete(container, position) if len(container) > 1 else None
+        if updated is None:
+            del self._containers[key]
+        else:
+            self._containers[key] = updated
+
+    def discard_many(self, ids):
+        """批次移除多個 id：每個桶只做一次差集與格式檢查（逐筆 discard 在位元集上每次都要重新計數）"""
+        for key, lows in _buckets(ids):
+            container = self._containers.get(key)
+            if container is None:
+                continue
+            updated = _sub(container, lows)
+            if updated is None or not len(updated):
+                del self._containers[key]
+            else:
+                self._containers[key] = updated
+
+    def copy(self):
+        return Bitmap({key: container.copy() for key, container in self._containers.items()})
+
+    def _combine(self, other, operation, keys):
+        containers = {}
+        for key in keys:
+            left, right = self._containers.get(key), other._containers.get(key)
+            # 只有一邊有的桶複製一份，結果不與來源共用可修改的容器
+            if right is None:
+                result = left.copy()
+            elif left is None:
+                result = right.copy()
+            else:
+                result = operation(left, right)
+            if result is not None and len(result):
+                containers[key] = result
+        return Bitmap(containers)
+
+    def __and__(self, other):
+        return self._combine(other, _and, self._containers.keys() & other._containers.keys())
+
+    def __or__(self, other):
+        return self._combine(other, _or, self._containers.keys() | other._containers.keys())
+
+    def __sub__(self, other):
+        return self._combine(other, _sub, self._containers.keys())
+
+    def to_array(self):
+        """遞增排序的 id 陣列（int64）"""
+        if not self._containers:
+            return np.empty(0, dtype=np.int64)
+        chunks = []
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            lows = _to_array(container) if _is_bitset(container) else container
+            chunks.append((np.int64(key) << 16) | lows.astype(np.int64))
+        return np.concatenate(chunks)
+
+    def __iter__(self):
+        return iter(self.to_array().tolist())
+
+    @property
+    def nbytes(self):
+        return sum(container.nbytes for container in self._containers.values())
+
+    def __repr__(self):
+        return f'<Bitmap {len(self)} ids, {self.nbytes} bytes>'
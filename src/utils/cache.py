@@ -0,0 +1,402 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from src.utils.lru import LRUCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    tags TEXT NOT NULL DEFAULT '',
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires_at);
+CREATE TABLE IF NOT EXISTS cache_tag (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tag, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cache_invalidation (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# 失效紀錄保留秒數，worker 超過這段時間未同步時直接清空記憶體層
+INVALIDATION_RETENTION = 300
+
+
+class SQLiteCacheStore:
+    """共用快取層：本機 SQLite 檔案，所有 gunicorn worker 讀寫同一份資料
+
+    另以 cache_invalidation 記錄依鍵或標籤的失效事件，讓各 worker 同步清除自己的記憶體層。
+    """
+
+    def __init__(self, path, max_entries=10000, busy_timeout=2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self.evictions = 0
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connect(self):
+        # fork 之後不能沿用父行程的連線
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if not self._initialized:
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, now=None):
+        """返回 (值, 到期時間, 標籤) 或 None"""
+        row = self._connect().execute(
+            'SELECT value, expires_at, tags FROM cache_entry WHERE key = ? AND expires_at > ?',
+            (key, now or time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1], tuple(row[2].split('\n')) if row[2] else ()
+
+    def latest_invalidation(self):
+        """最新的失效事件 id，計算快取值之前記下，寫入時用來判斷期間是否有失效"""
+        return self._connect().execute('SELECT MAX(id) FROM cache_invalidation').fetchone()[0] or 0
+
+    def set(self, key, value, expires_at, tags=(), since=None):
+        """寫入項目；指定 since 時若之後已有此鍵、標籤或全部的失效事件則不寫入並返回 False"""
+        conn = self._connect()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if since is not None:
+                names = (key,) + tuple(tags)
+                placeholders = ', '.join('?' * len(names))
+                stale = conn.execute(
+                    "SELECT 1 FROM cache_invalidation WHERE id > ? AND "
+                    f"(kind = 'all' OR (kind IN ('key', 'tag') AND name IN ({placeholders}))) LIMIT 1",
+                    (since,) + names
+                ).fetchone()
+                if stale is not None:
+                    conn.execute('ROLLBACK')
+                    return False
+            conn.execute('DELETE FROM cache_tag WHERE key = ?', (key,))
+            conn.execute(
+                'INSERT INTO cache_entry (key, value, tags, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, tags = excluded.tags, '
+                'expires_at = excluded.expires_at',
+                (key, blob, '\n'.join(tags), expires_at)
+            )
+            if tags:
+                conn.executemany('INSERT OR IGNORE INTO cache_tag (tag, key) VALUES (?, ?)',
+                                 [(tag, key) for tag in tags])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def _delete_keys(self, conn, keys):
+        conn.executemany('DELETE FROM cache_entry WHERE key = ?', [(key,) for key in keys])
+        conn.executemany('DELETE FROM cache_tag WHERE key = ?', [(key,) for key in keys])
+
+    def invalidate(self, keys=(), tags=()):
+        """刪除指定鍵與標籤下的所有項目，並記錄失效事件供其他 worker 同步"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            keys = set(keys)
+            for tag in tags:
+                keys.update(key for (key,) in conn.execute('SELECT key FROM cache_tag WHERE tag = ?', (tag,)))
+            self._delete_keys(conn, keys)
+            conn.executemany(
+                'INSERT INTO cache_invalidation (kind, name, created_at) VALUES (?, ?, ?)',
+                [('key', key, now) for key in keys] + [('tag', tag, now) for tag in tags]
+            )
+            conn.execute('DELETE FROM cache_invalidation WHERE created_at < ?', (now - INVALIDATION_RETENTION,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(keys)
+
+    def invalidations_since(self, last_id):
+        """返回 (最新事件 id, [(類型, 名稱)], 是否有遺漏的事件)"""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT id, kind, name FROM cache_invalidation WHERE id > ? ORDER BY id', (last_id,)
+        ).fetchall()
+        if not rows:
+            if last_id is None:
+                latest = conn.execute('SELECT MAX(id) FROM cache_invalidation').fetchone()[0]
+                return latest or 0, [], False
+            return last_id, [], False
+        # 最舊的事件已被清除時無法確定漏掉哪些，由呼叫端整個清空
+        missed = last_id is not None and rows[0][0] > last_id + 1 and conn.execute(
+            'SELECT 1 FROM cache_invalidation WHERE id <= ? LIMIT 1', (last_id,)
+        ).fetchone() is None
+        return rows[-1][0], [(kind, name) for _, kind, name in rows], missed
+
+    def prune(self, now=None):
+        """刪除過期項目；超過筆數上限時先淘汰最早到期的項目"""
+        conn = self._connect()
+        now = now or time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = [key for (key,) in conn.execute('SELECT key FROM cache_entry WHERE expires_at <= ?', (now,))]
+            excess = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0] - len(expired) - self.max_entries
+            evicted = []
+            if excess > 0:
+                evicted = [key for (key,) in conn.execute(
+                    'SELECT key FROM cache_entry WHERE expires_at > ? ORDER BY expires_at LIMIT ?', (now, excess)
+                )]
+            self._delete_keys(conn, expired + evicted)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.evictions += len(evicted)
+        return len(expired), len(evicted)
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+
+    def reset(self):
+        """清空共用快取並通知所有 worker 清空記憶體層"""
+        conn = self._connect()
+        conn.execute('DELETE FROM cache_entry')
+        conn.execute('DELETE FROM cache_tag')
+        conn.execute('INSERT INTO cache_invalidation (kind, name, created_at) VALUES (?, ?, ?)',
+                     ('all', '', time.time()))
+
+
+class TieredCache:
+    """兩層快取：每個 worker 的記憶體 LRU（含 TTL），加上所有 worker 共用的 SQLite 層
+
+    寫入同時寫兩層；讀取先查記憶體，未命中再查共用層並回填記憶體。依鍵或標籤失效時
+    刪除共用層並記錄事件，其他 worker 最多在 CACHE_SYNC_INTERVAL 秒後同步清除記憶體層。
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        self.memory = LRUCache(1024)
+        self.sync_interval = 1.0
+        self.default_ttl = 60
+        self._tag_keys = {}
+        self._lock = threading.Lock()
+        self._last_event = None
+        self._next_sync = 0
+        self._sets = 0
+        self.counters = dict.fromkeys(
+            ('memory_hits', 'shared_hits', 'misses', 'sets', 'invalidations', 'errors'), 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        default_path = os.path.join(app.root_path, 'database', 'cache.db')
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_STORAGE_PATH', default_path)
+        app.config.setdefault('CACHE_MEMORY_SIZE', 1024)
+        app.config.setdefault('CACHE_SHARED_MAX_ENTRIES', 10000)
+        app.config.setdefault('CACHE_SYNC_INTERVAL', 1.0)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        self.store = SQLiteCacheStore(app.config['CACHE_STORAGE_PATH'],
+                                      max_entries=app.config['CACHE_SHARED_MAX_ENTRIES'])
+        self.memory = LRUCache(app.config['CACHE_MEMORY_SIZE'])
+        self.sync_interval = app.config['CACHE_SYNC_INTERVAL']
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        app.extensions['cache'] = self
+
+    def _enabled(self):
+        return self.store is not None and current_app.config.get('CACHE_ENABLED', True)
+
+    @property
+    def enabled(self):
+        return self._enabled()
+
+    def _bump(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _remember(self, key, value, expires_at, tags):
+        self.memory.put(key, (expires_at, value, tags))
+        with self._lock:
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+
+    def _forget(self, keys=(), tags=()):
+        keys = set(keys)
+        with self._lock:
+            for tag in tags:
+                keys.update(self._tag_keys.pop(tag, ()))
+        for key in keys:
+            self.memory.pop(key)
+
+    def _forget_all(self):
+        self.memory.clear()
+        with self._lock:
+            self._tag_keys.clear()
+
+    def sync(self, force=False):
+        """套用其他 worker 記錄的失效事件到本行程的記憶體層"""
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        last_id, events, missed = self.store.invalidations_since(self._last_event)
+        if self._last_event is not None and (missed or any(kind == 'all' for kind, _ in events)):
+            self._forget_all()
+        else:
+            self._forget(keys=[name for kind, name in events if kind == 'key'],
+                         tags=[name for kind, name in events if kind == 'tag'])
+        self._last_event = last_id
+
+    def get(self, key, default=None):
+        if not self._enabled():
+            return default
+        try:
+            self.sync()
+            now = time.time()
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._bump('memory_hits')
+                return entry[1]
+            shared = self.store.get(key, now)
+        except (sqlite3.Error, pickle.PickleError):
+            self._bump('errors')
+            return default
+        if shared is None:
+            self._bump('misses')
+            return default
+        value, expires_at, tags = shared
+        self._remember(key, value, expires_at, tags)
+        self._bump('shared_hits')
+        return value
+
+    def invalidation_marker(self):
+        """計算快取值之前取得，傳給 set(since=...)，計算期間發生的失效會讓這次寫入作廢"""
+        if not self._enabled():
+            return None
+        try:
+            return self.store.latest_invalidation()
+        except sqlite3.Error:
+            self._bump('errors')
+            return None
+
+    def set(self, key, value, ttl=None, tags=(), since=None):
+        if not self._enabled():
+            return
+        tags = tuple(dict.fromkeys(tags))
+        expires_at = time.time() + (ttl or self.default_ttl)
+        self._remember(key, value, expires_at, tags)
+        try:
+            if not self.store.set(key, value, expires_at, tags, since):
+                # 計算期間資料已失效，值可能是舊的
+                self._forget(keys=(key,))
+                return
+            self._sets += 1
+            # 每寫入一定次數清理一次共用層，避免每次寫入都要掃描
+            if self._sets % 200 == 0:
+                self.store.prune()
+        except (sqlite3.Error, pickle.PickleError):
+            self._bump('errors')
+            return
+        self._bump('sets')
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            since = self.invalidation_marker()
+            value = compute()
+            self.set(key, value, ttl, tags, since)
+        return value
+
+    def invalidate(self, keys=(), tags=()):
+        """依鍵或標籤失效（所有 worker），返回共用層刪除的筆數"""
+        if isinstance(keys, str):
+            keys = (keys,)
+        if isinstance(tags, str):
+            tags = (tags,)
+        self._forget(keys, tags)
+        if self.store is None:
+            return 0
+        try:
+            removed = self.store.invalidate(keys, tags)
+        except sqlite3.Error:
+            self._bump('errors')
+            return 0
+        self._bump('invalidations')
+        return removed
+
+    def clear(self):
+        self._forget_all()
+        if self.store is not None:
+            self.store.reset()
+
+    @property
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['shared_hits'] + counters['misses']
+        counters.update(
+            pid=os.getpid(),
+            hit_rate=round((counters['memory_hits'] + counters['shared_hits']) / lookups, 4) if lookups else None,
+            memory_entries=len(self.memory),
+            memory_evictions=self.memory.evictions,
+            shared_evictions=self.store.evictions if self.store is not None else 0
+        )
+        return counters
+
+    def cached(self, ttl=None, tags=(), key_func=None, per_user=False):
+        """路由回應快取裝飾器，只快取 200 回應
+
+        tags 可以是標籤列表，或接收路由參數並返回標籤列表的函式，例如
+        @cache.cached(ttl=60, tags=lambda symbol: ('prices', f'prices:{symbol.upper()}'))
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self._enabled() or request.method != 'GET':
+                    return f(*args, **kwargs)
+                key = key_func(*args, **kwargs) if key_func else request.full_path
+                if per_user:
+                    key = f"{key}|user:{session.get('user_id')}"
+                key = f'view:{request.endpoint}|{key}'
+
+                entry = self.get(key)
+                if entry is not None:
+                    body, status, mimetype = entry
+                    response = current_app.response_class(body, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                # 產生回應期間若有失效（例如匯入新價格），不把可能過時的內容寫入快取
+                since = self.invalidation_marker()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    entry_tags = tags(*args, **kwargs) if callable(tags) else tags
+                    self.set(key, (response.get_data(), response.status_code, response.mimetype),
+                             ttl, entry_tags, since)
+                    response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+
+cache = TieredCache()
@@ -0,0 +1,94 @@
+import zlib
+
+from flask import current_app, request
+
+DEFAULT_MIMETYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+)
+
+# gzip 格式（zlib 的 wbits=31 代表帶 gzip header）
+GZIP_WBITS = 31
+
+
+def gzip_stream(chunks, level=6, flush_size=16 * 1024):
+    """逐塊壓縮可迭代的回應內容，不需先把整個回應載入記憶體"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    pending = 0
+    first = True
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        # 第一塊立即送出，之後每累積 flush_size 才強制 flush，兼顧首位元組延遲與壓縮率
+        if first or pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def gzip_bytes(body, level=6):
+    """一次壓縮完整的回應內容"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class ResponseCompressor:
+    """回應壓縮中介層：超過門檻且類型在允許清單內的回應以 gzip 傳送"""
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.after_request(self.after_request)
+        app.extensions['response_compressor'] = self
+
+    def should_compress(self, response, config):
+        """判斷回應是否需要壓縮"""
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return False
+        if request.accept_encodings['gzip'] <= 0:
+            return False
+        if response.is_streamed:
+            return True
+        return (response.content_length or 0) >= config['COMPRESS_MIN_SIZE']
+
+    def after_request(self, response):
+        config = current_app.config
+        if not self.should_compress(response, config):
+            return response
+
+        level = config['COMPRESS_LEVEL']
+        if response.is_streamed:
+            # 生成器回應：邊產生邊壓縮，長度未知因此移除 Content-Length
+            response.direct_passthrough = False
+            response.response = gzip_stream(response.response, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(gzip_bytes(response.get_data(), level))
+
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # 壓縮後內容不同，強 ETag 改為弱 ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
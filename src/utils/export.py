@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+# 每累積這麼多列才送出一塊，減少小封包
+CHUNK_ROWS = 500
+# 試算表會把這些字元開頭的儲存格當成公式執行
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def parse_format(value):
+    """解析 format= 參數，預設為 csv"""
+    fmt = (value or 'csv').strip().lower()
+    if fmt not in EXPORT_MIMETYPES:
+        raise ValueError(f"無效的匯出格式: {fmt}（可用 {', '.join(EXPORT_MIMETYPES)}）")
+    return fmt
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cell(value):
+    value = _plain(value)
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(columns, rows):
+    """逐塊產生 CSV；標題列先送出，讓客戶端立即收到第一個位元組"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # UTF-8 BOM 讓 Excel 正確辨識中文
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_cell(value) for value in row])
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def iter_ndjson(columns, rows):
+    """逐塊產生 NDJSON（每列一個 JSON 物件）"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({name: _plain(value) for name, value in zip(columns, row)},
+                                ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def export_response(columns, rows, fmt, filename, total=None):
+    """以生成器串流匯出，rows 為可迭代的資料列（依 columns 順序）
+
+    整個回應不會載入記憶體；生成器在請求上下文中執行，可以繼續使用資料庫 session。
+    """
+    generate = iter_csv if fmt == 'csv' else iter_ndjson
+    response = Response(stream_with_context(generate(columns, rows)), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # 反向代理不要緩衝，否則第一個位元組要等到整個匯出完成才送出
+    response.headers['X-Accel-Buffering'] = 'no'
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    return response
@@ -0,0 +1,33 @@
+from sqlalchemy.orm import lazyload, load_only, selectinload
+
+
+def parse_fields(raw, model):
+    """解析 fields= 參數，返回欄位集合；未提供時返回 None（輸出全部欄位）"""
+    if not raw:
+        return None
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = fields - set(model.FIELD_COLUMNS)
+    if unknown:
+        raise ValueError(f"無效的欄位: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def field_options(model, fields, relationships=()):
+    """依請求欄位產生查詢選項：SQL 只選取需要的欄位，未請求的關聯不載入
+
+    欄位需要的關聯（model.FIELD_PRELOAD）以一次 IN 查詢批次載入，避免每列各查一次。
+    """
+    preload = [selectinload(getattr(model, name))
+               for field, names in getattr(model, 'FIELD_PRELOAD', {}).items()
+               if fields is None or field in fields
+               for name in names]
+    if fields is None:
+        return preload
+    columns = {'id'}
+    for name in fields:
+        columns.update(model.FIELD_COLUMNS[name])
+    options = [load_only(*(getattr(model, column) for column in sorted(columns)))]
+    for name in relationships:
+        if name not in fields:
+            options.append(lazyload(getattr(model, name)))
+    return options + preload
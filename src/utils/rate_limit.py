@@ -0,0 +1,264 @@
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+# 結構版本（PRAGMA user_version）；限流狀態可以捨棄，舊版的資料表直接重建
+SCHEMA_VERSION = 2
+# 每個行程每處理這麼多次 take 就清除一次已補滿的令牌桶（補滿的桶與不存在的桶等價）
+PRUNE_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_bucket (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    full_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight_lease (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_inflight_lease_scope ON inflight_lease (scope, expires_at);
+"""
+
+
+def parse_rate(rate):
+    """解析 '10/minute' 形式的速率，返回 (次數, 秒數)"""
+    count, _, period = rate.partition('/')
+    period = period.strip().rstrip('s')
+    if period not in PERIODS:
+        raise ValueError(f'無效的速率格式: {rate}')
+    return int(count), PERIODS[period]
+
+
+def client_key():
+    """預設的限流鍵：已登入用戶用 user_id，否則用 IP"""
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    return ip_key()
+
+
+def ip_key():
+    """依用戶端 IP 的限流鍵
+
+    部署在反向代理之後時 remote_addr 是代理的位址，所有匿名用戶會共用同一個令牌桶；
+    需設定 RATELIMIT_TRUSTED_PROXIES，由 ProxyFix 以代理附加的 X-Forwarded-For 還原。
+    """
+    return f'ip:{request.remote_addr}'
+
+
+class SQLiteBucketStore:
+    """以本機 SQLite 檔案保存令牌桶與併發租約，讓所有 gunicorn worker 共用"""
+
+    def __init__(self, path, busy_timeout=2.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._initialized = False
+        self._takes = itertools.count(1)
+
+    def _migrate(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS rate_bucket')
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        # fork 之後不能沿用父行程的連線
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        if not self._initialized:
+            self._migrate(conn)
+            self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, capacity, refill_per_second, cost=1):
+        """從令牌桶取出令牌，返回 (是否允許, 剩餘令牌, 需等待秒數)"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM rate_bucket WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                tokens = float(capacity)
+            else:
+                tokens = min(capacity, row[0] + max(0.0, now - row[1]) * refill_per_second)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                'INSERT INTO rate_bucket (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, '
+                'full_at = excluded.full_at',
+                (key, tokens, now, now + (capacity - tokens) / refill_per_second)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if next(self._takes) % PRUNE_INTERVAL == 0:
+            self.prune(now)
+        retry_after = 0 if allowed else (cost - tokens) / refill_per_second
+        return allowed, tokens, retry_after
+
+    def prune(self, now=None):
+        """刪除已補滿的令牌桶，避免每個出現過的 IP 或用戶都永久留下一列，返回刪除筆數"""
+        now = time.time() if now is None else now
+        return self._connect().execute('DELETE FROM rate_bucket WHERE full_at <= ?', (now,)).rowcount
+
+    def acquire(self, scope, limit, ttl):
+        """取得併發租約，超過上限時返回 None"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 清除已過期的租約（例如 worker 當機時遺留的）
+            conn.execute('DELETE FROM inflight_lease WHERE scope = ? AND expires_at < ?', (scope, now))
+            in_flight = conn.execute(
+                'SELECT COUNT(*) FROM inflight_lease WHERE scope = ?', (scope,)
+            ).fetchone()[0]
+            lease_id = None
+            if in_flight < limit:
+                lease_id = conn.execute(
+                    'INSERT INTO inflight_lease (scope, expires_at) VALUES (?, ?)', (scope, now + ttl)
+                ).lastrowid
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return lease_id
+
+    def release(self, lease_id):
+        """釋放併發租約"""
+        self._connect().execute('DELETE FROM inflight_lease WHERE id = ?', (lease_id,))
+
+    def reset(self):
+        """清空所有限流狀態"""
+        conn = self._connect()
+        conn.execute('DELETE FROM rate_bucket')
+        conn.execute('DELETE FROM inflight_lease')
+
+
+class RateLimiter:
+    """跨 worker 共用的令牌桶限流與併發負載卸除"""
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        default_path = os.path.join(app.root_path, 'database', 'ratelimit.db')
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_PATH', default_path)
+        self.store = SQLiteBucketStore(app.config['RATELIMIT_STORAGE_PATH'])
+        app.extensions['rate_limiter'] = self
+
+    def _enabled(self):
+        return self.store is not None and current_app.config.get('RATELIMIT_ENABLED', True)
+
+    def check(self, rate, burst=None, key_func=None, scope=None):
+        """執行一次限流檢查，被拒絕時返回 429 回應，否則返回 None"""
+        if not self._enabled():
+            return None
+        count, period = parse_rate(rate)
+        capacity = burst or count
+        scope = scope or request.endpoint
+        key = f'{scope}|{(key_func or client_key)()}'
+        try:
+            allowed, _, retry_after = self.store.take(key, capacity, count / period)
+        except sqlite3.Error:
+            # 限流儲存異常時放行，不影響正常服務
+            return None
+        if allowed:
+            return None
+        response = jsonify({'error': '請求過於頻繁，請稍後再試'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        response.headers['X-RateLimit-Limit'] = str(capacity)
+        response.headers['X-RateLimit-Remaining'] = '0'
+        return response
+
+    def limit(self, rate, burst=None, key_func=None, scope=None):
+        """路由限流裝飾器，例如 @limiter.limit('10/minute', key_func=ip_key)"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                rejected = self.check(rate, burst, key_func, scope)
+                if rejected is not None:
+                    return rejected
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+    def limit_blueprint(self, blueprint, rate, burst=None, key_func=None):
+        """對整個藍圖套用同一個限流設定（藍圖內共用一個令牌桶）"""
+        scope = f'bp:{blueprint.name}'
+
+        @blueprint.before_request
+        def blueprint_rate_limit():
+            return self.check(rate, burst, key_func, scope)
+
+        return blueprint
+
+    def shed(self, max_in_flight, retry_after=1, status=503, ttl=60, scope=None):
+        """併發負載卸除：同時處理中的請求超過上限時直接拒絕，不排隊"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self._enabled():
+                    return f(*args, **kwargs)
+                name = scope or request.endpoint
+                try:
+                    lease_id = self.store.acquire(name, max_in_flight, ttl)
+                except sqlite3.Error:
+                    return f(*args, **kwargs)
+                if lease_id is None:
+                    response = jsonify({'error': '伺服器忙碌中，請稍後再試'})
+                    response.status_code = status
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    try:
+                        self.store.release(lease_id)
+                    except sqlite3.Error:
+                        pass  # 租約會在 ttl 後自動過期
+            return decorated_function
+        return decorator
+
+
+limiter = RateLimiter()
@@ -0,0 +1,88 @@
+import difflib
+
+from sqlalchemy import func
+
+from src.utils.text_delta import (
+    apply_delta, make_delta, pack_delta, pack_snapshot, unpack_delta, unpack_snapshot
+)
+
+# 每隔多少個版本存一次完整快照，還原任一版本最多套用 SNAPSHOT_INTERVAL - 1 個差異
+SNAPSHOT_INTERVAL = 10
+
+
+def load_revision_content(model, note_id, revision):
+    """從最近的快照開始套用差異，還原指定版本的內容"""
+    snapshot = model.query.filter(
+        model.note_id == note_id,
+        model.revision <= revision,
+        model.is_snapshot.is_(True)
+    ).order_by(model.revision.desc()).first()
+    if snapshot is None:
+        return None
+
+    content = unpack_snapshot(snapshot.data)
+    deltas = model.query.filter(
+        model.note_id == note_id,
+        model.revision > snapshot.revision,
+        model.revision <= revision
+    ).order_by(model.revision).all()
+    for row in deltas:
+        content = apply_delta(content, unpack_delta(row.data))
+    if deltas and deltas[-1].revision != revision:
+        return None
+    return content
+
+
+def append_revision(session, model, note_id, title, content):
+    """在版本歷史末端加入一個版本；內容與標題都沒變時不記錄"""
+    last = model.query.filter_by(note_id=note_id).order_by(model.revision.desc()).first()
+    if last is None:
+        revision, data, is_snapshot = 1, pack_snapshot(content), True
+    else:
+        previous = load_revision_content(model, note_id, last.revision)
+        if previous == content and last.title == title:
+            return None
+        revision = last.revision + 1
+        last_snapshot = model.query.with_entities(func.max(model.revision)).filter(
+            model.note_id == note_id, model.is_snapshot.is_(True)
+        ).scalar() or 0
+        snapshot_data = pack_snapshot(content)
+        if previous is None or revision - last_snapshot >= SNAPSHOT_INTERVAL:
+            data, is_snapshot = snapshot_data, True
+        else:
+            data, is_snapshot = pack_delta(make_delta(previous, content)), False
+            # 大幅改寫時差異可能比快照還大，直接存快照
+            if len(data) >= len(snapshot_data):
+                data, is_snapshot = snapshot_data, True
+
+    row = model(
+        note_id=note_id,
+        revision=revision,
+        is_snapshot=is_snapshot,
+        title=title,
+        data=data,
+        content_length=len(content),
+        stored_size=len(data)
+    )
+    session.add(row)
+    return row
+
+
+def diff_revisions(old_content, new_content, old_label, new_label):
+    """產生兩個版本之間的 unified diff"""
+    return ''.join(difflib.unified_diff(
+        old_content.splitlines(keepends=True),
+        new_content.splitlines(keepends=True),
+        fromfile=old_label,
+        tofile=new_label
+    ))
+
+
+def inline_changes(old_content, new_content):
+    """字元級的變更清單，適合少換行的中文段落"""
+    matcher = difflib.SequenceMatcher(None, old_content, new_content, autojunk=False)
+    return [
+        {'op': tag, 'old': old_content[i1:i2], 'new': new_content[j1:j2], 'position': i1}
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
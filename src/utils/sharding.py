@@ -0,0 +1,277 @@
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
+
+from sqlalchemy import create_engine, event, inspect, text
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.util import find_tables
+
+from src.utils.lru import LRUCache
+
+# 依用戶分片的資料表名稱（由 @sharded 註冊）
+SHARDED_TABLES = set()
+# 每個分片的 id 範圍大小：分片 k 新增的資料 id 從 k * SHARD_ID_SPAN 開始，
+# 搬移用戶時保留原本的 id，不會與目標分片的資料衝突
+SHARD_ID_SPAN = 2 ** 40
+
+SEQUENCE_DDL = """
+CREATE TABLE IF NOT EXISTS shard_sequence (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+)
+"""
+
+
+def _allocate_id(mapper, connection, target):
+    router = current_app.extensions.get('shard_router') if has_app_context() else None
+    if router is not None and router.enabled and getattr(target, 'id', None) is None:
+        target.id = router.allocate_id(connection, mapper.local_table.name)
+
+
+def sharded(target):
+    """標記模型或關聯表依用戶分片；有整數 id 的模型在分片模式下改由分片序號配發 id"""
+    table = getattr(target, '__table__', target)
+    SHARDED_TABLES.add(table.name)
+    if table is not target and 'id' in table.c:
+        event.listen(target, 'before_insert', _allocate_id)
+    return target
+
+
+def touches_sharded(mapper=None, clause=None):
+    if mapper is not None:
+        if inspect(mapper).local_table.name in SHARDED_TABLES:
+            return True
+    if clause is not None:
+        return any(getattr(table, 'name', None) in SHARDED_TABLES
+                   for table in find_tables(clause, include_crud=True, include_joins=True,
+                                            include_aliases=True))
+    return False
+
+
+def _writes_sharded_secondary(mapper):
+    """多對多關聯的另一端（例如標籤、股票主檔）：flush 時關聯表的寫入使用這一端的連線"""
+    return any(relationship.secondary is not None and relationship.secondary.name in SHARDED_TABLES
+               for other in mapper.registry.mappers for relationship in other.relationships
+               if relationship.mapper is mapper)
+
+
+class RoutingSession(Session):
+    """依目前分片選擇連線：涉及分片資料表的語句送往目前用戶所在的分片，其餘送往主資料庫"""
+
+    def _routes_to_shard(self, mapper, clause):
+        if touches_sharded(mapper, clause):
+            return True
+        # flush 寫入分片關聯表（note_tags 等）時 SQLAlchemy 以關聯另一端的模型取得連線；
+        # 該模型本身沒有待寫入的資料時改用分片連線（主資料庫已附加，仍可讀取共用資料表）
+        if mapper is None or clause is not None or not self._flushing:
+            return False
+        mapper = inspect(mapper)
+        if not _writes_sharded_secondary(mapper):
+            return False
+        if any(isinstance(instance, mapper.class_) for instance in chain(self.new, self.deleted)):
+            return False
+        # 反向關聯（例如 Tag.notes）的集合變更不算待寫入
+        return not any(isinstance(instance, mapper.class_) and self.is_modified(instance, include_collections=False)
+                       for instance in self.dirty)
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('shard_router')
+            if router is not None and router.enabled and self._routes_to_shard(mapper, clause):
+                return router.engine(router.current_shard())
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_shard(shard):
+    """在區塊內將分片資料表的讀寫導向指定分片；寫入需在區塊內提交"""
+    previous = g.get('shard')
+    g.shard = shard
+    try:
+        yield shard
+    finally:
+        g.shard = previous
+
+
+class ShardRouter:
+    """用戶分片：分片 0 為主資料庫，SHARD_DATABASE_URIS 列出其他分片（SQLite 檔案）
+
+    每位用戶的筆記、標籤關聯、新聞收藏與自選股只存在所屬分片；分片對應表（shard_map）
+    存在主資料庫。分片連線會以 ref 名稱附加主資料庫，讓分片上的查詢仍能 JOIN 用戶、
+    標籤、股票主檔等共用資料表（SQLite 找不到資料表時會依序搜尋附加的資料庫）。
+    """
+
+    def __init__(self, app=None):
+        self.uris = []
+        self._engines = {}
+        self._assignments = LRUCache(100000)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SHARD_DATABASE_URIS', [])
+        self.uris = list(app.config['SHARD_DATABASE_URIS'])
+        self.app = app
+        app.extensions['shard_router'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.uris)
+
+    @property
+    def count(self):
+        return len(self.uris) + 1
+
+    def shard_ids(self):
+        return range(self.count)
+
+    def _primary(self):
+        return self.app.extensions['sqlalchemy'].engine
+
+    def engine(self, shard):
+        if not shard:
+            return self._primary()
+        engine = self._engines.get(shard)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(shard)
+                if engine is None:
+                    engine = create_engine(self.uris[shard - 1])
+                    primary_path = self._primary().url.database
+                    if engine.dialect.name == 'sqlite' and primary_path:
+                        @event.listens_for(engine, 'connect')
+                        def attach_primary(dbapi_connection, connection_record):
+                            dbapi_connection.execute('ATTACH DATABASE ? AS ref', (primary_path,))
+                    self._engines[shard] = engine
+        return engine
+
+    def shard_of_engine(self, engine):
+        if engine is self._primary():
+            return 0
+        for shard, candidate in self._engines.items():
+            if candidate is engine:
+                return shard
+        raise ValueError('不是分片連線')
+
+    # 分片對應
+    def place(self, user_id):
+        """新用戶的分片（依 id 輪流分配）"""
+        return user_id % self.count
+
+    def shard_for_user(self, user_id):
+        """用戶所在分片；沒有對應紀錄的舊用戶在分片 0"""
+        if not self.enabled or user_id is None:
+            return 0
+        shard = self._assignments.get(user_id)
+        if shard is None:
+            with self._primary().connect() as conn:
+                shard = conn.execute(text('SELECT shard FROM shard_map WHERE user_id = :user_id'),
+                                     {'user_id': user_id}).scalar() or 0
+            self._assignments.put(user_id, shard)
+        return shard
+
+    def forget(self, user_id=None):
+        """清除分片對應快取（搬移用戶後）"""
+        if user_id is None:
+            self._assignments.clear()
+        else:
+            self._assignments.pop(user_id)
+
+    def for_user(self, user_id):
+        """在區塊內讀寫指定用戶所在的分片（例如管理員操作其他用戶的資料）"""
+        return use_shard(self.shard_for_user(user_id))
+
+    def current_shard(self):
+        """目前的分片：use_shard 指定的分片，否則為登入用戶所在的分片"""
+        shard = g.get('shard')
+        if shard is None:
+            if has_request_context() and 'user_id' in session:
+                shard = g.shard = self.shard_for_user(session['user_id'])
+            else:
+                shard = 0
+        return shard
+
+    # id 配發
+    def allocate_id(self, connection, table_name):
+        """從連線所在分片的序號表取得下一個 id（與寫入在同一交易中）"""
+        shard = self.shard_of_engine(connection.engine)
+        statement = text('UPDATE shard_sequence SET next_id = next_id + 1 WHERE name = :name RETURNING next_id - 1')
+        allocated = connection.execute(statement, {'name': table_name}).scalar()
+        if allocated is None:
+            # 第一次配發：從本分片範圍內現有的最大 id 接續（不受搬入資料的 id 影響）
+            base = shard * SHARD_ID_SPAN
+            connection.execute(
+                text(f'INSERT OR IGNORE INTO shard_sequence (name, next_id) '
+                        f'SELECT :name, COALESCE(MAX(id), :base) + 1 FROM "{table_name}" '
+                        f'WHERE id >= :base AND id < :limit'),
+                {'name': table_name, 'base': base, 'limit': base + SHARD_ID_SPAN}
+            )
+            allocated = connection.execute(statement, {'name': table_name}).scalar()
+        return allocated
+
+    # 結構
+    def sharded_tables(self, metadata):
+        return [table for table in metadata.sorted_tables if table.name in SHARDED_TABLES]
+
+    def create_all(self, metadata):
+        """在所有分片建立分片資料表與序號表（分片 0 的資料表由 db.create_all 建立）"""
+        for shard in self.shard_ids():
+            engine = self.engine(shard)
+            if shard:
+                metadata.create_all(bind=engine, tables=self.sharded_tables(metadata))
+            if self.enabled:
+                with engine.begin() as conn:
+                    conn.execute(text(SEQUENCE_DDL))
+
+    # 跨分片查詢
+    def scatter(self, statement, params=None, shards=None):
+        """在每個分片平行執行同一個 Core 查詢，返回 [(分片, [列...])]"""
+        # 連線引擎在目前執行緒取得（需要應用上下文），查詢在執行緒池中執行
+        engines = {shard: self.engine(shard) for shard in (self.shard_ids() if shards is None else shards)}
+
+        def run(shard):
+            with engines[shard].connect() as conn:
+                return shard, conn.execute(statement, params or {}).all()
+        if len(engines) == 1:
+            return [run(shard) for shard in engines]
+        with ThreadPoolExecutor(max_workers=min(len(engines), 8)) as pool:
+            return list(pool.map(run, engines))
+
+    def stream(self, statement, chunk_size=1000, shards=None):
+        """每個分片一個生成器，以伺服器端游標分塊讀取查詢結果（搭配 merge_sorted 合併）"""
+        def rows(engine):
+            with engine.connect() as conn:
+                result = conn.execution_options(yield_per=chunk_size).execute(statement)
+                for row in result:
+                    yield row
+        return [rows(self.engine(shard)) for shard in (self.shard_ids() if shards is None else shards)]
+
+
+def merge_sorted(streams, key=None, reverse=False, limit=None):
+    """合併各分片已排序的結果（k 路合併，不需全部載入記憶體）"""
+    merged = heapq.merge(*streams, key=key, reverse=reverse)
+    for index, item in enumerate(merged):
+        if limit is not None and index >= limit:
+            return
+        yield item
+
+
+def merge_counts(results):
+    """合併各分片 GROUP BY 的 (鍵, 數量) 結果"""
+    totals = {}
+    for _, rows in results:
+        for key, count in rows:
+            totals[key] = totals.get(key, 0) + count
+    return totals
+
+
+def merge_scalars(results):
+    """加總各分片 COUNT/SUM 的單一結果"""
+    return sum(rows[0][0] or 0 for _, rows in results if rows)
+
+
+shard_router = ShardRouter()
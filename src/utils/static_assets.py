@@ -0,0 +1,167 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用依賴，缺少時只提供 gzip
+    brotli = None
+
+# 檔名中帶有內容雜湊的資源，例如 app.3f2a9c1b.js
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{8,}\.[A-Za-z0-9]+$')
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+)
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=3600'
+INDEX_CACHE = 'no-cache'
+
+# 壓縮後至少要省下這個比例才保留壓縮版本
+MIN_COMPRESSION_GAIN = 0.1
+
+
+class StaticAsset:
+    """單一靜態資源及其預壓縮版本"""
+
+    __slots__ = ('path', 'body', 'mimetype', 'etag', 'size', 'variants', 'fingerprinted')
+
+    def __init__(self, path, body, mimetype, fingerprinted=False):
+        self.path = path
+        self.body = body
+        self.mimetype = mimetype
+        self.size = len(body)
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.fingerprinted = fingerprinted
+        self.variants = {}
+
+    @property
+    def fingerprint_path(self):
+        """帶有內容雜湊的檔名，例如 css/site.<hash>.css"""
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.{self.etag[:12]}{ext}'
+
+    def compress(self):
+        """產生 gzip / brotli 預壓縮版本"""
+        if not self.mimetype.startswith(COMPRESSIBLE_TYPES) or self.size < 256:
+            return
+        limit = self.size * (1 - MIN_COMPRESSION_GAIN)
+        gz = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if len(gz) < limit:
+            self.variants['gzip'] = gz
+        if brotli is not None:
+            br = brotli.compress(self.body, quality=11)
+            if len(br) < limit:
+                self.variants['br'] = br
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'fingerprint_path': self.fingerprint_path,
+            'mimetype': self.mimetype,
+            'etag': self.etag,
+            'size': self.size,
+            'variants': {name: len(data) for name, data in self.variants.items()}
+        }
+
+
+class StaticManifest:
+    """啟動時建立的靜態資源清單，請求時不再查詢檔案系統"""
+
+    def __init__(self, static_folder, index_name='index.html'):
+        self.static_folder = static_folder
+        self.index_name = index_name
+        self.assets = {}
+        self.build()
+
+    def build(self):
+        """掃描靜態目錄，計算雜湊、大小與預壓縮版本"""
+        assets = {}
+        if self.static_folder and os.path.isdir(self.static_folder):
+            for dirpath, _, filenames in os.walk(self.static_folder):
+                for filename in filenames:
+                    full_path = os.path.join(dirpath, filename)
+                    rel_path = os.path.relpath(full_path, self.static_folder).replace(os.sep, '/')
+                    with open(full_path, 'rb') as f:
+                        body = f.read()
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    asset = StaticAsset(rel_path, body, mimetype,
+                                        fingerprinted=bool(FINGERPRINT_RE.search(filename)))
+                    asset.compress()
+                    assets[rel_path] = asset
+                    # 同時以雜湊檔名提供，讓前端可以使用長效快取
+                    if not asset.fingerprinted and rel_path != self.index_name:
+                        assets[asset.fingerprint_path] = asset
+        self.assets = assets
+
+    @property
+    def index(self):
+        return self.assets.get(self.index_name)
+
+    def lookup(self, path):
+        """依請求路徑取得資源；未知的前端路由回退到 index.html"""
+        if path:
+            asset = self.assets.get(path)
+            if asset is not None:
+                return asset, path != asset.path or asset.fingerprinted
+            # 有副檔名的路徑視為缺少的檔案，不再回退到 index.html
+            if '.' in path.rsplit('/', 1)[-1]:
+                return None, False
+        return self.index, False
+
+    def serve(self, path):
+        """以清單中的資源建立回應"""
+        asset, immutable = self.lookup(path)
+        if asset is None:
+            return None
+
+        if immutable:
+            cache_control = IMMUTABLE_CACHE
+        elif asset.path == self.index_name:
+            cache_control = INDEX_CACHE
+        else:
+            cache_control = DEFAULT_CACHE
+
+        # 不同編碼的內容不同，ETag 也要區分
+        encoding = self.negotiate(asset)
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+        if not immutable and request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = cache_control
+            if asset.variants:
+                response.vary.add('Accept-Encoding')
+            return response
+
+        body = asset.variants[encoding] if encoding else asset.body
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def negotiate(self, asset):
+        """依 Accept-Encoding 選擇最佳的預壓縮版本"""
+        accept = request.accept_encodings
+        best, best_quality = None, 0
+        for encoding in ('br', 'gzip'):
+            if encoding not in asset.variants:
+                continue
+            quality = accept[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
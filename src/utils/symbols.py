@@ -0,0 +1,38 @@
+import re
+
+# 交易所後綴對應的市場代碼
+SUFFIX_MARKETS = {
+    'TW': 'TWSE',
+    'TWO': 'TPEX',
+    'HK': 'HKEX',
+    'T': 'TSE',
+    'SS': 'SSE',
+    'SZ': 'SZSE',
+}
+
+TW_CODE_RE = re.compile(r'^\d{4,6}[A-Z]?$')
+
+
+def normalize_symbol(symbol, market=None):
+    """正規化股票代碼，返回 (symbol_key, market_key)
+
+    例如 ' tsm ' -> ('TSM', 'US')、'2330.TW' -> ('2330', 'TWSE')、'2330' -> ('2330', 'TWSE')
+    """
+    if not symbol:
+        return None, None
+    key = symbol.strip().upper()
+    if not key:
+        return None, None
+
+    market_key = market.strip().upper() if market and market.strip() else None
+    base, dot, suffix = key.rpartition('.')
+    if dot and base and suffix in SUFFIX_MARKETS:
+        key = base
+        market_key = market_key or SUFFIX_MARKETS[suffix]
+
+    if market_key is None:
+        market_key = 'TWSE' if TW_CODE_RE.match(key) else 'US'
+    # 美股各交易所共用同一個代碼空間
+    if market_key in ('NASDAQ', 'NYSE', 'AMEX'):
+        market_key = 'US'
+    return key[:20], market_key[:10]
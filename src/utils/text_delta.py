@@ -0,0 +1,105 @@
+import difflib
+import json
+import zlib
+
+# 中間差異超過此長度時改用逐行比對，避免字元級比對的平方時間
+CHAR_DIFF_LIMIT = 20000
+
+
+def _common_affixes(base, target):
+    """計算共同前綴與後綴長度，大部分編輯只改動一小段"""
+    limit = min(len(base), len(target))
+    prefix = 0
+    while prefix < limit and base[prefix] == target[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and base[-1 - suffix] == target[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def _split_lines(text):
+    lines = text.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return lines, offsets
+
+
+def make_delta(base, target):
+    """產生由 base 變成 target 的差異指令
+
+    指令為 [offset, length]（從 base 複製）或字串（插入新文字）。
+    """
+    prefix, suffix = _common_affixes(base, target)
+    base_mid = base[prefix:len(base) - suffix]
+    target_mid = target[prefix:len(target) - suffix]
+
+    ops = []
+
+    def copy(offset, length):
+        if length <= 0:
+            return
+        if ops and isinstance(ops[-1], list) and ops[-1][0] + ops[-1][1] == offset:
+            ops[-1][1] += length
+        else:
+            ops.append([offset, length])
+
+    def insert(text):
+        if not text:
+            return
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        else:
+            ops.append(text)
+
+    copy(0, prefix)
+    if max(len(base_mid), len(target_mid)) <= CHAR_DIFF_LIMIT:
+        matcher = difflib.SequenceMatcher(None, base_mid, target_mid, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                copy(prefix + i1, i2 - i1)
+            elif tag in ('replace', 'insert'):
+                insert(target_mid[j1:j2])
+    else:
+        base_lines, base_offsets = _split_lines(base_mid)
+        target_lines, target_offsets = _split_lines(target_mid)
+        matcher = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                copy(prefix + base_offsets[i1], base_offsets[i2] - base_offsets[i1])
+            elif tag in ('replace', 'insert'):
+                insert(target_mid[target_offsets[j1]:target_offsets[j2]])
+    copy(len(base) - suffix, suffix)
+    return ops
+
+
+def apply_delta(base, ops):
+    """套用差異指令還原目標文字"""
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            offset, length = op
+            parts.append(base[offset:offset + length])
+    return ''.join(parts)
+
+
+def pack_snapshot(text):
+    """壓縮完整內容"""
+    return zlib.compress(text.encode('utf-8'), 9)
+
+
+def unpack_snapshot(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def pack_delta(ops):
+    """壓縮差異指令"""
+    raw = json.dumps(ops, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return zlib.compress(raw, 9)
+
+
+def unpack_delta(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
@@ -0,0 +1,156 @@
+import math
+import operator
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from src.utils.minhash import WORD_RE, CJK_RE
+
+# 詞彙以雜湊對應到固定的 2^20 個維度，不需要全域詞彙表，各 worker 與重建結果一致
+HASH_BITS = 20
+HASH_MASK = (1 << HASH_BITS) - 1
+# 每篇筆記只保留出現次數最多的詞，向量大小有上限
+MAX_TERMS = 200
+# 標題與標籤比內文更能代表主題，計數時加權
+TITLE_WEIGHT = 2
+TAG_WEIGHT = 3
+# 出現在超過這個比例筆記中的詞（類似停用詞）不參與評分
+MAX_DF_RATIO = 0.5
+DF_PRUNE_MIN_NOTES = 1000
+
+
+def tokenize(text):
+    """英數字以單字為詞，中文以相鄰兩字（bigram）為詞，保留重複以計算詞頻"""
+    tokens = []
+    for word in WORD_RE.findall((text or '').lower()):
+        if CJK_RE.match(word):
+            tokens.extend(map(operator.add, word, word[1:]) if len(word) > 1 else (word,))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def term_id(token):
+    return zlib.crc32(token.encode('utf-8')) & HASH_MASK
+
+
+def term_counts(title, content, tag_names=()):
+    """筆記的詞頻 {詞 id: 加權次數}"""
+    counts = {}
+    for tokens, weight in ((tokenize(title), TITLE_WEIGHT), (tokenize(content), 1),
+                           (['#' + name.lower() for name in tag_names], TAG_WEIGHT)):
+        # 先合併重複的詞再雜湊，每個不同的詞只計算一次
+        for token, count in Counter(tokens).items():
+            key = term_id(token)
+            counts[key] = counts.get(key, 0) + count * weight
+    if len(counts) > MAX_TERMS:
+        counts = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:MAX_TERMS])
+    return counts
+
+
+def pack_vector(counts):
+    """壓縮儲存：詞 id 排序後存差值（uint32），次數存 uint16，再以 zlib 壓縮"""
+    terms = sorted(counts)
+    deltas = np.array(terms, dtype='<u4')
+    deltas[1:] -= deltas[:-1].copy()
+    values = np.array([min(counts[term], 0xFFFF) for term in terms], dtype='<u2')
+    return zlib.compress(deltas.tobytes() + values.tobytes())
+
+
+def unpack_vector(data):
+    """返回 (詞 id, 次數) 兩個陣列"""
+    raw = zlib.decompress(data)
+    size = len(raw) // 6
+    terms = np.cumsum(np.frombuffer(raw, dtype='<u4', count=size), dtype=np.uint32)
+    values = np.frombuffer(raw, dtype='<u2', count=size, offset=size * 4)
+    return terms.astype(np.int32), values.astype(np.float32)
+
+
+class TermIndex:
+    """TF-IDF 反向索引：依詞排序的 (列, 權重) 清單，權重已除以該列的向量長度
+
+    由各列的 (詞 id, 次數) 建立；查詢時只取出查詢詞的清單，
+    以 np.bincount 一次累加所有列的內積（餘弦相似度）。
+    """
+
+    def __init__(self, keys, rows):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.row_of = {key: row for row, key in enumerate(self.keys.tolist())}
+        self.size = len(self.keys)
+        lengths = np.fromiter((len(terms) for terms, _ in rows), dtype=np.int64, count=self.size)
+        row_ids = np.repeat(np.arange(self.size, dtype=np.int32), lengths)
+        terms = np.concatenate([terms for terms, _ in rows]) if self.size else np.empty(0, dtype=np.int32)
+        counts = np.concatenate([counts for _, counts in rows]) if self.size else np.empty(0, dtype=np.float32)
+
+        # 依詞排序一次，同時得到詞彙、文件頻率與反向索引的順序（同一詞內維持列的順序）
+        order = np.argsort(terms, kind='stable')
+        sorted_terms = terms[order]
+        first = np.ones(len(terms), dtype=bool)
+        first[1:] = sorted_terms[1:] != sorted_terms[:-1]
+        starts = np.flatnonzero(first)
+        self.vocabulary = sorted_terms[starts]
+        df = np.diff(np.append(starts, len(terms)))
+        sorted_inverse = np.cumsum(first) - 1
+        inverse = np.empty(len(terms), dtype=np.int64)
+        inverse[order] = sorted_inverse
+
+        # idf = ln((1 + N) / (1 + df)) + 1
+        self.idf = (np.log((1 + self.size) / (1 + df)) + 1).astype(np.float32)
+        # 次數取對數（sublinear tf），每列除以向量長度
+        weights = (1 + np.log(counts)) * self.idf[inverse]
+        norms = np.sqrt(np.bincount(row_ids, weights=weights * weights, minlength=self.size))
+        weights = (weights / np.where(norms > 0, norms, 1)[row_ids]).astype(np.float32)
+
+        # 筆記夠多時，太常見的詞不建立清單
+        indexed = np.ones(len(df), dtype=bool)
+        if self.size >= DF_PRUNE_MIN_NOTES:
+            indexed = df <= MAX_DF_RATIO * self.size
+        keep = indexed[sorted_inverse]
+        self.post_rows = row_ids[order][keep]
+        self.post_weights = weights[order][keep]
+        self.terms = self.vocabulary[indexed]
+        self.term_ptr = np.append(0, np.cumsum(df[indexed])).astype(np.int64)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.post_rows, self.post_weights, self.terms, self.term_ptr,
+                                              self.vocabulary, self.idf, self.keys))
+
+    def weigh(self, terms, counts):
+        """以索引的 idf 計算查詢向量（已正規化）；索引中沒有的詞視為 df = 0"""
+        idf = np.full(len(terms), math.log(1 + self.size) + 1, dtype=np.float32)
+        if len(self.vocabulary):
+            positions = np.minimum(np.searchsorted(self.vocabulary, terms), len(self.vocabulary) - 1)
+            known = self.vocabulary[positions] == terms
+            idf[known] = self.idf[positions[known]]
+        weights = (1 + np.log(counts)) * idf
+        norm = np.sqrt((weights * weights).sum())
+        return weights / norm if norm > 0 else weights
+
+    def scores(self, terms, weights):
+        """所有列與查詢向量的餘弦相似度"""
+        positions = np.searchsorted(self.terms, terms)
+        found = positions < len(self.terms)
+        found[found] = self.terms[positions[found]] == terms[found]
+        starts, ends = self.term_ptr[positions[found]], self.term_ptr[positions[found] + 1]
+        if not len(starts):
+            return np.zeros(self.size, dtype=np.float32)
+        lengths = ends - starts
+        # 將各查詢詞的清單區段攤平成一個索引陣列，一次完成累加
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        contributions = self.post_weights[offsets] * np.repeat(weights[found].astype(np.float32), lengths)
+        return np.bincount(self.post_rows[offsets], weights=contributions, minlength=self.size)
+
+    def top(self, terms, counts, k, exclude=None):
+        """返回 [(key, 分數)]，依相似度由高到低，不含分數為 0 與 exclude"""
+        if not len(self.terms) or not len(terms):
+            return []
+        scores = self.scores(terms, self.weigh(terms, counts))
+        if exclude is not None and exclude in self.row_of:
+            scores[self.row_of[exclude]] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.keys[row]), round(float(scores[row]), 4)) for row in candidates]
@@ -0,0 +1,19 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import time
+from src.main import app, init_database
+from src.services.jobs import job_queue
+
+if __name__ == '__main__':
+    # 獨立的背景工作行程：python src/worker.py [執行緒數]
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else app.config['JOBS_WORKER_THREADS']
+    init_database()
+    job_queue.start(threads)
+    print(f"背景工作行程已啟動（{threads} 個執行緒）")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        job_queue.stop()
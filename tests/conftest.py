@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA_DIR = tempfile.mkdtemp(prefix='fintentacle-tests-')
+# 以版本庫中的舊版資料庫副本啟動，每次測試都會經過完整的結構升級與回填
+LEGACY_DATABASE = os.path.join(ROOT, 'src', 'database', 'app.db')
+shutil.copy(LEGACY_DATABASE, os.path.join(DATA_DIR, 'app.db'))
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DATA_DIR, 'app.db')}"
+
+
+@pytest.fixture(scope='session')
+def app():
+    from src.main import app, init_database
+    from src.services.price_store import price_store
+    from src.utils.cache import cache
+    from src.utils.rate_limit import limiter
+
+    app.config.update(
+        TESTING=True,
+        RATELIMIT_ENABLED=False,
+        RATELIMIT_STORAGE_PATH=os.path.join(DATA_DIR, 'ratelimit.db'),
+        CACHE_STORAGE_PATH=os.path.join(DATA_DIR, 'cache.db'),
+        PRICE_STORE_PATH=os.path.join(DATA_DIR, 'prices'),
+    )
+    limiter.init_app(app)
+    cache.init_app(app)
+    price_store.init_app(app)
+    init_database()
+    yield app
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def make_client(app):
+    """註冊並登入一個新用戶，返回 (test client, user_id)"""
+    from src.models.user import User, db
+
+    def create(prefix='user', is_admin=False):
+        name = f'{prefix}_{uuid.uuid4().hex[:10]}'
+        client = app.test_client()
+        client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                 'password': 'password123'})
+        with app.app_context():
+            user = User.query.filter_by(username=name).one()
+            if is_admin:
+                user.is_admin = True
+                db.session.commit()
+            user_id = user.id
+        client.post('/api/auth/login', json={'username': name, 'password': 'password123'})
+        return client, user_id
+
+    return create
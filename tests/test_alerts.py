@@ -0,0 +1,19 @@
+from src.models.job import Job
+from src.services.alerts import alert_engine
+
+CSV = b'date,open,high,low,close,volume\n2024-01-02,10,11,9,10.5,100\n'
+
+
+def test_price_import_does_not_evaluate_alerts_in_request(app, make_client, monkeypatch):
+    client, _ = make_client('prices', is_admin=True)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('alert engine unavailable')
+
+    monkeypatch.setattr(alert_engine, 'evaluate', fail)
+    response = client.post('/api/prices/ALRT/import', data=CSV)
+    assert response.status_code == 200
+    assert response.get_json()['loaded'] == 1
+    with app.app_context():
+        job = Job.query.filter_by(kind='evaluate_alerts').order_by(Job.id.desc()).first()
+        assert job.get_payload() == {'ticks': [['ALRT', None, 10.5]]}
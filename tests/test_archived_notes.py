@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+NOTE_COUNT = 5
+
+
+@contextmanager
+def _archive_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        # 載入封存列的查詢（不含搜尋條件裡的子查詢）
+        if statement.startswith('SELECT note_archive.'):
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def archived_client(app, make_client):
+    from src.models.note import Note
+    from src.models.user import db
+    from src.services.archiver import archive_batch
+    from src.utils.sharding import shard_router
+
+    client, user_id = make_client('archive')
+    for i in range(NOTE_COUNT):
+        response = client.post('/api/notes/', json={'title': f'冷筆記 {i}', 'content': f'封存內容 {i}',
+                                                    'stock_symbol': 'ARCH'})
+        assert response.status_code == 201
+    with app.app_context(), shard_router.for_user(user_id):
+        Note.query.filter_by(user_id=user_id).update({'linked_at': datetime.utcnow()})
+        db.session.commit()
+        archive_batch(datetime.utcnow() + timedelta(minutes=1), batch_size=10 ** 6)
+        assert Note.query.filter(Note.user_id == user_id, Note.archived_at.isnot(None)).count() == NOTE_COUNT
+    return client
+
+
+@pytest.mark.parametrize('url, key', [
+    ('/api/notes/', 'notes'),
+    ('/api/notes/search?q=冷筆記', 'notes'),
+    ('/api/notes/changes', 'changes'),
+    ('/api/notes/recent', None),
+    ('/api/notes/symbols/ARCH/feed', 'items'),
+])
+def test_archived_content_is_batch_loaded(archived_client, url, key):
+    with _archive_queries() as statements:
+        response = archived_client.get(url)
+    assert response.status_code == 200
+    data = response.get_json()
+    items = [item.get('item', item) for item in (data[key] if key else data)]
+    assert sorted(item['content'] for item in items) == [f'封存內容 {i}' for i in range(NOTE_COUNT)]
+    assert len(statements) == 1
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from src.utils.bitmap import ARRAY_MAX, Bitmap
+
+
+def _ids(seed):
+    rng = np.random.default_rng(seed)
+    # 稀疏的桶用陣列，第二個桶超過 ARRAY_MAX 筆會改用位元集
+    sparse = rng.integers(0, 1 << 16, 300)
+    dense = (1 << 16) + rng.choice(1 << 16, ARRAY_MAX * 2, replace=False)
+    far = rng.integers(1 << 30, (1 << 30) + 1000, 50)
+    return np.concatenate([sparse, dense, far, sparse[:10]]).tolist()
+
+
+@pytest.fixture(params=[(1, 2), (3, 3), (4, 5)])
+def pair(request):
+    a, b = (_ids(seed) for seed in request.param)
+    return a, b
+
+
+def test_from_ids_sorts_and_deduplicates():
+    ids = _ids(0)
+    bitmap = Bitmap.from_ids(ids)
+    assert bitmap.to_array().tolist() == sorted(set(ids))
+    assert len(bitmap) == len(set(ids))
+    assert not Bitmap.from_ids([])
+    assert Bitmap.from_ids([]).to_array().dtype == np.int64
+
+
+@pytest.mark.parametrize('operation', ['__and__', '__or__', '__sub__'])
+def test_set_operations_match_python_sets(pair, operation):
+    a, b = pair
+    result = getattr(Bitmap.from_ids(a), operation)(Bitmap.from_ids(b))
+    assert list(result) == sorted(getattr(set(a), operation)(set(b)))
+
+
+def test_operations_do_not_share_containers(pair):
+    a, b = pair
+    left, right = Bitmap.from_ids(a), Bitmap.from_ids(b)
+    union = left | right
+    union.add(1 << 40)
+    for value in a[:20]:
+        union.discard(value)
+    assert list(left) == sorted(set(a))
+    assert list(right) == sorted(set(b))
+
+
+def test_add_discard_and_contains_across_container_formats():
+    bitmap = Bitmap.from_ids(range(ARRAY_MAX))
+    bitmap.add(ARRAY_MAX)
+    assert bitmap.nbytes == 1 << 13
+    assert ARRAY_MAX in bitmap and ARRAY_MAX + 1 not in bitmap
+
+    bitmap.discard(0)
+    bitmap.discard(1)
+    assert bitmap.nbytes == (ARRAY_MAX - 1) * 2
+    assert 0 not in bitmap and 2 in bitmap
+
+    for value in range(2, ARRAY_MAX + 1):
+        bitmap.discard(value)
+    assert not bitmap and len(bitmap) == 0
+
+
+def test_discard_many_matches_python_sets(pair):
+    a, b = pair
+    bitmap = Bitmap.from_ids(a)
+    bitmap.discard_many(b)
+    assert list(bitmap) == sorted(set(a) - set(b))
+    bitmap.discard_many(a)
+    assert not bitmap and bitmap.nbytes == 0
@@ -0,0 +1,44 @@
+from flask import Flask
+
+from src.utils.cache import TieredCache
+
+
+def _app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', CACHE_STORAGE_PATH=str(tmp_path / 'cache.db'))
+    return app, TieredCache(app)
+
+
+def test_response_computed_across_an_invalidation_is_not_cached(tmp_path):
+    app, cache = _app(tmp_path)
+    calls = []
+
+    @app.route('/prices/<symbol>')
+    @cache.cached(ttl=300, tags=lambda symbol: (f'prices:{symbol}',))
+    def prices(symbol):
+        calls.append(symbol)
+        if len(calls) == 1:
+            # 讀取舊資料後、寫入快取前，另一個請求匯入了新價格
+            cache.invalidate(tags=f'prices:{symbol}')
+        return {'version': len(calls)}
+
+    client = app.test_client()
+    assert client.get('/prices/AAPL').get_json() == {'version': 1}
+    response = client.get('/prices/AAPL')
+    assert response.headers['X-Cache'] == 'MISS' and response.get_json() == {'version': 2}
+    response = client.get('/prices/AAPL')
+    assert response.headers['X-Cache'] == 'HIT' and response.get_json() == {'version': 2}
+
+
+def test_unrelated_invalidation_does_not_block_caching(tmp_path):
+    app, cache = _app(tmp_path)
+    with app.app_context():
+        since = cache.invalidation_marker()
+        cache.invalidate(tags='prices:MSFT')
+        cache.set('a', 1, tags=('prices:AAPL',), since=since)
+        assert cache.store.get('a') is not None
+
+        since = cache.invalidation_marker()
+        cache.clear()
+        cache.set('b', 2, since=since)
+        assert cache.get('b') is None
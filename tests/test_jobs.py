@@ -0,0 +1,45 @@
+import time
+from datetime import datetime
+
+from src.models.job import Job
+from src.models.user import db
+from src.services.jobs import job_handler, recover_stale_jobs, run_job
+
+
+@job_handler('test_slow_step')
+def slow_step(ctx):
+    # 單一步驟超過逾時門檻且沒有回報進度
+    time.sleep(0.5)
+    return recover_stale_jobs(0.3)
+
+
+@job_handler('test_taken_over')
+def taken_over(ctx):
+    # 模擬工作在執行中被回收並由其他 worker 取走
+    Job.query.filter(Job.id == ctx.job.id).update({'locked_by': 'other-worker'})
+    db.session.commit()
+    return 'done'
+
+
+def running_job(kind):
+    job = Job(kind=kind, status='running', locked_by='test-worker', attempts=1,
+              started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_heartbeat_keeps_long_step_from_being_recovered(app):
+    with app.app_context():
+        job = run_job(running_job('test_slow_step'), heartbeat_interval=0.1)
+        assert job.status == 'succeeded'
+        assert job.result == '0'
+
+
+def test_final_status_requires_ownership(app):
+    with app.app_context():
+        job = run_job(running_job('test_taken_over'), heartbeat_interval=0.1)
+        assert job.status == 'running'
+        assert job.locked_by == 'other-worker'
+        job.status = 'cancelled'
+        db.session.commit()
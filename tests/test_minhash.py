@@ -0,0 +1,34 @@
+from src.utils.minhash import BAND_COUNT, NUM_PERM, band_keys, features, jaccard, signature
+
+ARTICLE = ('Taiwan Semiconductor reported record quarterly revenue on strong demand for advanced chips, '
+           'beating analyst estimates as AI server orders continued to climb.')
+
+
+def test_features_use_words_and_cjk_bigrams():
+    assert features('TSMC 台積電') == {'tsmc', '台積', '積電'}
+    assert features('台') == {'台'}
+    assert features('') == set()
+
+
+def test_signature_is_deterministic():
+    tokens = features(ARTICLE)
+    assert len(signature(tokens)) == NUM_PERM
+    assert signature(tokens) == signature(set(tokens))
+    assert signature(set()) == [] and band_keys(set()) == []
+
+
+def test_identical_texts_share_every_band():
+    keys = band_keys(features(ARTICLE))
+    assert len(keys) == BAND_COUNT
+    assert keys == band_keys(features(ARTICLE.upper()))
+    assert all(-(1 << 63) <= key < (1 << 63) for key in keys)
+
+
+def test_near_duplicates_share_a_band_and_unrelated_texts_do_not():
+    edited = ARTICLE.replace('record', 'all-time high') + ' Shares rose 3%.'
+    unrelated = 'The central bank held interest rates steady and signalled no change to its inflation outlook.'
+    original = features(ARTICLE)
+    assert jaccard(original, features(edited)) >= 0.5
+    assert set(band_keys(original)) & set(band_keys(features(edited)))
+    assert jaccard(original, features(unrelated)) < 0.15
+    assert not set(band_keys(original)) & set(band_keys(features(unrelated)))
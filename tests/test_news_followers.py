@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+
+def test_followers_match_normalized_watchlist_symbols(app, make_client):
+    from src.models.schema import backfill_watchlist_symbol_keys
+    from src.models.user import db
+    from src.models.watchlist import Watchlist
+    from src.services.news_feed import followers
+    from src.utils.sharding import shard_router
+
+    _, suffixed = make_client('follow')
+    _, legacy = make_client('follow')
+    with app.app_context():
+        with shard_router.for_user(suffixed):
+            db.session.add(Watchlist(user_id=suffixed, stock_symbol=' 2330.tw ', stock_name='台積電', market='TWSE'))
+            db.session.commit()
+        with shard_router.for_user(legacy):
+            # 升級前的舊資料沒有正規化欄位
+            db.session.execute(Watchlist.__table__.insert().values(
+                user_id=legacy, stock_symbol='2330', stock_name='台積電', market='TWSE'))
+            db.session.commit()
+        backfill_watchlist_symbol_keys()
+
+        symbol = SimpleNamespace(id=1, symbol_key='2330', market_key='TWSE')
+        assert {suffixed, legacy} <= followers([symbol])[1]
+        assert not followers([SimpleNamespace(id=2, symbol_key='2330', market_key='US')])[2] & {suffixed, legacy}
+
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT user_id FROM watchlist WHERE symbol_key IN ('2330')")).all()
+        assert any('ix_watchlist_symbol_market' in row[-1] for row in plan)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from src.services.portfolio import PortfolioAnalytics
+from src.services.price_store import PriceStore
+
+
+def _bars(ts, close):
+    ts = np.asarray(ts)
+    ones = np.ones(len(ts))
+    return {'ts': ts, 'open': ones, 'high': ones, 'low': ones, 'close': np.asarray(close, dtype=np.float64)}
+
+
+def test_overlapping_watchlists_share_aligned_columns(tmp_path):
+    store = PriceStore(str(tmp_path))
+    for offset, symbol in enumerate(('AAA', 'BBB', 'CCC')):
+        store.append(symbol, _bars([1, 2, 3, 4], [10 + offset, 11, 12, 13]))
+    analytics = PortfolioAnalytics(store)
+
+    analytics.aligned_matrix([('AAA', None), ('BBB', None)])
+    _, prices, _ = analytics.aligned_matrix([('AAA', None), ('CCC', None)])
+
+    # 兩份清單的聯集日曆相同，AAA 的欄位只對齊一次
+    assert analytics.stats['columns'] == 3
+    assert prices[:, 0].tolist() == [10, 11, 12, 13]
+    assert prices[:, 1].tolist() == [12, 11, 12, 13]
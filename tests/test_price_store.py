@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+
+import numpy as np
+
+from src.services.price_store import PriceStore
+
+
+def _bars(ts, close):
+    ts = np.asarray(ts)
+    ones = np.ones(len(ts))
+    return {'ts': ts, 'open': ones, 'high': ones, 'low': ones, 'close': np.full(len(ts), float(close))}
+
+
+def test_replace_switches_whole_generation(tmp_path):
+    store = PriceStore(str(tmp_path))
+    store.append('AAPL', _bars([1, 2, 3], 1))
+    before = store.get_range('AAPL')
+
+    store.replace('AAPL', _bars([10, 11], 2))
+    store.append('AAPL', _bars([12], 2))
+
+    # 既有的視圖仍指向舊世代，新的讀取看到完整的新序列
+    assert before['close'].tolist() == [1, 1, 1]
+    assert store.get_range('AAPL')['ts'].tolist() == [10, 11, 12]
+    assert PriceStore(str(tmp_path)).get_range('AAPL')['close'].tolist() == [2, 2, 2]
+    path = store.series_path(store.series_key('AAPL'))
+    assert not [name for name in os.listdir(path) if name.endswith('.bin')]
+
+
+def _write_series(root, symbol):
+    store = PriceStore(root)
+    for ts in range(1, 11):
+        store.append(symbol, _bars([ts], ts))
+
+
+def test_concurrent_writers_keep_every_index_entry(tmp_path):
+    """不同行程寫入不同序列時，index.json 不能遺失其他行程的更新"""
+    processes = [multiprocessing.Process(target=_write_series, args=(str(tmp_path), f'S{i}')) for i in range(8)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    store = PriceStore(str(tmp_path))
+
+    assert {name: entry['count'] for name, entry in store.index().items()} == \
+        {f'US/S{i}/1d': 10 for i in range(8)}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
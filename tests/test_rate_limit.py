@@ -0,0 +1,51 @@
+import sqlite3
+
+from src.utils.rate_limit import SQLiteBucketStore
+
+
+def test_prune_drops_only_refilled_buckets(tmp_path):
+    store = SQLiteBucketStore(str(tmp_path / 'ratelimit.db'))
+    store.take('idle', capacity=5, refill_per_second=1)
+    store.take('busy', capacity=5, refill_per_second=1, cost=5)
+
+    now = store._connect().execute('SELECT MAX(updated_at) FROM rate_bucket').fetchone()[0]
+
+    # idle 一秒後補滿，busy 需要五秒
+    assert store.prune(now + 2) == 1
+    keys = [key for (key,) in store._connect().execute('SELECT key FROM rate_bucket')]
+    assert keys == ['busy']
+
+
+def test_legacy_bucket_table_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'ratelimit.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)')
+        conn.execute("INSERT INTO rate_bucket VALUES ('old', 1, 0)")
+
+    allowed, tokens, _ = SQLiteBucketStore(path).take('old', capacity=3, refill_per_second=1)
+    assert allowed and tokens == 2
+
+
+def test_ip_key_uses_forwarded_address_behind_trusted_proxy(tmp_path):
+    from flask import Flask
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    from src.utils.rate_limit import RateLimiter, ip_key
+
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', RATELIMIT_STORAGE_PATH=str(tmp_path / 'ratelimit.db'))
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    limiter = RateLimiter(app)
+
+    @app.route('/register')
+    @limiter.limit('1/hour', key_func=ip_key)
+    def register():
+        return 'ok'
+
+    client = app.test_client()
+    # 代理附加的最後一個位址才可信，用戶端自填的前段位址不影響
+    first = {'X-Forwarded-For': '203.0.113.1'}
+    assert client.get('/register', headers=first).status_code == 200
+    assert client.get('/register', headers=first).status_code == 429
+    assert client.get('/register', headers={'X-Forwarded-For': '198.51.100.7'}).status_code == 200
+    assert client.get('/register', headers={'X-Forwarded-For': '198.51.100.9, 203.0.113.1'}).status_code == 429
@@ -0,0 +1,83 @@
+import sqlite3
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from conftest import LEGACY_DATABASE
+
+
+def _legacy_users():
+    with sqlite3.connect(LEGACY_DATABASE) as conn:
+        return conn.execute('SELECT id, username, email FROM user').fetchall()
+
+
+def _infix_matches(keyword):
+    from src.models.user import db
+    from src.services.user_search import fts_phrase
+    return [row_id for (row_id,) in db.session.execute(
+        text('SELECT rowid FROM user_search WHERE user_search MATCH :phrase'), {'phrase': fts_phrase(keyword)})]
+
+
+def test_upgrade_indexes_existing_users(app):
+    from src.models.user import User, db
+
+    legacy = _legacy_users()
+    assert legacy, '版本庫中的舊版資料庫應包含用戶'
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA integrity_check')).scalar() == 'ok'
+        for user_id, username, email in legacy:
+            user = db.session.get(User, user_id)
+            assert user.username_lower == username.lower()
+            assert user.email_lower == email.lower()
+            assert user_id in _infix_matches(username.lower())
+
+
+def test_backfill_repairs_index_created_before_lowercase_columns(app):
+    """舊版升級先建立全文索引與觸發器，之後補小寫欄位時會損壞索引"""
+    from src.models.schema import USER_SEARCH_DDL, backfill_user_search, upgrade_schema
+    from src.models.user import User, db
+
+    name = f'Legacy_{uuid.uuid4().hex[:8]}'
+    with app.app_context():
+        # 模擬升級前就存在、未在索引中且小寫欄位為空的用戶
+        for trigger in ('user_search_ai', 'user_search_ad', 'user_search_au'):
+            db.session.execute(text(f'DROP TRIGGER {trigger}'))
+        user_id = db.session.execute(User.__table__.insert().values(
+            username=name, email=f'{name}@Example.com', username_lower=None, email_lower=None)).inserted_primary_key[0]
+        for statement in USER_SEARCH_DDL[1:]:
+            db.session.execute(text(statement))
+        db.session.commit()
+
+        backfill_user_search()
+        upgrade_schema()
+
+        assert db.session.execute(text('PRAGMA integrity_check')).scalar() == 'ok'
+        assert db.session.get(User, user_id).username_lower == name.lower()
+        assert user_id in _infix_matches(name.lower()[2:])
+        assert user_id in _infix_matches('example.com')
+
+
+def test_backfills_keep_note_updated_at(app, make_client):
+    """回填不算修改：舊筆記的修改時間不能被改寫成升級時間（封存依修改時間挑選）"""
+    from src.models.note import Note
+    from src.models.schema import upgrade_schema
+    from src.models.user import db
+    from src.utils.sharding import shard_router
+
+    _, user_id = make_client('legacy')
+    updated_at = datetime(2020, 2, 2)
+    with app.app_context():
+        with shard_router.for_user(user_id):
+            note_id = db.session.execute(Note.__table__.insert().values(
+                user_id=user_id, title='舊筆記', content='舊內容', stock_symbol='2330.tw',
+                created_at=updated_at, updated_at=updated_at)).inserted_primary_key[0]
+            db.session.commit()
+
+        upgrade_schema()
+
+        with shard_router.for_user(user_id):
+            note = db.session.get(Note, note_id)
+            assert (note.symbol_key, note.market_key) == ('2330', 'TWSE')
+            assert note.excerpt == '舊內容'
+            assert note.updated_at == updated_at
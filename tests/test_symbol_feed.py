@@ -0,0 +1,39 @@
+import base64
+import json
+
+import pytest
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-base64!',
+    _cursor([1, 2]),
+    _cursor({'n': 'x'}),
+    _cursor({'n': ['not a date', 1]}),
+    _cursor({'n': ['2024-01-01T00:00:00', 'x']}),
+    _cursor({'b': [None]}),
+])
+def test_bad_feed_cursor_is_rejected(make_client, cursor):
+    client, _ = make_client('feed')
+    response = client.get(f'/api/notes/symbols/FEED/feed?cursor={cursor}')
+    assert response.status_code == 400
+
+
+def test_feed_pages_through_notes(make_client):
+    client, _ = make_client('feed')
+    for i in range(5):
+        assert client.post('/api/notes/', json={'title': f'n{i}', 'content': 'x',
+                                                'stock_symbol': 'FEED'}).status_code == 201
+
+    titles, cursor = [], None
+    while True:
+        url = '/api/notes/symbols/FEED/feed?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url).get_json()
+        titles += [item['item']['title'] for item in data['items']]
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    assert titles == [f'n{i}' for i in reversed(range(5))]
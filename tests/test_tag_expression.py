@@ -0,0 +1,51 @@
+import pytest
+
+from src.services.tag_index import UserTagIndex, parse_tag_expression, tag_names
+from src.utils.bitmap import Bitmap
+
+
+@pytest.mark.parametrize('expression, tree', [
+    ('a', ('tag', 'a')),
+    ('a b', ('and', ('tag', 'a'), ('tag', 'b'))),
+    ('a OR b AND c', ('or', ('tag', 'a'), ('and', ('tag', 'b'), ('tag', 'c')))),
+    ('a and b or c', ('or', ('and', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))),
+    ('NOT a OR b', ('or', ('not', ('tag', 'a')), ('tag', 'b'))),
+    ('a NOT b', ('and', ('tag', 'a'), ('not', ('tag', 'b')))),
+    ('NOT NOT a', ('not', ('not', ('tag', 'a')))),
+    ('(a OR b) c', ('and', ('or', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))),
+    ('a OR b OR c', ('or', ('or', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))),
+    ('"長期 持有" 財報', ('and', ('tag', '長期 持有'), ('tag', '財報'))),
+])
+def test_precedence(expression, tree):
+    assert parse_tag_expression(expression) == tree
+
+
+@pytest.mark.parametrize('expression', [
+    '', '   ', 'a AND', 'OR a', 'a OR', '(a', 'a)', '()', 'NOT', '"a', '""', 'a AND OR b',
+])
+def test_malformed_expression(expression):
+    with pytest.raises(ValueError):
+        parse_tag_expression(expression)
+
+
+def test_tag_names():
+    assert tag_names(parse_tag_expression('(a OR "b c") NOT d')) == {'a', 'b c', 'd'}
+
+
+def test_evaluate_follows_precedence():
+    index = UserTagIndex()
+    index.notes = Bitmap.from_ids(range(1, 9))
+    # 筆記 1–8 依二進位位元標上 a、b、c
+    index.tags = {name: Bitmap.from_ids(n for n in range(1, 9) if n & bit)
+                  for name, bit in (('a', 1), ('b', 2), ('c', 4))}
+    tag_ids = {name: name for name in index.tags}
+
+    def select(expression):
+        return list(index.evaluate(parse_tag_expression(expression), tag_ids))
+
+    assert select('a OR b c') == [1, 3, 5, 6, 7]
+    assert select('(a OR b) c') == [5, 6, 7]
+    assert select('a NOT b') == [1, 5]
+    assert select('NOT a') == [2, 4, 6, 8]
+    assert select('NOT a OR c') == [2, 4, 5, 6, 7, 8]
+    assert select('a missing') == []
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from src.utils import text_delta
+from src.utils.text_delta import apply_delta, make_delta, pack_delta, unpack_delta
+
+
+@pytest.mark.parametrize('base, target', [
+    ('', ''),
+    ('', '新內容'),
+    ('舊內容', ''),
+    ('abc', 'abc'),
+    ('台積電 2330 營收成長', '台積電 2330 營收大幅成長'),
+    ('line 1\nline 2\nline 3\n', 'line 0\nline 1\nline 3\nline 4\n'),
+    ('aaaa', 'aa'),
+])
+def test_round_trip(base, target):
+    ops = make_delta(base, target)
+    assert apply_delta(base, ops) == target
+    assert unpack_delta(pack_delta(ops)) == ops
+
+
+def test_small_edit_copies_unchanged_text():
+    base = '前言\n' + '內容' * 2000 + '\n結尾'
+    target = base.replace('結尾', '新的結尾')
+    ops = make_delta(base, target)
+    # 共同前綴只需一個複製指令，插入的文字只有改動的部分
+    assert ops[0] == [0, base.index('結尾')]
+    assert ''.join(op for op in ops if isinstance(op, str)) == '新的'
+
+
+def test_large_middle_falls_back_to_line_diff(monkeypatch):
+    monkeypatch.setattr(text_delta, 'CHAR_DIFF_LIMIT', 100)
+    rng = random.Random(0)
+    lines = [f'第 {i} 行 {rng.random()}\n' for i in range(200)]
+    edited = lines[:50] + ['插入的一行\n'] + lines[50:120] + lines[130:]
+    edited[0], edited[-1] = 'head\n', 'tail\n'
+    base, target = ''.join(lines), ''.join(edited)
+    ops = make_delta(base, target)
+    assert apply_delta(base, ops) == target
+    # 逐行比對時只插入改動的行（共同後綴可能吃掉最後的換行）
+    assert sum(len(op) for op in ops if isinstance(op, str)) <= len('head\n插入的一行\ntail\n')
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from src.utils import tfidf
+from src.utils.tfidf import TermIndex, pack_vector, term_counts, tokenize, unpack_vector
+
+NOTES = {
+    10: ('台積電財報', '台積電營收創新高，先進製程需求強勁', ['半導體']),
+    11: ('聯電展望', '成熟製程需求回溫，營收穩定', ['半導體']),
+    12: ('央行利率', '央行維持利率不變，通膨降溫', ['總經']),
+    13: ('Apple earnings', 'iPhone revenue beat estimates', ['tech']),
+    14: ('台積電法說會', '先進製程與先進封裝需求強勁，台積電上修營收', ['半導體']),
+}
+
+
+def _rows(notes):
+    rows = []
+    for title, content, tags in notes.values():
+        terms, counts = unpack_vector(pack_vector(term_counts(title, content, tags)))
+        rows.append((terms, counts))
+    return list(notes), rows
+
+
+def _dense(index, terms, counts):
+    """以完整的詞彙向量直接計算，作為對照"""
+    vector = np.zeros(len(index.vocabulary))
+    positions = np.searchsorted(index.vocabulary, terms)
+    vector[positions] = (1 + np.log(counts)) * index.idf[positions]
+    return vector / np.linalg.norm(vector)
+
+
+def test_tokenize_and_pack_round_trip():
+    assert tokenize('TSMC 台積電 tsmc') == ['tsmc', '台積', '積電', 'tsmc']
+    counts = term_counts('台積電', '台積電 營收', ['半導體'])
+    terms, values = unpack_vector(pack_vector(counts))
+    assert dict(zip(terms.tolist(), values.tolist())) == counts
+    assert terms.tolist() == sorted(counts)
+
+
+def test_scores_match_dense_cosine_similarity():
+    keys, rows = _rows(NOTES)
+    index = TermIndex(keys, rows)
+    assert index.vocabulary.tolist() == sorted(set(np.concatenate([terms for terms, _ in rows]).tolist()))
+    dense = np.array([_dense(index, terms, counts) for terms, counts in rows])
+    for terms, counts in rows:
+        expected = dense @ _dense(index, terms, counts)
+        assert index.scores(terms, index.weigh(terms, counts)) == pytest.approx(expected, rel=1e-4, abs=1e-6)
+
+
+def test_top_ranks_related_notes_and_excludes_the_query():
+    keys, rows = _rows(NOTES)
+    index = TermIndex(keys, rows)
+    terms, counts = rows[0]
+    ranked = index.top(terms, counts, k=3, exclude=10)
+    assert [key for key, _ in ranked][:2] == [14, 11]
+    assert all(score > 0 for _, score in ranked) and 10 not in dict(ranked)
+    assert index.top(*unpack_vector(pack_vector(term_counts('無關', '', []))), k=3) == []
+    assert TermIndex([], []).top(terms, counts, k=3) == []
+
+
+def test_common_terms_are_pruned_from_postings(monkeypatch):
+    monkeypatch.setattr(tfidf, 'DF_PRUNE_MIN_NOTES', 4)
+    common = {key: (title, content + ' 共同詞', tags) for key, (title, content, tags) in NOTES.items()}
+    keys, rows = _rows(common)
+    index = TermIndex(keys, rows)
+    common_terms = np.array(sorted(term_counts('', '共同詞').keys()), dtype=np.int32)
+    assert np.isin(common_terms, index.vocabulary).all()
+    assert not np.isin(common_terms, index.terms).any()
+    assert len(index.post_rows) == index.term_ptr[-1]
@@ -0,0 +1,48 @@
+import pytest
+
+from src.services.alerts import ThresholdBook
+
+
+@pytest.fixture
+def book():
+    book = ThresholdBook()
+    for alert_id, (direction, threshold) in enumerate([
+        ('above', 100), ('above', 105), ('above', 105), ('above', 110),
+        ('below', 90), ('below', 95), ('below', 80),
+    ], start=1):
+        book.add(direction, threshold, alert_id)
+    return book
+
+
+def test_rising_price_crosses_above_thresholds_in_range(book):
+    # previous < 門檻 <= price
+    assert book.crossed(100, 105) == [(2, 'above', 105), (3, 'above', 105)]
+    assert book.crossed(105, 120) == [(4, 'above', 110)]
+    assert len(book) == 4
+
+
+def test_falling_price_crosses_below_thresholds_in_range(book):
+    # price <= 門檻 < previous
+    assert book.crossed(95, 80) == [(7, 'below', 80), (5, 'below', 90)]
+    assert book.crossed(96, 95) == [(6, 'below', 95)]
+    assert book.crossed(95, 10) == []
+
+
+def test_unchanged_or_gap_without_thresholds_crosses_nothing(book):
+    assert book.crossed(100, 100) == []
+    assert book.crossed(111, 200) == []
+    assert book.crossed(94, 91) == []
+    assert len(book) == 7
+
+
+def test_crossed_alerts_fire_once(book):
+    assert book.crossed(99, 100) == [(1, 'above', 100)]
+    assert book.crossed(90, 99) == []
+    assert book.crossed(99, 100) == []
+
+
+def test_remove(book):
+    assert book.remove('above', 105, 3)
+    assert not book.remove('above', 105, 3)
+    assert not book.remove('below', 105, 2)
+    assert book.crossed(0, 200) == [(1, 'above', 100), (2, 'above', 105), (4, 'above', 110)]
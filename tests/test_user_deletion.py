@@ -0,0 +1,58 @@
+import pytest
+
+DELETE_PATHS = ('admin', 'bulk', 'user_api')
+
+
+def _watch(app, user_id, symbol):
+    from src.models.user import db
+    from src.models.watchlist import Watchlist
+    from src.utils.sharding import shard_router
+
+    with app.app_context(), shard_router.for_user(user_id):
+        entry = Watchlist(user_id=user_id, stock_symbol=symbol, stock_name=symbol, market='US')
+        db.session.add(entry)
+        db.session.commit()
+        return entry.id
+
+
+def _add_alert(client, watchlist_id):
+    response = client.post('/api/alerts/', json={'watchlist_id': watchlist_id, 'direction': 'above',
+                                                 'threshold': 100})
+    assert response.status_code == 201
+
+
+def _delete(admin, user_id, path):
+    if path == 'admin':
+        response = admin.delete(f'/api/admin/users/{user_id}')
+    elif path == 'bulk':
+        response = admin.post('/api/admin/users/bulk-action', json={'user_ids': [user_id], 'action': 'delete'})
+    else:
+        response = admin.delete(f'/api/users/{user_id}')
+    assert response.status_code in (200, 204)
+
+
+@pytest.mark.parametrize('path', DELETE_PATHS)
+def test_deleting_user_drops_price_alerts(app, make_client, path):
+    from src.models.alert import AlertNotification, PriceAlert
+    from src.models.user import User, db
+
+    admin, _ = make_client('admin', is_admin=True)
+    client, user_id = make_client('alerts')
+    symbol = f'DEL{DELETE_PATHS.index(path)}'
+    watchlist_id = _watch(app, user_id, symbol)
+    _add_alert(client, watchlist_id)
+    # 先觸發一次，留下通知紀錄
+    admin.post('/api/alerts/ticks', json={'ticks': [{'symbol': symbol, 'market': 'US', 'price': 90}]})
+    admin.post('/api/alerts/ticks', json={'ticks': [{'symbol': symbol, 'market': 'US', 'price': 110}]})
+    _add_alert(client, watchlist_id)
+    with app.app_context():
+        assert AlertNotification.query.filter_by(user_id=user_id).count() == 1
+
+    _delete(admin, user_id, path)
+    admin.post('/api/alerts/ticks', json={'ticks': [{'symbol': symbol, 'market': 'US', 'price': 90}]})
+    admin.post('/api/alerts/ticks', json={'ticks': [{'symbol': symbol, 'market': 'US', 'price': 110}]})
+
+    with app.app_context():
+        assert db.session.get(User, user_id) is None
+        assert PriceAlert.query.filter_by(user_id=user_id).count() == 0
+        assert AlertNotification.query.filter_by(user_id=user_id).count() == 0
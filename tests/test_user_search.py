@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def admin(make_client):
+    client, _ = make_client('admin', is_admin=True)
+    return client
+
+
+def test_search_keeps_total_and_pages_by_default(admin, make_client):
+    tag = uuid.uuid4().hex[:8]
+    for _ in range(3):
+        make_client(f'find{tag}')
+    data = admin.get(f'/api/admin/users/search?q={tag}&per_page=2').get_json()
+    assert data['total'] == 3 and data['pages'] == 2
+    assert len(data['users']) == 2 and data['has_more']
+
+    # 預設模式可以翻到任意頁
+    assert admin.get(f'/api/admin/users/search?q={tag}&page=30&per_page=10').status_code == 200
+
+
+def test_capped_mode_skips_total_and_limits_depth(admin):
+    data = admin.get('/api/admin/users/search?q=find&capped=1').get_json()
+    assert 'total' not in data and 'has_more' in data
+    assert 'total' in admin.get('/api/admin/users/search?q=find&capped=1&count=1').get_json()
+    assert admin.get('/api/admin/users/search?q=find&capped=1&page=30&per_page=10').status_code == 400
+
+
+def test_short_query_matches_inside_email(app, admin):
+    from src.models.user import User, db
+
+    name = f'zz{uuid.uuid4().hex[:8]}'
+    with app.app_context():
+        user = User(username=name, email=f'{name}@qjmail.example')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    data = admin.get('/api/admin/users/search?q=qj&per_page=100').get_json()
+    assert user_id in [user['id'] for user in data['users']]
+    assert data['total'] >= 1